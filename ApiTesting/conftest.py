@@ -1,22 +1,272 @@
-import pytest
-import configparser
-
-"""
-	The aim of these fixtures are so that values from the config.ini files can be stored.
-	In order for the test functions to recognize these variables.
-	An alternative implementation is the usage global variables or pytest_configure()
-"""
-config = configparser.ConfigParser()
-config.read('config.ini')
-
-@pytest.fixture()
-def project_id():
-	#Initialize project_id for the session
-	project_id = config['keys']['project_id']
-	return project_id
-
-@pytest.fixture()
-def project_api_key():
-	#Initialize project_api_key for the session
-	project_api_key = config['keys']['project_api_key']
-	return project_api_key
\ No newline at end of file
+import os
+import contextlib
+import pytest
+import configparser
+
+from Modules.constants import TOKEN_CACHE_FILE_ENV, DEFAULT_WORKFLOW_POOL_SIZE
+from Modules.perf_report import PerfReportPlugin
+from Modules.background_jobs import BackgroundJobs, BackgroundJobsPlugin
+from Modules.credential_pool import CredentialPool, load_project_credentials, xdist_worker_number
+from Modules.payload_catalog import get_default_catalog, set_payload_validation
+
+"""
+	The aim of these fixtures are so that values from the config.ini files can be stored.
+	In order for the test functions to recognize these variables.
+	An alternative implementation is the usage global variables or pytest_configure()
+"""
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+def pytest_addoption(parser):
+	parser.addoption('--fake-up42', action='store_true', default=False,
+		help='Run the tests against the in-process fake UP42 server instead of the real API')
+	parser.addoption('--record-cassette', metavar='PATH',
+		help='Record every API request/response of the session to a JSONL cassette (gzip compressed if PATH ends with .gz)')
+	parser.addoption('--replay-cassette', metavar='PATH',
+		help='Serve every API call from a cassette recorded with --record-cassette, without network access')
+	parser.addoption('--job-events', action='store_true', default=False,
+		help='Detect job completion from status webhooks received on a local listener, polling only as a slow fallback')
+	parser.addoption('--job-events-host', default='127.0.0.1',
+		help='Interface the job event listener binds to. Against the real API, it must be reachable from UP42 as the configured webhook url')
+	parser.addoption('--job-events-port', type=int, default=0, help='Port of the job event listener, 0 picks a free port')
+	parser.addoption('--workflow-pool-size', type=int, default=DEFAULT_WORKFLOW_POOL_SIZE,
+		help='Number of blank workflows created up front and leased to the tests')
+	parser.addoption('--background-workers', type=int, default=8,
+		help='Threads running the long waits of @pytest.mark.background_job tests while the other tests execute, 0 runs them inline')
+	parser.addoption('--sweep-orphans', action='store_true', default=False,
+		help='Before the tests, delete test workflows (name prefix apitest-) left over by earlier interrupted runs')
+	parser.addoption('--skip-payload-validation', action='store_true', default=False,
+		help='Send job parameters without checking them against the block schemas first (see Modules/payload_catalog.py)')
+	group = parser.getgroup('up42-perf', 'UP42 API latency report')
+	group.addoption('--perf-report', metavar='PATH', help='Write the per-endpoint latency report of the session as json to PATH')
+	group.addoption('--perf-baseline', metavar='PATH', help='Compare endpoint p95 latencies against the json report at PATH and fail on regressions')
+	group.addoption('--perf-threshold', type=float, default=0.2, help='Allowed relative p95 increase before failing, default 0.2 (20%%)')
+	group.addoption('--perf-min-regression-ms', type=float, default=5.0, help='Ignore p95 increases smaller than this, default 5 ms')
+	group.addoption('--perf-update-baseline', action='store_true', default=False, help='Write this run\'s report to --perf-baseline instead of comparing')
+
+def pytest_configure(config):
+	#When running with pytest-xdist, let all the worker processes share one Access Token through the on-disk token cache
+	if os.environ.get('PYTEST_XDIST_WORKER') and not os.environ.get(TOKEN_CACHE_FILE_ENV):
+		cache_dir = os.path.join(str(config.rootpath), '.pytest_cache')
+		os.makedirs(cache_dir, exist_ok=True)
+		os.environ[TOKEN_CACHE_FILE_ENV] = os.path.join(cache_dir, 'up42_tokens.json')
+
+	#Collect the timings of every API call and print them as a per-endpoint table at the end of the session
+	config.pluginmanager.register(PerfReportPlugin(
+		report_path=config.getoption('--perf-report'),
+		baseline_path=config.getoption('--perf-baseline'),
+		threshold=config.getoption('--perf-threshold'),
+		min_regression_ms=config.getoption('--perf-min-regression-ms'),
+		update_baseline=config.getoption('--perf-update-baseline'),
+	), 'up42-perf-report')
+
+	#Start the long job waits first and overlap them with the other tests. Under xdist the waits run inline,
+	#since the item reporting a background result could be sent to another worker.
+	background_workers = 0 if os.environ.get('PYTEST_XDIST_WORKER') else config.getoption('--background-workers')
+	config.pluginmanager.register(BackgroundJobsPlugin(background_workers), 'up42-background-jobs')
+
+	#Reject malformed job parameters locally instead of spending a Create and Run Job round trip on them
+	set_payload_validation(not config.getoption('--skip-payload-validation'))
+
+@pytest.fixture(scope='session')
+def payload_catalog():
+	"""
+		The job parameter payloads of TestData, read once per session. get() returns a frozen payload, body() a copy to send.
+	"""
+	return get_default_catalog()
+
+@pytest.fixture(scope='session')
+def credential_pool():
+	"""
+		Every project of config.ini ([keys] and [project:NAME] sections), handed out by least recent use.
+		pytest-xdist workers start on different projects, so parallel runs spread over the projects' rate limits.
+		The usage of every project is printed at the end of the session.
+	"""
+	pool = CredentialPool(load_project_credentials(config), offset=xdist_worker_number(os.environ.get('PYTEST_XDIST_WORKER')))
+	yield pool
+	for label, usage in pool.usage().items():
+		print(f"Credential Pool: {label} - {usage['leases']} lease(s), {usage['busy_seconds']:.1f}s in use, at most {usage['max_in_flight']} at once")
+
+@pytest.fixture(scope='session')
+def project_credentials(credential_pool):
+	#The project used by this worker for the whole session, so the workflow pool and cleanup stay within one project
+	with credential_pool.lease() as credentials:
+		yield credentials
+
+@pytest.fixture(scope='session')
+def project_id(project_credentials):
+	#Initialize project_id for the session
+	project_id = project_credentials.project_id
+	return project_id
+
+@pytest.fixture(scope='session')
+def project_api_key(project_credentials):
+	#Initialize project_api_key for the session
+	project_api_key = project_credentials.project_api_key
+	return project_api_key
+
+@contextlib.contextmanager
+def _use_fake_up42_server(**kwargs):
+	#Imported here so that the unit tests do not need the client dependencies
+	from Modules.fake_up42_server import FakeUP42Server
+	from Modules.job_poller import BackoffPolicy, JobPoller, set_default_poller
+	from Modules.token_cache import TokenCache
+	from Modules.up42_client import UP42Client, set_default_client
+
+	with FakeUP42Server(**kwargs) as server:
+		#Own token cache, so tokens of the fake server never mix with real ones
+		client = UP42Client(base_url=server.base_url, token_cache=TokenCache())
+		previous_client = set_default_client(client)
+		#Fake jobs finish in milliseconds, so poll much more often than against the real API
+		previous_poller = set_default_poller(JobPoller(policy=BackoffPolicy(min_delay=0.01, max_delay=0.1)))
+		try:
+			yield server
+		finally:
+			set_default_poller(previous_poller)
+			set_default_client(previous_client)
+			client.close()
+
+@contextlib.contextmanager
+def _use_cassette(path, mode):
+	from Modules.cassette import install_cassette, uninstall_cassette
+	from Modules.job_poller import BackoffPolicy, JobPoller, set_default_poller
+	from Modules.token_cache import TokenCache
+	from Modules.up42_client import UP42Client, get_default_client, set_default_client
+
+	if mode == 'record':
+		#Record whatever the current client talks to (the real API, or the fake server with --fake-up42)
+		client = get_default_client()
+		adapter = install_cassette(client, path, mode)
+		try:
+			yield
+		finally:
+			uninstall_cassette(client, adapter)
+		return
+
+	client = UP42Client(token_cache=TokenCache())
+	install_cassette(client, path, mode)
+	previous_client = set_default_client(client)
+	#Replayed jobs move to their next recorded status on every check, so there is no point in waiting between checks
+	previous_poller = set_default_poller(JobPoller(policy=BackoffPolicy(min_delay=0, max_delay=0)))
+	try:
+		yield
+	finally:
+		set_default_poller(previous_poller)
+		set_default_client(previous_client)
+		client.close()
+
+@contextlib.contextmanager
+def _use_job_events(host, port, server=None):
+	from Modules.job_events import EventJobPoller, JobEventListener
+	from Modules.job_poller import set_default_poller
+
+	with JobEventListener(host, port) as listener:
+		if server is not None:
+			server.webhook_url = listener.url
+		previous_poller = set_default_poller(EventJobPoller(listener))
+		try:
+			yield listener
+		finally:
+			set_default_poller(previous_poller)
+			if server is not None:
+				server.webhook_url = None
+
+@pytest.fixture(scope='session', autouse=True)
+def up42_backend(request):
+	"""
+		With --fake-up42, points every api_helper call at a fake UP42 server for the whole session.
+		With --record-cassette or --replay-cassette, records the session's API traffic or replays it without network access.
+		With --job-events, job waits end on status webhooks (sent by the fake server when it is used), with polling as a slow fallback.
+		Yields the fake server, or None when running against the real API.
+	"""
+	record_path = request.config.getoption('--record-cassette')
+	replay_path = request.config.getoption('--replay-cassette')
+	with contextlib.ExitStack() as stack:
+		server = None
+		if request.config.getoption('--fake-up42'):
+			server = stack.enter_context(_use_fake_up42_server())
+		if record_path:
+			stack.enter_context(_use_cassette(record_path, 'record'))
+		elif replay_path:
+			stack.enter_context(_use_cassette(replay_path, 'replay'))
+		if request.config.getoption('--job-events'):
+			stack.enter_context(_use_job_events(request.config.getoption('--job-events-host'), request.config.getoption('--job-events-port'), server))
+		yield server
+
+@pytest.fixture()
+def fake_up42_server(request):
+	"""
+		Points the api_helper calls at a fresh fake UP42 server for a single test.
+		The test can tune the server (job_timeline, latency, error_rates) before making calls.
+		The client is replaced process-wide, so the background work still talking to the session's backend is waited for first.
+	"""
+	request.config.pluginmanager.get_plugin('up42-background-jobs').wait()
+	with _use_fake_up42_server() as server:
+		yield server
+
+@pytest.fixture(scope='session')
+def workflow_pool(request, up42_backend, project_id, project_api_key):
+	"""
+		Session-wide pool of blank workflows, created in parallel on first use and deleted at the end of the session
+	"""
+	from Modules.workflow_pool import WorkflowPool
+
+	pool = WorkflowPool(project_id, project_api_key, size=request.config.getoption('--workflow-pool-size'))
+	pool.fill()
+	yield pool
+	pool.close()
+
+@pytest.fixture()
+def leased_workflow(request, workflow_pool):
+	"""
+		Id of a blank workflow leased from the pool for one test. It is reset and returned to the pool afterwards.
+		For a background_job test, it is only returned once the background work is done with it.
+	"""
+	if request.node.get_closest_marker('background_job'):
+		background = request.getfixturevalue('background')
+		workflow_id = workflow_pool.acquire()
+		background.add_finalizer(lambda: workflow_pool.release(workflow_id))
+		yield workflow_id
+		return
+	with workflow_pool.lease() as workflow_id:
+		yield workflow_id
+
+@pytest.fixture()
+def background(request):
+	"""
+		Runs the long wait of a @pytest.mark.background_job test in the background, see Modules/background_jobs.py.
+		Its outcome is reported by the test's [background] item at the end of the session.
+	"""
+	handle = BackgroundJobs(request.config.pluginmanager.get_plugin('up42-background-jobs'), request.node.nodeid)
+	yield handle
+	handle.close()
+
+@pytest.fixture(scope='session')
+def cleanup_queue(up42_backend):
+	"""
+		Session-wide background queue deleting the workflows created by the tests.
+		It is drained at the end of the session, so every queued deletion is sent before the run exits.
+	"""
+	from Modules.cleanup import DeferredCleanupQueue
+
+	queue = DeferredCleanupQueue()
+	yield queue
+	queue.close()
+	for workflow_id, error in queue.failures:
+		print(f"Cleanup: Failed to delete workflow {workflow_id} - {error}")
+
+@pytest.fixture(scope='session', autouse=True)
+def orphan_sweeper(request):
+	"""
+		With --sweep-orphans, deletes the test workflows left over by earlier interrupted runs before any test starts.
+		The project credentials are only leased then, so the unit tests do not depend on them.
+	"""
+	if request.config.getoption('--sweep-orphans'):
+		from Modules.api_helper import get_access_token
+		from Modules.cleanup import sweep_orphan_workflows
+
+		request.getfixturevalue('up42_backend')
+		project_id, project_api_key = request.getfixturevalue('project_id'), request.getfixturevalue('project_api_key')
+		deleted = sweep_orphan_workflows(get_access_token(project_id, project_api_key), project_id)
+		print(f"Sweep Orphan Workflows: Deleted {len(deleted)} workflow(s)")
+	yield
@@ -0,0 +1,80 @@
+import json
+from datetime import timedelta
+
+"""
+	Test doubles shared by the unit tests: a manual clock, a response object and scripted call sequences.
+	Tests that need a real HTTP server use the fake UP42 server instead (see the fake_up42_server fixture).
+"""
+
+class FakeClock:
+	"""
+	Manual monotonic clock. sleep() advances it instead of waiting, and keeps the requested delays in sleeps.
+	"""
+	def __init__(self, now=0.0):
+		self.now = now
+		self.sleeps = []
+
+	def __call__(self):
+		return self.now
+
+	def sleep(self, seconds):
+		self.sleeps.append(seconds)
+		self.now += seconds
+
+class FakeResponse:
+	"""
+	Stand-in for requests.Response
+		Parameters:
+			status_code (int): Http status
+			body: Response body, bytes as they are, str utf-8 encoded, anything else json encoded
+			headers (dict): Response headers
+			drop_after (int): Offset after which iter_content raises a ConnectionError, None to stream the whole body
+	"""
+	def __init__(self, status_code=200, body=b'', headers=None, drop_after=None):
+		if isinstance(body, str):
+			body = body.encode()
+		elif not isinstance(body, bytes):
+			body = json.dumps(body).encode()
+		self.status_code = status_code
+		self.content = body
+		self.headers = headers or {}
+		self.drop_after = drop_after
+		self.elapsed = timedelta(0)
+		self.closed = False
+
+	@property
+	def text(self):
+		return self.content.decode('utf-8', errors='replace')
+
+	def json(self):
+		return json.loads(self.content)
+
+	def iter_content(self, chunk_size):
+		for offset in range(0, len(self.content), chunk_size):
+			if self.drop_after is not None and offset >= self.drop_after:
+				raise ConnectionError('Connection broken')
+			yield self.content[offset:offset + chunk_size]
+
+	def close(self):
+		self.closed = True
+
+def api_response(status_code=200, data=None, error=None, headers=None):
+	"""
+	Returns a FakeResponse with a UP42 shaped body, {"data": ..., "error": ...}
+	"""
+	return FakeResponse(status_code, {'data': data, 'error': error}, headers)
+
+def scripted(outcomes):
+	"""
+	Returns a function answering every call with the next outcome, repeating the last one.
+	Exceptions are raised instead of returned. The arguments of every call are kept in fn.calls.
+	"""
+	calls = []
+	def fn(*args):
+		calls.append(args)
+		outcome = outcomes[min(len(calls), len(outcomes)) - 1]
+		if isinstance(outcome, BaseException):
+			raise outcome
+		return outcome
+	fn.calls = calls
+	return fn
@@ -1,282 +1,235 @@
-import pytest
-import sys
-import asyncio
-
-from Modules.api_helper import *
-from Modules.api_objects import *
-from Modules.utility import *
-from Modules.constants import *
-
-#Note: Currently all the API tests are in one file. Obviously when testing gets larger, we want to compartmentalize them into separate files.
-
-def test_delete_workflow_should_not_exist(project_id, project_api_key):
-	"""
-		This test aims to verify that calling the Delete Workflow endpoint
-		with valid parameters should successfully delete it from the system.
-		Use Get Specific Workflow to check it no longer exists.
-		-Create Workflow
-		-Delete Workflow
-		-Check if Workflow exists and Verify
-		-Cleanup/Delete Workflow
-	"""	
-	access_token = get_access_token(project_id, project_api_key)
-
-	#Initialize workflow info
-	workflow_name = generate_random_alphanumeric(5)
-	workflow_desc = generate_random_alphanumeric(5)
-	workflow_id = ''
-
-	try:
-		#Create a workflow
-		res = create_workflow(access_token, project_id, workflow_name, workflow_desc)
-		assert res.status_code == 200, f"Create Workflow: Failure with status {res.status_code}"
-		workflow_id = res.json()['data']['id']
-		assert len(workflow_id) > 0, "No workflow id returned!"
-
-		#Now, delete the workflow
-		res = delete_workflow(access_token, project_id, workflow_id)
-		assert res.status_code == 204, f"Delete Workflow: Failure with status {res.status_code}"
-
-		#Finally, check Get Specific Workflow
-		res = get_specific_workflow(access_token, project_id, workflow_id)
-		assert res.status_code == 404, f"Get Specific Workflow: Unexpected status code of {res.status_code}"
-
-	finally:
-		#No matter if fail or succeed, attempts clean up by deleting the workflow
-		res = delete_workflow(access_token, project_id, workflow_id)
-
-def test_delete_workflow_twice(project_id, project_api_key):
-	"""
-		This test aims to verify that calling the Delete Workflow endpoint
-		with valid parameters should successfully delete it from the system.
-		Use Get Specific Workflow to check it no longer exists.
-		-Create Workflow
-		-Delete Workflow
-		-Check if Workflow exists and Verify
-		-Cleanup/Delete Workflow
-	"""	
-	access_token = get_access_token(project_id, project_api_key)
-
-	#Initialize workflow info
-	workflow_name = generate_random_alphanumeric(5)
-	workflow_desc = generate_random_alphanumeric(5)
-	workflow_id = ''
-
-	try:
-		#Create a workflow
-		res = create_workflow(access_token, project_id, workflow_name, workflow_desc)
-		assert res.status_code == 200, f"Create Workflow: Failure with status {res.status_code}"
-		workflow_id = res.json()['data']['id']
-		assert len(workflow_id) > 0, "No workflow id returned!"
-
-		#Now, delete the workflow
-		res = delete_workflow(access_token, project_id, workflow_id)
-		assert res.status_code == 204, f"Delete Workflow: Unexpected status of {res.status_code}"
-
-		#Try to delete the workflow one more time
-		res = delete_workflow(access_token, project_id, workflow_id)
-		assert res.status_code == 404, f"Delete Non-Existing Workflow: Unexpected status of {res.status_code}"
-
-	finally:
-		#No matter if fail or succeed, attempts clean up by deleting the workflow
-		res = delete_workflow(access_token, project_id, workflow_id)
-
-def test_add_modis_and_sharpening_tasks_to_workflow_valid(project_id, project_api_key):
-	"""
-		This test aims to verify the successful response when adding
-		valid MODIS and Sharpening tasks to an existing workflow
-		-Create Workflow
-		-Add Tasks and Verify
-		-Cleanup/Delete Workflow
-	"""
-	access_token = get_access_token(project_id, project_api_key)
-
-	#Construct the request body based on Modis and Sharpening tasks
-	task1 = WorkflowTaskRequest('nasa-modis:1', None, NASA_MODIS_BLOCK_ID)
-	task2 = WorkflowTaskRequest('sharpening:1', 'nasa-modis:1', SHARPENING_FILTER_BLOCK_ID)
-	js1 = json.dumps(task1.__dict__)
-	js2 = json.dumps(task2.__dict__)
-	task_request_body = json.dumps([task1.__dict__, task2.__dict__])
-	
-	#Initialize workflow info
-	workflow_name = generate_random_alphanumeric(5)
-	workflow_desc = generate_random_alphanumeric(5)
-	workflow_id = ''
-
-	try:
-		#Create a workflow
-		res = create_workflow(access_token, project_id, workflow_name, workflow_desc)
-		assert res.status_code == 200, f"Create Workflow: Failure with status {res.status_code}"
-
-		#Verify workflow id is returned
-		workflow_id = res.json()['data']['id']
-		assert len(workflow_id) > 0, "No workflow id returned!"
-
-		#Now Add Tasks to Workflow and verify 
-		res = add_tasks_to_workflow(access_token, project_id, workflow_id, task_request_body)
-		assert res.status_code == 200, f"Add Tasks: Unexpected status code of {res.status_code}"
-
-	finally:
-		#No matter if fail or succeed, attempts clean up by deleting the workflow
-		res = delete_workflow(access_token, project_id, workflow_id)
-
-def test_add_modis_and_sharpening_tasks_to_workflow_invalid_parentid(project_id, project_api_key):
-	"""
-		This test aims to verify the 400 Bad Request response when adding
-		MODIS and invalid Sharpening tasks parentid to an existing workflow
-		-Create Workflow
-		-Add Invalid Tasks and Verify Status Code
-		-Cleanup/Delete Workflow
-	"""
-	access_token = get_access_token(project_id, project_api_key)
-
-	#Construct the request body based on Modis and Sharpening tasks
-	task1 = WorkflowTaskRequest('nasa-modis:1', None, NASA_MODIS_BLOCK_ID)
-	#Set the parentId to NULL for the sharpening
-	task2 = WorkflowTaskRequest('sharpening:1', None, SHARPENING_FILTER_BLOCK_ID)
-	js1 = json.dumps(task1.__dict__)
-	js2 = json.dumps(task2.__dict__)
-	task_request_body = json.dumps([task1.__dict__, task2.__dict__])
-	
-	#Initialize workflow info
-	workflow_name = generate_random_alphanumeric(5)
-	workflow_desc = generate_random_alphanumeric(5)
-	workflow_id = ''
-
-	try:
-		#Create a workflow
-		res = create_workflow(access_token, project_id, workflow_name, workflow_desc)
-		assert res.status_code == 200, f"Create Workflow: Failure with status {res.status_code}"
-
-		#Verify workflow id is returned
-		workflow_id = res.json()['data']['id']
-		assert len(workflow_id) > 0, "No workflow id returned!"
-
-		#Now Add Invalid Task to Workflow and verify 
-		res = add_tasks_to_workflow(access_token, project_id, workflow_id, task_request_body)
-		assert res.status_code == 400, f"Add Invalid Tasks: Unexpected status code of {res.status_code}"
-
-	finally:
-		#No matter if fail or succeed, attempts clean up by deleting the workflow
-		res = delete_workflow(access_token, project_id, workflow_id)
-
-def test_create_and_run_modis_sharpening_job_invalid_schema(project_id, project_api_key):
-	"""
-		This test aims to verify creating and running the MODIS and Sharpening tasks
-		but with bad schema payload
-		-Create Workflow
-		-Add MODIS and Sharpening Tasks
-		-Create and Run the Job with invalid payload
-		-Cleanup/Delete Workflow
-	"""
-	access_token = get_access_token(project_id, project_api_key)
-
-	#Construct the request body based on Modis and Sharpening tasks
-	task1 = WorkflowTaskRequest('nasa-modis:1', None, NASA_MODIS_BLOCK_ID)
-	task2 = WorkflowTaskRequest('sharpening:1', 'nasa-modis:1', SHARPENING_FILTER_BLOCK_ID)
-	js1 = json.dumps(task1.__dict__)
-	js2 = json.dumps(task2.__dict__)
-	task_request_body = json.dumps([task1.__dict__, task2.__dict__])
-	
-	#Initialize workflow info
-	workflow_name = generate_random_alphanumeric(5)
-	workflow_desc = generate_random_alphanumeric(5)
-	workflow_id = ''
-
-	try:
-		#Create a workflow and extract the id returned
-		res = create_workflow(access_token, project_id, workflow_name, workflow_desc)
-		assert res.status_code == 200, f"Create Workflow: Failure with status {res.status_code}"
-		workflow_id = res.json()['data']['id']
-		assert len(workflow_id) > 0, "No workflow id returned!"
-
-		#Now Add MODIS and Sharpening Tasks to Workflow and verify 
-		res = add_tasks_to_workflow(access_token, project_id, workflow_id, task_request_body)
-		assert res.status_code == 200, f"Add Tasks: Unexpected status code of {res.status_code}"
-
-		#Now Create and Run job 
-		f = open(MODIS_SHARPENING_TEST_JSON_FILE_INVALID)
-		job_request_body = json.load(f)
-		res = create_and_run_job_for_workflow(access_token, project_id, workflow_id, job_request_body)
-		assert res.status_code == 400, f"Create and Run Invalid Job: Unexpected status code of {res.status_code}"		
-
-	finally:
-		#No matter if fail or succeed, attempts clean up by deleting the workflow
-		res = delete_workflow(access_token, project_id, workflow_id)
-
-def test_create_and_run_modis_sharpening_job_complete(project_id, project_api_key):
-	"""
-		This test aims to verify creating and running the MODIS and Sharpening tasks
-		as jobs until completion
-		-Create Workflow
-		-Add MODIS and Sharpening Tasks
-		-Create and Run the Job
-		-Wait for maximum of 5 minutes until Job Complete
-		-Cleanup/Delete Workflow
-	"""
-	access_token = get_access_token(project_id, project_api_key)
-
-	#Construct the request body based on Modis and Sharpening tasks
-	task1 = WorkflowTaskRequest('nasa-modis:1', None, NASA_MODIS_BLOCK_ID)
-	task2 = WorkflowTaskRequest('sharpening:1', 'nasa-modis:1', SHARPENING_FILTER_BLOCK_ID)
-	js1 = json.dumps(task1.__dict__)
-	js2 = json.dumps(task2.__dict__)
-	task_request_body = json.dumps([task1.__dict__, task2.__dict__])
-	
-	#Initialize workflow info
-	workflow_name = generate_random_alphanumeric(5)
-	workflow_desc = generate_random_alphanumeric(5)
-	workflow_id = ''
-
-	try:
-		#Create a workflow and extract the id returned
-		res = create_workflow(access_token, project_id, workflow_name, workflow_desc)
-		assert res.status_code == 200, f"Create Workflow: Failure with status {res.status_code}"
-		workflow_id = res.json()['data']['id']
-		assert len(workflow_id) > 0, "No workflow id returned!"
-
-		#Now Add MODIS and Sharpening Tasks to Workflow and verify 
-		res = add_tasks_to_workflow(access_token, project_id, workflow_id, task_request_body)
-		assert res.status_code == 200, f"Add Tasks: Unexpected status code of {res.status_code}"
-
-		#Now Create and Run job 
-		f = open(MODIS_SHARPENING_TEST_JSON_FILE)
-		job_request_body = json.load(f)
-		res = create_and_run_job_for_workflow(access_token, project_id, workflow_id, job_request_body)
-		assert res.status_code == 200, f"Create and Run Job: Unexpected status code of {res.status_code}"
-		
-		#Extracts job_id
-		job_id = res.json()['data']['id']
-
-		#Wait for a maximum of 5 minutes/300 seconds before job is completed
-		assert wait_until_job_is_complete(access_token, project_id, job_id, 300) == True, f"Job fails to complete in 300 seconds!"
-
-	finally:
-		#No matter if fail or succeed, attempts clean up by deleting the workflow
-		res = delete_workflow(access_token, project_id, workflow_id)
-
-def test_create_workflow_with_255_char_name(project_id, project_api_key):
-	"""
-		This test aims to verify that calling the Create Workflow endpoint
-		with valid token, project_id, and a long name in the request (can use max spec length if available)
-		successfully returns a 200 status code and returns a workflow_id
-	"""	
-	access_token = get_access_token(project_id, project_api_key)
-
-	#Initialize workflow info
-	workflow_name = generate_random_alphanumeric(255)
-	workflow_desc = generate_random_alphanumeric(5)
-	workflow_id = ''
-
-	try:
-		#Call and verify the status
-		res = create_workflow(access_token, project_id, workflow_name, workflow_desc)
-		assert res.status_code == 200, f"Create Workflow: Fail to create workflow with 255 char name! System returns status of {res.status_code}"
-
-		#Verify the workflow_id
-		workflow_id = res.json()['data']['id']
-		assert len(workflow_id) > 0, "No workflow id returned!"
-
-	finally:
-		#Attempts clean up by deleting the workflow
-		res = delete_workflow(access_token, project_id, workflow_id)
+import pytest
+import sys
+import asyncio
+
+from Modules.api_helper import *
+from Modules.api_objects import *
+from Modules.job_outputs import download_job_outputs, open_artifact
+from Modules.utility import *
+from Modules.constants import *
+
+#Note: Currently all the API tests are in one file. Obviously when testing gets larger, we want to compartmentalize them into separate files.
+
+def test_delete_workflow_should_not_exist(project_id, project_api_key, cleanup_queue):
+	"""
+		This test aims to verify that calling the Delete Workflow endpoint
+		with valid parameters should successfully delete it from the system.
+		Use Get Specific Workflow to check it no longer exists.
+		-Create Workflow
+		-Delete Workflow
+		-Check if Workflow exists and Verify
+		-Cleanup/Delete Workflow
+	"""	
+	access_token = get_access_token(project_id, project_api_key)
+
+	#Initialize workflow info
+	workflow_name = generate_workflow_name(16)
+	workflow_desc = generate_random_alphanumeric(5)
+	workflow_id = ''
+
+	try:
+		#Create a workflow
+		res = create_workflow(access_token, project_id, workflow_name, workflow_desc)
+		assert res.status_code == 200, f"Create Workflow: Failure with status {res.status_code}"
+		workflow_id = Workflow.from_response(res).id
+		assert len(workflow_id) > 0, "No workflow id returned!"
+
+		#Now, delete the workflow
+		res = delete_workflow(access_token, project_id, workflow_id)
+		assert res.status_code == 204, f"Delete Workflow: Failure with status {res.status_code}"
+
+		#Finally, check Get Specific Workflow
+		res = get_specific_workflow(access_token, project_id, workflow_id)
+		assert res.status_code == 404, f"Get Specific Workflow: Unexpected status code of {res.status_code}"
+
+	finally:
+		#No matter if fail or succeed, queue the workflow for deletion in the background
+		cleanup_queue.schedule_delete(access_token, project_id, workflow_id)
+
+def test_delete_workflow_twice(project_id, project_api_key, cleanup_queue):
+	"""
+		This test aims to verify that calling the Delete Workflow endpoint
+		with valid parameters should successfully delete it from the system.
+		Use Get Specific Workflow to check it no longer exists.
+		-Create Workflow
+		-Delete Workflow
+		-Check if Workflow exists and Verify
+		-Cleanup/Delete Workflow
+	"""	
+	access_token = get_access_token(project_id, project_api_key)
+
+	#Initialize workflow info
+	workflow_name = generate_workflow_name(16)
+	workflow_desc = generate_random_alphanumeric(5)
+	workflow_id = ''
+
+	try:
+		#Create a workflow
+		res = create_workflow(access_token, project_id, workflow_name, workflow_desc)
+		assert res.status_code == 200, f"Create Workflow: Failure with status {res.status_code}"
+		workflow_id = Workflow.from_response(res).id
+		assert len(workflow_id) > 0, "No workflow id returned!"
+
+		#Now, delete the workflow
+		res = delete_workflow(access_token, project_id, workflow_id)
+		assert res.status_code == 204, f"Delete Workflow: Unexpected status of {res.status_code}"
+
+		#Try to delete the workflow one more time
+		res = delete_workflow(access_token, project_id, workflow_id)
+		assert res.status_code == 404, f"Delete Non-Existing Workflow: Unexpected status of {res.status_code}"
+
+	finally:
+		#No matter if fail or succeed, queue the workflow for deletion in the background
+		cleanup_queue.schedule_delete(access_token, project_id, workflow_id)
+
+def test_add_modis_and_sharpening_tasks_to_workflow_valid(project_id, project_api_key, leased_workflow):
+	"""
+		This test aims to verify the successful response when adding
+		valid MODIS and Sharpening tasks to an existing workflow
+		-Lease a blank Workflow from the pool
+		-Add Tasks and Verify
+	"""
+	access_token = get_access_token(project_id, project_api_key)
+
+	#Construct the request body based on Modis and Sharpening tasks
+	graph = WorkflowGraph()
+	graph.add('nasa-modis:1', None, NASA_MODIS_BLOCK_ID)
+	graph.add('sharpening:1', 'nasa-modis:1', SHARPENING_FILTER_BLOCK_ID)
+	task_request_body = graph.to_json()
+
+	#Use a blank workflow leased from the pool
+	workflow_id = leased_workflow
+
+	#Now Add Tasks to Workflow and verify 
+	res = add_tasks_to_workflow(access_token, project_id, workflow_id, task_request_body)
+	assert res.status_code == 200, f"Add Tasks: Unexpected status code of {res.status_code}"
+
+def test_add_modis_and_sharpening_tasks_to_workflow_invalid_parentid(project_id, project_api_key, leased_workflow):
+	"""
+		This test aims to verify the 400 Bad Request response when adding
+		MODIS and invalid Sharpening tasks parentid to an existing workflow
+		-Lease a blank Workflow from the pool
+		-Add Invalid Tasks and Verify Status Code
+	"""
+	access_token = get_access_token(project_id, project_api_key)
+
+	#Construct the request body based on Modis and Sharpening tasks
+	#Turn off local validation, so that the invalid tasks reach the API
+	graph = WorkflowGraph(validate=False)
+	graph.add('nasa-modis:1', None, NASA_MODIS_BLOCK_ID)
+	#Set the parentId to NULL for the sharpening
+	graph.add('sharpening:1', None, SHARPENING_FILTER_BLOCK_ID)
+	task_request_body = graph.to_json()
+
+	#Use a blank workflow leased from the pool
+	workflow_id = leased_workflow
+
+	#Now Add Invalid Task to Workflow and verify 
+	res = add_tasks_to_workflow(access_token, project_id, workflow_id, task_request_body)
+	assert res.status_code == 400, f"Add Invalid Tasks: Unexpected status code of {res.status_code}"
+
+def test_create_and_run_modis_sharpening_job_invalid_schema(project_id, project_api_key, leased_workflow, payload_catalog):
+	"""
+		This test aims to verify creating and running the MODIS and Sharpening tasks
+		but with bad schema payload
+		-Lease a blank Workflow from the pool
+		-Add MODIS and Sharpening Tasks
+		-Create and Run the Job with invalid payload
+	"""
+	access_token = get_access_token(project_id, project_api_key)
+
+	#Construct the request body based on Modis and Sharpening tasks
+	graph = WorkflowGraph()
+	graph.add('nasa-modis:1', None, NASA_MODIS_BLOCK_ID)
+	graph.add('sharpening:1', 'nasa-modis:1', SHARPENING_FILTER_BLOCK_ID)
+	task_request_body = graph.to_json()
+
+	#Use a blank workflow leased from the pool
+	workflow_id = leased_workflow
+
+	#Now Add MODIS and Sharpening Tasks to Workflow and verify 
+	res = add_tasks_to_workflow(access_token, project_id, workflow_id, task_request_body)
+	assert res.status_code == 200, f"Add Tasks: Unexpected status code of {res.status_code}"
+
+	#Now Create and Run job 
+	#The payload is invalid on purpose: it is caught locally, so skip the local validation and let the API reject it too
+	assert payload_catalog.errors(MODIS_SHARPENING_TEST_JSON_FILE_INVALID)
+	job_request_body = payload_catalog.body(MODIS_SHARPENING_TEST_JSON_FILE_INVALID)
+	res = create_and_run_job_for_workflow(access_token, project_id, workflow_id, job_request_body, validate=False)
+	assert res.status_code == 400, f"Create and Run Invalid Job: Unexpected status code of {res.status_code}"		
+
+@pytest.mark.background_job
+def test_create_and_run_modis_sharpening_job_complete(project_id, project_api_key, leased_workflow, tmp_path, background, payload_catalog):
+	"""
+		This test aims to verify creating and running the MODIS and Sharpening tasks
+		as jobs until completion
+		-Lease a blank Workflow from the pool
+		-Add MODIS and Sharpening Tasks
+		-Create and Run the Job
+		-In the background, while the other tests run:
+		-Wait for maximum of 5 minutes until Job Complete
+		-Download the Job Outputs and Verify
+	"""
+	access_token = get_access_token(project_id, project_api_key)
+
+	#Construct the request body based on Modis and Sharpening tasks
+	graph = WorkflowGraph()
+	graph.add('nasa-modis:1', None, NASA_MODIS_BLOCK_ID)
+	graph.add('sharpening:1', 'nasa-modis:1', SHARPENING_FILTER_BLOCK_ID)
+	task_request_body = graph.to_json()
+
+	#Use a blank workflow leased from the pool
+	workflow_id = leased_workflow
+
+	#Now Add MODIS and Sharpening Tasks to Workflow and verify 
+	res = add_tasks_to_workflow(access_token, project_id, workflow_id, task_request_body)
+	assert res.status_code == 200, f"Add Tasks: Unexpected status code of {res.status_code}"
+
+	#Now Create and Run job 
+	job_request_body = payload_catalog.body(MODIS_SHARPENING_TEST_JSON_FILE)
+	res = create_and_run_job_for_workflow(access_token, project_id, workflow_id, job_request_body)
+	assert res.status_code == 200, f"Create and Run Job: Unexpected status code of {res.status_code}"
+	
+	#Extracts job_id
+	job_id = Job.from_response(res).id
+
+	#Wait for the job and check its outputs in the background, failures are reported under this test's [background] item
+	background.run(verify_job_completes_with_outputs, access_token, project_id, job_id, str(tmp_path))
+
+def verify_job_completes_with_outputs(access_token, project_id, job_id, results_dir):
+	#Wait for a maximum of 5 minutes/300 seconds before job is completed
+	assert wait_until_job_is_complete(access_token, project_id, job_id, 300) == True, f"Job fails to complete in 300 seconds!"
+
+	#Download the results of every task and check they are not empty
+	results = download_job_outputs(access_token, project_id, job_id, results_dir)
+	assert results, "Job has no outputs to download"
+	for task_id, result in results.items():
+		assert result.succeeded, f"Download of task {task_id} failed: {result.error}"
+		with open_artifact(result.path) as content:
+			assert len(content) > 0, f"Results of task {task_id} are empty"
+
+def test_create_workflow_with_255_char_name(project_id, project_api_key, cleanup_queue):
+	"""
+		This test aims to verify that calling the Create Workflow endpoint
+		with valid token, project_id, and a long name in the request (can use max spec length if available)
+		successfully returns a 200 status code and returns a workflow_id
+	"""	
+	access_token = get_access_token(project_id, project_api_key)
+
+	#Initialize workflow info
+	workflow_name = generate_workflow_name(255)
+	workflow_desc = generate_random_alphanumeric(5)
+	workflow_id = ''
+
+	try:
+		#Call and verify the status
+		res = create_workflow(access_token, project_id, workflow_name, workflow_desc)
+		assert res.status_code == 200, f"Create Workflow: Fail to create workflow with 255 char name! System returns status of {res.status_code}"
+
+		#Verify the workflow_id
+		workflow_id = Workflow.from_response(res).id
+		assert len(workflow_id) > 0, "No workflow id returned!"
+
+	finally:
+		#Queue the workflow for deletion in the background
+		cleanup_queue.schedule_delete(access_token, project_id, workflow_id)
@@ -0,0 +1,103 @@
+import json
+
+import pytest
+
+from doubles import FakeResponse
+from Modules import json_codec
+from Modules.api_objects import *
+from Modules.response_benchmark import run_benchmark
+
+def test_graph_emits_tasks_in_topological_order():
+	"""
+		Verify that tasks added out of order are serialized parents first,
+		in the same shape as the plain Add Tasks request body
+	"""
+	graph = WorkflowGraph()
+	graph.add('sharpening:1', 'nasa-modis:1', 'block-2')
+	graph.add('nasa-modis:1', None, 'block-1')
+	graph.add('export:1', 'sharpening:1', 'block-3')
+
+	assert json.loads(graph.to_json()) == [
+		{'name': 'nasa-modis:1', 'parentName': None, 'blockId': 'block-1'},
+		{'name': 'sharpening:1', 'parentName': 'nasa-modis:1', 'blockId': 'block-2'},
+		{'name': 'export:1', 'parentName': 'sharpening:1', 'blockId': 'block-3'},
+	]
+
+def test_graph_serializes_once_until_changed():
+	"""
+		Verify that the request body is cached, and rebuilt after a task is added
+	"""
+	graph = WorkflowGraph()
+	for i in range(500):
+		graph.chain(f'block:{i}', 'block-id')
+	payload = graph.to_json()
+	assert graph.to_json() is payload
+	assert len(json.loads(payload)) == 500
+
+	graph.chain('block:500', 'block-id')
+	assert len(json.loads(graph.to_json())) == 501
+
+@pytest.mark.parametrize('tasks, message', [
+	([('a', None, 'x'), ('b', 'missing', 'x')], 'unknown parentName'),
+	([('a', None, 'x'), ('b', None, 'x')], 'more than one task'),
+	([('a', None, 'x'), ('b', 'c', 'x'), ('c', 'b', 'x')], 'cycle'),
+	([('a', 'b', 'x'), ('b', 'a', 'x')], 'cycle'),
+])
+def test_invalid_graph_is_rejected_locally(tasks, message):
+	"""
+		Verify that dangling parents, orphaned roots and cycles are reported before any request is sent
+	"""
+	graph = WorkflowGraph([WorkflowTaskRequest(*task) for task in tasks])
+	with pytest.raises(WorkflowGraphError, match=message):
+		graph.to_json()
+
+def test_duplicate_task_name_is_rejected():
+	graph = WorkflowGraph().add('a', None, 'x')
+	with pytest.raises(WorkflowGraphError, match='Duplicate'):
+		graph.add('a', None, 'x')
+
+def test_validation_can_be_turned_off():
+	"""
+		Verify that an invalid graph is serialized as given when validation is off
+	"""
+	graph = WorkflowGraph(validate=False).add('a', None, 'x').add('b', None, 'y').add('b', 'zzz', 'y')
+	assert [task['name'] for task in json.loads(graph.to_json())] == ['a', 'b', 'b']
+
+@pytest.mark.parametrize('codec', sorted(json_codec.available_codecs()))
+def test_models_read_fields_from_a_single_parse(codec, monkeypatch):
+	"""
+		Verify that the models expose the fields of every endpoint's body, and that the body is decoded only once
+	"""
+	monkeypatch.setattr(json_codec, '_codec', json_codec.available_codecs()[codec])
+	res = FakeResponse(200, {'data': {'id': 'job-1', 'status': 'SUCCEEDED', 'workflowId': 'wf-1'}, 'error': None})
+	job = Job.from_response(res)
+	assert (job.id, job.status, job.workflow_id, job.name) == ('job-1', 'SUCCEEDED', 'wf-1', None)
+	assert job.is_terminal and job.succeeded
+
+	res.content = b'not json anymore'
+	assert Job.from_response(res).status == 'SUCCEEDED'
+
+	workflows = Workflow.list_from_response(FakeResponse(200, {'data': [{'id': 'a', 'name': 'apitest-a'}, {'id': 'b', 'name': 'other'}]}))
+	assert [(w.id, w.name) for w in workflows] == [('a', 'apitest-a'), ('b', 'other')]
+	tasks = TaskList.from_response(FakeResponse(200, {'data': [{'id': 't1', 'name': 'nasa-modis:1', 'blockId': 'x'}]}))
+	assert len(tasks) == 1 and tasks.by_name('nasa-modis:1').block_id == 'x' and tasks.by_name('other') is None
+	assert Token.from_response(FakeResponse(200, {'data': {'accessToken': 'tok'}})).access_token == 'tok'
+
+def test_unexpected_shapes_raise_response_shape_errors():
+	with pytest.raises(ResponseShapeError, match="Job: missing field 'status'"):
+		Job.from_response(FakeResponse(200, {'data': {'id': 'job-1'}})).status
+	with pytest.raises(ResponseShapeError, match='expected a json object, got None') as e:
+		Workflow.from_response(FakeResponse(404, {'data': None, 'error': {'code': 'NOT_FOUND'}}))
+	assert e.value.status_code == 404
+	with pytest.raises(ResponseShapeError, match='data field'):
+		Job.from_response(FakeResponse(200, [1, 2]))
+	with pytest.raises(ResponseShapeError, match='not json'):
+		Token.from_response(FakeResponse(502, b'<html>Bad Gateway</html>'))
+	with pytest.raises(ResponseShapeError, match='expected a json list'):
+		Job.list_from_response(FakeResponse(200, {'data': {'id': 'job-1'}}))
+
+def test_response_benchmark_runs():
+	results = run_benchmark(number=10, jobs=3)
+	assert 'check_job_status res.json()' in results
+	assert 'check_job_status Job model (json)' in results
+	assert all(micros > 0 for micros in results.values())
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+
+import pytest
+
+from Modules.api_objects import Job, Workflow, WorkflowGraph
+from Modules.async_api_helper import *
+from Modules.constants import *
+from Modules.payload_catalog import PayloadValidationError
+from Modules.token_cache import TokenCache
+
+class CountingClient(AsyncUP42Client):
+	#Keeps the highest number of Check Job Status requests in flight at once
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.in_flight = 0
+		self.max_in_flight = 0
+
+	async def check_job_status(self, token, project_id, job_id):
+		self.in_flight += 1
+		self.max_in_flight = max(self.max_in_flight, self.in_flight)
+		try:
+			return await super().check_job_status(token, project_id, job_id)
+		finally:
+			self.in_flight -= 1
+
+def run_with_client(server, coroutine_fn, token_cache=None, client_class=AsyncUP42Client, **kwargs):
+	#Runs coroutine_fn(client) in a new event loop whose default async client talks to the fake server
+	async def main():
+		async with client_class(base_url=server.base_url, token_cache=token_cache or TokenCache(), **kwargs) as client:
+			set_default_client(client)
+			return await coroutine_fn(client)
+	return asyncio.run(main())
+
+async def create_modis_sharpening_workflow(token, project_id):
+	workflow_id = Workflow.from_response(await create_workflow(token, project_id, 'apitest-async', 'async')).id
+	graph = WorkflowGraph().add('nasa-modis:1', None, NASA_MODIS_BLOCK_ID).add('sharpening:1', 'nasa-modis:1', SHARPENING_FILTER_BLOCK_ID)
+	assert (await add_tasks_to_workflow(token, project_id, workflow_id, graph.to_json())).status_code == 200
+	return workflow_id
+
+def test_workflow_lifecycle(fake_up42_server, payload_catalog):
+	"""
+		Verify that the coroutines create, read and delete workflows, and run a job to completion
+	"""
+	async def lifecycle(client):
+		token = await get_access_token('project', 'key')
+		assert await get_access_token('project', 'key') == token
+		workflow_id = await create_modis_sharpening_workflow(token, 'project')
+		assert (await get_specific_workflow(token, 'project', workflow_id)).status_code == 200
+
+		res = await create_and_run_job_for_workflow(token, 'project', workflow_id, payload_catalog.body(MODIS_SHARPENING_TEST_JSON_FILE), name='apitest-job')
+		job = Job.from_response(res)
+		assert job.name == 'apitest-job'
+		assert await wait_until_job_is_complete(token, 'project', job.id, 5)
+
+		assert (await delete_workflow(token, 'project', workflow_id)).status_code == 204
+		assert (await delete_workflow(token, 'project', workflow_id)).status_code == 404
+		await close_default_client()
+
+	run_with_client(fake_up42_server, lifecycle)
+	assert fake_up42_server.request_counts()['token'] == 1
+
+def test_job_parameters_are_validated(fake_up42_server, payload_catalog):
+	"""
+		Verify that invalid job parameters are rejected before the request, unless validation is turned off
+	"""
+	bad_body = payload_catalog.body(MODIS_SHARPENING_TEST_JSON_FILE_INVALID)
+
+	async def submit(client):
+		token = await get_access_token('project', 'key')
+		workflow_id = await create_modis_sharpening_workflow(token, 'project')
+		with pytest.raises(PayloadValidationError):
+			await create_and_run_job_for_workflow(token, 'project', workflow_id, bad_body, validate=True)
+		assert 'create_job' not in fake_up42_server.request_counts()
+		return await create_and_run_job_for_workflow(token, 'project', workflow_id, bad_body, validate=False)
+
+	assert run_with_client(fake_up42_server, submit).status_code == 400
+
+def test_many_jobs_are_watched_with_bounded_concurrency(fake_up42_server, payload_catalog):
+	"""
+		Verify that wait_until_jobs_are_complete watches every job while keeping at most max_concurrency status requests in flight
+	"""
+	fake_up42_server.latency = {'job_status': 0.02}
+	fake_up42_server.job_timeline = [('PENDING', 0), ('RUNNING', 0.05), ('SUCCEEDED', 0.2)]
+	body = payload_catalog.body(MODIS_SHARPENING_TEST_JSON_FILE)
+
+	async def watch(client):
+		token = await get_access_token('project', 'key')
+		workflow_id = await create_modis_sharpening_workflow(token, 'project')
+		job_ids = [Job.from_response(await create_and_run_job_for_workflow(token, 'project', workflow_id, body)).id for i in range(6)]
+		results = await wait_until_jobs_are_complete(token, 'project', job_ids, 5, max_concurrency=2)
+		return job_ids, results, client.max_in_flight
+
+	job_ids, results, max_in_flight = run_with_client(fake_up42_server, watch, client_class=CountingClient)
+	assert results == {job_id: True for job_id in job_ids}
+	assert max_in_flight == 2
+
+def test_disk_token_cache_is_read_off_the_event_loop(fake_up42_server, tmp_path):
+	"""
+		Verify that the file-locked disk tier of the token cache is never touched from the event loop thread
+	"""
+	token_cache = TokenCache(disk_path=str(tmp_path / 'tokens.json'))
+	threads = []
+	for name in ('lookup', 'put'):
+		def spy(*args, method=getattr(token_cache, name)):
+			threads.append(threading.current_thread())
+			return method(*args)
+		setattr(token_cache, name, spy)
+
+	async def fetch_twice(client):
+		return await get_access_token('project', 'key'), await get_access_token('project', 'key')
+
+	first, second = run_with_client(fake_up42_server, fetch_twice, token_cache)
+	assert first == second
+	assert threads and threading.main_thread() not in threads
+
+def test_calls_time_out_per_endpoint(fake_up42_server):
+	"""
+		Verify that a call answering slower than the read timeout of its endpoint fails instead of hanging
+	"""
+	fake_up42_server.latency = {'get_workflow': 0.5}
+
+	async def read_slow_workflow(client):
+		token = await get_access_token('project', 'key')
+		workflow_id = Workflow.from_response(await create_workflow(token, 'project', 'apitest-async', 'async')).id
+		with pytest.raises(asyncio.TimeoutError):
+			await get_specific_workflow(token, 'project', workflow_id)
+		#Other endpoints keep their own timeouts
+		assert (await delete_workflow(token, 'project', workflow_id)).status_code == 204
+
+	run_with_client(fake_up42_server, read_slow_workflow, timeouts={'get_specific_workflow': (1, 0.1)})
@@ -0,0 +1,87 @@
+import pytest
+
+pytest_plugins = ['pytester']
+
+CONFTEST = '''
+import pytest
+from Modules.background_jobs import BackgroundJobs, BackgroundJobsPlugin
+
+def pytest_configure(config):
+	config.pluginmanager.register(BackgroundJobsPlugin(4), 'up42-background-jobs')
+
+@pytest.fixture()
+def background(request):
+	handle = BackgroundJobs(request.config.pluginmanager.get_plugin('up42-background-jobs'), request.node.nodeid)
+	yield handle
+	handle.close()
+'''
+
+TESTS = '''
+import time
+import pytest
+
+events = []
+
+def slow_check(name, seconds, ok=True):
+	time.sleep(seconds)
+	events.append(name)
+	assert ok, f'{name} failed in the background'
+
+@pytest.mark.background_job
+def test_fast_job(background):
+	background.run(slow_check, 'fast', 0.1)
+
+@pytest.mark.background_job
+def test_slow_job(background):
+	background.add_finalizer(lambda: events.append('slow released'))
+	background.run(slow_check, 'slow', 0.3, ok=False)
+
+def test_short():
+	events.append('short')
+
+def test_order():
+	#The background work is still running while the short tests execute
+	assert 'slow' not in events
+'''
+
+@pytest.fixture()
+def suite(pytester, request):
+	pytester.syspathinsert(str(request.config.rootpath))
+	pytester.makeconftest(CONFTEST)
+	pytester.makepyfile(test_suite=TESTS)
+	return pytester
+
+def test_background_waits_overlap_and_report_on_origin(suite):
+	"""
+		Verify that marked tests run first, that their background failures are reported under the originating test,
+		and that the waits overlap with the other tests
+	"""
+	result = suite.runpytest('-v')
+	result.assert_outcomes(passed=5, failed=1)
+	lines = [line for line in result.outlines if line.startswith('test_suite.py::') and ('PASSED' in line or 'FAILED' in line)]
+	names = [line.split('::')[1].split(' ')[0] for line in lines]
+	assert names[:2] == ['test_fast_job', 'test_slow_job'] or names[:2] == ['test_slow_job', 'test_fast_job']
+	assert names[2:4] == ['test_short', 'test_order']
+	assert sorted(names[4:]) == ['test_fast_job[background]', 'test_slow_job[background]']
+	result.stdout.fnmatch_lines(['*FAILED*test_slow_job[[]background[]]*'])
+	result.stdout.fnmatch_lines(['*slow failed in the background*'])
+
+def test_slowest_recorded_wait_starts_first(suite):
+	"""
+		Verify that the durations recorded by a run decide the order of the background tests in the next run
+	"""
+	suite.runpytest()
+	result = suite.runpytest('-v')
+	lines = [line for line in result.outlines if line.startswith('test_suite.py::') and 'background]' not in line and ('PASSED' in line or 'FAILED' in line)]
+	assert '::test_slow_job' in lines[0] and '::test_fast_job' in lines[1]
+
+def test_inline_mode_runs_in_the_test(suite):
+	"""
+		Verify that without background threads the work runs in the test itself, which then reports its failure
+	"""
+	suite.makeconftest(CONFTEST.replace('BackgroundJobsPlugin(4)', 'BackgroundJobsPlugin(0)'))
+	result = suite.runpytest('-v')
+	#test_order fails too, since the slow job finished before it ran
+	result.assert_outcomes(passed=2, failed=2)
+	result.stdout.fnmatch_lines(['*test_slow_job FAILED*'])
+	assert 'background]' not in result.stdout.str()
@@ -0,0 +1,118 @@
+import gzip
+import json
+import mmap
+import os
+
+import pytest
+
+from Modules.api_helper import *
+from Modules.api_objects import WorkflowGraph
+from Modules.cassette import install_cassette, uninstall_cassette
+from Modules.constants import *
+from Modules.job_outputs import download_job_outputs
+from Modules.token_cache import TokenCache
+from Modules.up42_client import UP42Client, set_default_client
+from Modules.utility import generate_workflow_name
+
+def run_lifecycle(project_id, directory, job_request_body):
+	#Every endpoint the cassette has to handle: token, workflow, tasks, job, status polls, outputs and delete
+	token = get_access_token(project_id, 'key')
+	workflow_id = Workflow.from_response(create_workflow(token, project_id, generate_workflow_name(16), 'cassette')).id
+	graph = WorkflowGraph().add('nasa-modis:1', None, NASA_MODIS_BLOCK_ID).add('sharpening:1', 'nasa-modis:1', SHARPENING_FILTER_BLOCK_ID)
+	assert add_tasks_to_workflow(token, project_id, workflow_id, graph.to_json()).status_code == 200
+	job_id = Job.from_response(create_and_run_job_for_workflow(token, project_id, workflow_id, job_request_body)).id
+	assert wait_until_job_is_complete(token, project_id, job_id, 5)
+	results = download_job_outputs(token, project_id, job_id, directory)
+	assert delete_workflow(token, project_id, workflow_id).status_code == 204
+	return token, workflow_id, job_id, results
+
+def run_with_cassette(path, mode, base_url, project_id, directory, job_request_body):
+	client = UP42Client(base_url=base_url, token_cache=TokenCache())
+	adapter = install_cassette(client, path, mode)
+	previous = set_default_client(client)
+	try:
+		return adapter, run_lifecycle(project_id, directory, job_request_body)
+	finally:
+		set_default_client(previous)
+		client.close()
+
+@pytest.mark.parametrize('filename', ['session.jsonl', 'session.jsonl.gz'])
+def test_record_then_replay(fake_up42_server, payload_catalog, tmp_path, filename):
+	"""
+		Verify that a session recorded against the fake server is replayed without any request to it,
+		for another project and with fresh ids, and that no credential reaches the cassette
+	"""
+	path = str(tmp_path / filename)
+	body = payload_catalog.body(MODIS_SHARPENING_TEST_JSON_FILE)
+	adapter, (token, workflow_id, job_id, recorded) = run_with_cassette(path, 'record', fake_up42_server.base_url,
+		'recorded-project', str(tmp_path / 'recorded'), body)
+	assert all(result.succeeded and result.verified for result in recorded.values())
+
+	with (gzip.open(path, 'rt') if filename.endswith('.gz') else open(path)) as f:
+		text = f.read()
+	for secret in (token, 'recorded-project', workflow_id, job_id, 'X-Goog-Signature', 'X-Goog-Credential'):
+		assert secret not in text
+	assert '<<token>>' in text and '<<project>>' in text and '<<signed>>' in text and '<<id:0>>' in text
+
+	served = fake_up42_server.request_counts()
+	adapter, (replay_token, replay_workflow_id, replay_job_id, replayed) = run_with_cassette(path, 'replay', BASE_URL,
+		'replay-project', str(tmp_path / 'replayed'), body)
+	assert fake_up42_server.request_counts() == served
+	assert replay_token != token and replay_workflow_id != workflow_id and replay_job_id != job_id
+	assert sorted(result.output.name for result in replayed.values()) == sorted(result.output.name for result in recorded.values())
+	for result in replayed.values():
+		assert result.succeeded and result.verified
+		original = next(r for r in recorded.values() if r.output.name == result.output.name)
+		with open(result.path, 'rb') as replayed_file, open(original.path, 'rb') as recorded_file:
+			assert replayed_file.read() == recorded_file.read()
+
+def test_replay_index_is_cached_next_to_the_cassette(fake_up42_server, payload_catalog, tmp_path):
+	"""
+		Verify that a plain cassette is memory-mapped, that its entry index is written on first replay and reused,
+		and that a stale index is rebuilt
+	"""
+	path = str(tmp_path / 'session.jsonl')
+	body = payload_catalog.body(MODIS_SHARPENING_TEST_JSON_FILE)
+	run_with_cassette(path, 'record', fake_up42_server.base_url, 'project', str(tmp_path / 'recorded'), body)
+
+	adapter, result = run_with_cassette(path, 'replay', BASE_URL, 'project', str(tmp_path / 'first'), body)
+	index = adapter.cassette.index
+	with open(path + '.idx') as f:
+		assert json.load(f) == index
+	assert any(key.startswith('GET ') and '/downloads/<<id>>/<<id>>' in key for key in index)
+
+	client = UP42Client(token_cache=TokenCache())
+	try:
+		adapter = install_cassette(client, path, 'replay')
+		assert isinstance(adapter.cassette.data, mmap.mmap)
+		assert adapter.cassette.index == index
+	finally:
+		client.close()
+
+	#An index older than its cassette is ignored and rebuilt
+	with open(path + '.idx', 'w') as f:
+		json.dump({}, f)
+	os.utime(path + '.idx', (0, 0))
+	client = UP42Client(token_cache=TokenCache())
+	try:
+		assert install_cassette(client, path, 'replay').cassette.index == index
+	finally:
+		client.close()
+
+def test_uninstall_restores_the_client(tmp_path):
+	"""
+		Verify that removing a recording cassette gives the client back its pooled adapter and its hedging
+	"""
+	client = UP42Client(token_cache=TokenCache())
+	try:
+		inner, hedged = client.session.get_adapter(BASE_URL), client.resilience.hedged
+		assert hedged
+		adapter = install_cassette(client, str(tmp_path / 'session.jsonl'), 'record')
+		assert client.session.get_adapter(BASE_URL) is adapter and not client.resilience.hedged
+
+		uninstall_cassette(client, adapter)
+		assert client.session.get_adapter(BASE_URL) is inner
+		assert client.resilience.hedged == hedged
+		assert adapter.file.closed
+	finally:
+		client.close()
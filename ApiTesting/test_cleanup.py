@@ -0,0 +1,55 @@
+from Modules.api_helper import *
+from Modules.cleanup import DeferredCleanupQueue, sweep_orphan_workflows
+
+def create_named_workflow(token, name):
+	return Workflow.from_response(create_workflow(token, 'project', name, 'cleanup')).id
+
+def test_queue_skips_empty_ids_and_drains_on_close(fake_up42_server):
+	"""
+		Verify that every queued deletion is sent before close returns, even when deletes are slow
+	"""
+	token = get_access_token('project', 'key')
+	workflow_ids = [create_named_workflow(token, f'apitest-{i}') for i in range(6)]
+	fake_up42_server.latency = {'delete_workflow': 0.02}
+
+	cleanup = DeferredCleanupQueue(max_workers=2, batch_size=2)
+	assert not cleanup.schedule_delete(token, 'project', '')
+	assert not cleanup.schedule_delete(token, 'project', None)
+	assert all(cleanup.schedule_delete(token, 'project', workflow_id) for workflow_id in workflow_ids)
+	stats = cleanup.close()
+
+	assert stats == {'scheduled': 6, 'skipped': 2, 'deleted': 6, 'not_found': 0, 'failed': 0}
+	assert not fake_up42_server.workflows and not cleanup.failures
+	assert fake_up42_server.request_counts()['delete_workflow'] == 6
+	assert not any(worker.is_alive() for worker in cleanup.workers)
+
+def test_queue_records_failures(fake_up42_server):
+	token = get_access_token('project', 'key')
+	workflow_id = create_named_workflow(token, 'apitest-gone')
+	assert delete_workflow(token, 'project', workflow_id).status_code == 204
+
+	cleanup = DeferredCleanupQueue(max_workers=1)
+	cleanup.schedule_delete(token, 'project', workflow_id)
+	cleanup.schedule_delete('expired-token', 'project', 'other')
+	stats = cleanup.close()
+
+	#An already deleted workflow is not a failure
+	assert (stats['not_found'], stats['failed']) == (1, 1)
+	assert cleanup.failures == [('other', 'status 401')]
+
+def test_sweep_deletes_only_old_test_workflows(fake_up42_server):
+	"""
+		Verify that the sweep deletes the workflows with the test prefix older than the minimum age, and nothing else
+	"""
+	token = get_access_token('project', 'key')
+	old_test = create_named_workflow(token, 'apitest-old')
+	recent_test = create_named_workflow(token, 'apitest-recent')
+	old_other = create_named_workflow(token, 'production-old')
+	for workflow_id in (old_test, old_other):
+		fake_up42_server.workflows[workflow_id]['createdAt'] = '2020-05-12T10:11:12.123456Z'
+
+	assert sweep_orphan_workflows(token, 'project', min_age_seconds=3600) == [old_test]
+	assert set(fake_up42_server.workflows) == {recent_test, old_other}
+
+	assert sweep_orphan_workflows(token, 'project', min_age_seconds=0) == [recent_test]
+	assert set(fake_up42_server.workflows) == {old_other}
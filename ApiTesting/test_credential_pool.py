@@ -0,0 +1,100 @@
+import configparser
+import threading
+import time
+
+import pytest
+
+from Modules.credential_pool import *
+
+def make_config(text):
+	config = configparser.ConfigParser()
+	config.read_string(text)
+	return config
+
+def make_credentials(count):
+	return [ProjectCredentials(f'project:{i}', f'id-{i}', f'key-{i}') for i in range(count)]
+
+def test_projects_are_read_from_every_section():
+	"""
+		Verify that [keys] and [project:NAME] sections are read, skipping duplicates and unrelated sections
+	"""
+	config = make_config("""
+[keys]
+project_id = a
+project_api_key = key-a
+
+[project:second]
+project_id = b
+project_api_key = key-b
+
+[project:duplicate]
+project_id = a
+project_api_key = key-a
+
+[other]
+project_id = c
+project_api_key = key-c
+""")
+	credentials = load_project_credentials(config)
+	assert [(c.label, c.project_id) for c in credentials] == [('keys', 'a'), ('project:second', 'b')]
+	assert 'key-a' not in repr(credentials[0])
+
+	with pytest.raises(ValueError):
+		load_project_credentials(make_config('[other]\nproject_id = c\n'))
+
+def test_least_recently_used_project_is_leased():
+	"""
+		Verify that concurrent leases spread over the projects and that released projects go to the back of the line
+	"""
+	pool = CredentialPool(make_credentials(3))
+	first, second, third = pool.acquire(), pool.acquire(), pool.acquire()
+	assert [first.project_id, second.project_id, third.project_id] == ['id-0', 'id-1', 'id-2']
+
+	pool.release(second)
+	pool.release(first)
+	#Both are idle again, id-1 was released first
+	assert pool.acquire().project_id == 'id-1'
+	assert pool.acquire().project_id == 'id-0'
+
+	usage = pool.usage()
+	assert usage['project:0']['leases'] == 2 and usage['project:0']['in_flight'] == 1
+	assert usage['project:2']['max_in_flight'] == 1
+
+def test_workers_start_on_different_projects():
+	assert xdist_worker_number('gw3') == 3
+	assert xdist_worker_number(None) == 0
+	leased = [CredentialPool(make_credentials(3), offset=worker).acquire().project_id for worker in range(4)]
+	assert leased == ['id-0', 'id-1', 'id-2', 'id-0']
+
+def test_threads_share_projects_evenly():
+	"""
+		Verify that threads get one project each for as long as they run, evenly over the projects,
+		and that their leases end with them
+	"""
+	pool = CredentialPool(make_credentials(2))
+	assigned = []
+	lock = threading.Lock()
+	all_leased = threading.Barrier(6)
+
+	def user():
+		project = pool.for_thread()
+		assert pool.for_thread() is project
+		with lock:
+			assigned.append(project.project_id)
+		all_leased.wait(5)
+
+	threads = [threading.Thread(target=user) for i in range(6)]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	assert sorted(assigned) == ['id-0'] * 3 + ['id-1'] * 3
+
+	#The leases end when the threads' locals are dropped, right after they finish
+	for i in range(100):
+		if sum(usage['in_flight'] for usage in pool.usage().values()) == 0:
+			break
+		time.sleep(0.01)
+	usage = pool.usage()
+	assert [usage[label]['in_flight'] for label in ('project:0', 'project:1')] == [0, 0]
+	assert usage['project:0']['max_in_flight'] == 3
@@ -0,0 +1,86 @@
+import time
+
+from Modules.api_helper import *
+from Modules.api_objects import *
+from Modules.constants import *
+
+"""
+	Tests of the fake UP42 server itself: the API semantics the other tests rely on, and its tuning knobs.
+	Every test gets a fresh server from the fake_up42_server fixture.
+"""
+
+def create_modis_sharpening_workflow(token, project_id):
+	res = create_workflow(token, project_id, 'apitest-fake', 'fake')
+	assert res.status_code == 200
+	workflow_id = Workflow.from_response(res).id
+	graph = WorkflowGraph().add('nasa-modis:1', None, NASA_MODIS_BLOCK_ID).add('sharpening:1', 'nasa-modis:1', SHARPENING_FILTER_BLOCK_ID)
+	assert add_tasks_to_workflow(token, project_id, workflow_id, graph.to_json()).status_code == 200
+	return workflow_id
+
+def test_second_delete_returns_404(fake_up42_server):
+	token = get_access_token('project', 'key')
+	workflow_id = Workflow.from_response(create_workflow(token, 'project', 'apitest-fake', 'fake')).id
+
+	assert delete_workflow(token, 'project', workflow_id).status_code == 204
+	assert get_specific_workflow(token, 'project', workflow_id).status_code == 404
+	assert delete_workflow(token, 'project', workflow_id).status_code == 404
+	assert fake_up42_server.request_counts()['delete_workflow'] == 2
+
+def test_invalid_parent_name_and_schema_return_400(fake_up42_server, payload_catalog):
+	token = get_access_token('project', 'key')
+	workflow_id = Workflow.from_response(create_workflow(token, 'project', 'apitest-fake', 'fake')).id
+
+	graph = WorkflowGraph(validate=False).add('nasa-modis:1', None, NASA_MODIS_BLOCK_ID).add('sharpening:1', 'nasa-modis:2', SHARPENING_FILTER_BLOCK_ID)
+	res = add_tasks_to_workflow(token, 'project', workflow_id, graph.to_json())
+	assert res.status_code == 400 and 'parentName' in response_body(res)['error']['message']
+
+	#A workflow without tasks cannot run any job
+	body = payload_catalog.body(MODIS_SHARPENING_TEST_JSON_FILE)
+	assert create_and_run_job_for_workflow(token, 'project', workflow_id, body).status_code == 400
+
+	workflow_id = create_modis_sharpening_workflow(token, 'project')
+	bad_body = payload_catalog.body(MODIS_SHARPENING_TEST_JSON_FILE_INVALID)
+	res = create_and_run_job_for_workflow(token, 'project', workflow_id, bad_body, validate=False)
+	assert res.status_code == 400 and 'something' in response_body(res)['error']['message']
+	assert create_and_run_job_for_workflow(token, 'project', workflow_id, body).status_code == 200
+
+def test_tokens_are_checked(fake_up42_server):
+	token = get_access_token('project', 'key')
+	assert get_workflows('not-a-token', 'project').status_code == 401
+	assert get_workflows(token, 'other-project').status_code == 403
+	assert get_workflows(token, 'project').status_code == 200
+
+def test_latency_error_rate_and_rate_limit_knobs(fake_up42_server):
+	token = get_access_token('project', 'key')
+
+	fake_up42_server.latency = {'get_workflows': 0.05}
+	start = time.perf_counter()
+	assert get_workflows(token, 'project').status_code == 200
+	assert time.perf_counter() - start >= 0.05
+
+	#Create Workflow is not retried, so the injected failure reaches the caller
+	fake_up42_server.error_rates = {'create_workflow': 1}
+	assert create_workflow(token, 'project', 'apitest-fake', 'fake').status_code == 500
+	assert fake_up42_server.request_counts()['create_workflow'] == 1
+
+	#At most one Get Jobs per second, at least one of three quick calls falls in a used up window
+	fake_up42_server.rate_limits = {'get_jobs': 1}
+	statuses = [get_jobs(token, 'project') for i in range(3)]
+	assert [res.status_code for res in statuses].count(429) >= 1
+	assert all(res.headers['Retry-After'] == '1' for res in statuses if res.status_code == 429)
+
+def test_job_timeline(fake_up42_server, payload_catalog):
+	fake_up42_server.job_timeline = [('PENDING', 0), ('RUNNING', 0.05), ('FAILED', 0.1)]
+	token = get_access_token('project', 'key')
+	workflow_id = create_modis_sharpening_workflow(token, 'project')
+
+	res = create_and_run_job_for_workflow(token, 'project', workflow_id, payload_catalog.body(MODIS_SHARPENING_TEST_JSON_FILE))
+	job = Job.from_response(res)
+	assert job.status == 'PENDING'
+
+	result = wait_for_job(token, 'project', job.id, 5)
+	assert result.status == 'FAILED' and not result.succeeded
+	assert Job.from_response(check_job_status(token, 'project', job.id)).status == 'FAILED'
+	#Results are only published for succeeded jobs
+	task = TaskList.from_response(get_job_tasks(token, 'project', job.id)).tasks[0]
+	assert get_task_download_url(token, 'project', job.id, task.id).status_code == 404
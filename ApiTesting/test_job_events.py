@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+import urllib.error
+
+import pytest
+
+from doubles import api_response, scripted
+from Modules.job_events import *
+
+def scripted_statuses(statuses):
+	#Check Job Status answering every check with the next status of the list, repeating the last one
+	return scripted([api_response(200, {'status': status}) for status in statuses])
+
+def emit_later(url, job_id, status, delay, **kwargs):
+	timer = threading.Timer(delay, emit_job_event, (url, job_id, status), kwargs)
+	timer.start()
+	return timer
+
+def test_event_resolves_future():
+	"""
+		Verify that a terminal event resolves the job's future, including events received before anyone waited
+	"""
+	with JobEventListener() as listener:
+		assert emit_job_event(listener.url, 'early', 'SUCCEEDED') == 204
+		assert listener.future('early').result(timeout=1) == 'SUCCEEDED'
+
+		future = listener.future('job')
+		emit_job_event(listener.url, 'job', 'RUNNING')
+		assert not future.done() and listener.status('job') == 'RUNNING'
+		emit_job_event(listener.url, 'job', 'FAILED')
+		assert future.result(timeout=1) == 'FAILED'
+		#Late, out of order events do not undo a terminal status
+		emit_job_event(listener.url, 'job', 'RUNNING')
+		assert listener.status('job') == 'FAILED'
+
+def test_unsigned_events_are_rejected_when_a_secret_is_set():
+	with JobEventListener(secret='s3cret') as listener:
+		with pytest.raises(urllib.error.HTTPError) as e:
+			emit_job_event(listener.url, 'job', 'SUCCEEDED', secret='wrong')
+		assert e.value.code == 401
+		assert emit_job_event(listener.url, 'job', 'SUCCEEDED', secret='s3cret') == 204
+		assert listener.status('job') == 'SUCCEEDED'
+
+def test_wait_ends_on_event_without_polling():
+	"""
+		Verify that a wait ends as soon as the event arrives, after a single status check
+	"""
+	with JobEventListener() as listener:
+		status_fn = scripted_statuses(['RUNNING'])
+		poller = EventJobPoller(listener, fallback_delay=30, status_fn=status_fn)
+		timers = [emit_later(listener.url, f'job-{i}', 'SUCCEEDED', 0.05) for i in range(20)]
+		results = poller.poll_many('token', 'project', [f'job-{i}' for i in range(20)], 10)
+		for timer in timers:
+			timer.join()
+
+	assert all(result.succeeded for result in results.values())
+	assert max(result.elapsed for result in results.values()) < 5
+	assert len(status_fn.calls) == 20
+
+def test_lost_event_falls_back_to_polling():
+	"""
+		Verify that a job whose event never arrives is still seen finishing by the fallback checks
+	"""
+	with JobEventListener() as listener:
+		status_fn = scripted_statuses(['RUNNING', 'RUNNING', 'SUCCEEDED'])
+		result = EventJobPoller(listener, fallback_delay=0.05, status_fn=status_fn).poll('token', 'project', 'job', 10)
+
+	assert result.succeeded and result.polls == 3
+
+def test_concurrent_waits_on_one_job():
+	"""
+		Verify that a wait ending on one job does not drop the future another wait on the same job still needs
+	"""
+	with JobEventListener() as listener:
+		results = {}
+		def poll(name, max_wait_seconds):
+			poller = EventJobPoller(listener, fallback_delay=30, status_fn=scripted_statuses(['RUNNING']))
+			results[name] = poller.poll('token', 'project', 'job', max_wait_seconds)
+
+		threads = [threading.Thread(target=poll, args=('short', 0.1)), threading.Thread(target=poll, args=('long', 10))]
+		for t in threads:
+			t.start()
+		threads[0].join()
+		emit_job_event(listener.url, 'job', 'SUCCEEDED')
+		threads[1].join()
+
+		assert results['short'].timed_out
+		assert results['long'].succeeded and results['long'].elapsed < 5
+		#Both waits are over, so the listener keeps nothing about the job
+		assert listener.status('job') is None and not listener.waiters
+
+def test_wait_times_out_at_deadline():
+	with JobEventListener() as listener:
+		result = EventJobPoller(listener, fallback_delay=30, status_fn=scripted_statuses(['RUNNING'])).poll('token', 'project', 'job', 0.2)
+
+	assert result.timed_out and result.status == 'RUNNING'
+	assert result.polls == 2
+
+def test_await_job_event():
+	with JobEventListener() as listener:
+		timer = emit_later(listener.url, 'job', 'CANCELLED', 0.05)
+		assert asyncio.run(listener.wait('job', timeout=5)) == 'CANCELLED'
+		timer.join()
+
+def test_fake_server_sends_job_events():
+	"""
+		Verify that the fake server sends an event for every step of a job's timeline
+	"""
+	from Modules.fake_up42_server import FakeUP42Server
+
+	with JobEventListener() as listener, FakeUP42Server(webhook_url=listener.url) as server:
+		job = {'id': 'job', 'projectId': 'project', 'workflowId': 'workflow', 'created': time.time(),
+			'timeline': [('PENDING', 0), ('RUNNING', 0.01), ('SUCCEEDED', 0.02)]}
+		server.schedule_events(job)
+		assert listener.future('job').result(timeout=5) == 'SUCCEEDED'
@@ -0,0 +1,115 @@
+import base64
+import hashlib
+import os
+
+from doubles import FakeClock, FakeResponse, api_response
+from Modules.job_outputs import *
+
+class FakeStorageClient:
+	"""
+		Serves one archive per task. drops lists, per download request, the offset after which the connection breaks (None for no break).
+		announced_md5 replaces the md5 announced in x-goog-hash, False announces none.
+	"""
+	def __init__(self, archives, drops=(), honour_range=True, announced_md5=None):
+		self.archives = archives
+		self.drops = list(drops)
+		self.honour_range = honour_range
+		self.announced_md5 = announced_md5
+		self.ranges = []
+
+	def get_job_tasks(self, token, project_id, job_id):
+		tasks = [{'id': task_id, 'name': f'task:{i}', 'blockId': 'block', 'status': 'SUCCEEDED'} for i, task_id in enumerate(self.archives)]
+		return api_response(200, tasks)
+
+	def get_task_download_url(self, token, project_id, job_id, task_id):
+		return api_response(200, {'url': f'signed://{task_id}'})
+
+	def stream_download(self, url, start=0):
+		content = self.archives[url[len('signed://'):]]
+		self.ranges.append(start)
+		md5 = self.announced_md5 or base64.b64encode(hashlib.md5(content).digest()).decode()
+		headers = {'x-goog-hash': f'crc32c=AAAAAA==,md5={md5}'} if self.announced_md5 is not False else {}
+		drop_after = self.drops.pop(0) if self.drops else None
+		if start and self.honour_range:
+			headers['Content-Range'] = f'bytes {start}-{len(content) - 1}/{len(content)}'
+			return FakeResponse(206, content[start:], headers, drop_after)
+		return FakeResponse(200, content, headers, drop_after)
+
+def test_interrupted_download_resumes_with_range(tmp_path):
+	"""
+		Verify that a download broken midway resumes from the partial file, and that the whole archive is verified
+	"""
+	content = os.urandom(10000)
+	client = FakeStorageClient({'task': content}, drops=[4096])
+	clock = FakeClock()
+	downloader = JobOutputDownloader(chunk_size=1024, backoff=0.5, client=client, sleep=clock.sleep)
+	result = downloader.download('token', 'project', 'job', JobOutput('task'), str(tmp_path / 'task.tar.gz'))
+
+	assert result.succeeded, result.error
+	assert result.attempts == 2 and result.resumed_from == 4096
+	assert len(clock.sleeps) == 1 and 0 <= clock.sleeps[0] <= 0.5
+	assert client.ranges == [0, 4096]
+	assert result.verified and result.checksum == hashlib.md5(content).hexdigest()
+	assert (tmp_path / 'task.tar.gz').read_bytes() == content
+	assert not (tmp_path / 'task.tar.gz.part').exists()
+
+def test_ignored_range_restarts_download(tmp_path):
+	"""
+		Verify that a server answering 200 to a Range request does not leave a corrupted archive
+	"""
+	content = os.urandom(5000)
+	client = FakeStorageClient({'task': content}, drops=[2048], honour_range=False)
+	result = JobOutputDownloader(chunk_size=1024, client=client, sleep=FakeClock().sleep).download('token', 'project', 'job', JobOutput('task'), str(tmp_path / 'a'))
+
+	assert result.succeeded and result.verified
+	assert result.resumed_from == 0
+	assert (tmp_path / 'a').read_bytes() == content
+
+def test_checksum_mismatch_is_reported(tmp_path):
+	"""
+		Verify that an archive not matching the announced md5 is discarded and reported
+	"""
+	client = FakeStorageClient({'task': b'corrupted'}, announced_md5=base64.b64encode(hashlib.md5(b'original').digest()).decode())
+	result = JobOutputDownloader(max_attempts=2, client=client, sleep=FakeClock().sleep).download('token', 'project', 'job', JobOutput('task'), str(tmp_path / 'a'))
+
+	assert not result.succeeded and result.verified is False
+	assert 'Checksum mismatch' in result.error
+	assert result.attempts == 2
+	assert not (tmp_path / 'a').exists() and not (tmp_path / 'a.part').exists()
+
+def test_unannounced_checksum_is_not_verified(tmp_path):
+	"""
+		Verify that without an announced md5 the archive is kept but left unverified
+	"""
+	client = FakeStorageClient({'task': b'archive'}, announced_md5=False)
+	result = JobOutputDownloader(client=client).download('token', 'project', 'job', JobOutput('task'), str(tmp_path / 'a'))
+
+	assert result.succeeded and result.verified is None
+	assert result.checksum == hashlib.md5(b'archive').hexdigest()
+
+def test_attempts_back_off_up_to_the_bound(tmp_path):
+	"""
+		Verify that every retry waits, with delays bounded by the exponential backoff and max_backoff
+	"""
+	client = FakeStorageClient({'task': os.urandom(4096)}, drops=[0, 0, 0, 0, 0])
+	clock = FakeClock()
+	downloader = JobOutputDownloader(chunk_size=1024, max_attempts=6, backoff=1, max_backoff=3, client=client, sleep=clock.sleep)
+	result = downloader.download('token', 'project', 'job', JobOutput('task'), str(tmp_path / 'a'))
+
+	assert result.succeeded and result.attempts == 6
+	assert [delay <= bound for delay, bound in zip(clock.sleeps, (1, 2, 3, 3, 3))] == [True] * 5 and len(clock.sleeps) == 5
+
+def test_download_all_and_open_artifact(tmp_path):
+	"""
+		Verify that every task is downloaded in parallel and can be read through the memory-mapped reader
+	"""
+	archives = {f'task-{i}': os.urandom(3000 + i) for i in range(6)}
+	downloader = JobOutputDownloader(chunk_size=512, max_workers=3, client=FakeStorageClient(archives))
+	results = downloader.download_all('token', 'project', 'job', str(tmp_path))
+
+	assert sorted(results) == sorted(archives)
+	for task_id, result in results.items():
+		assert result.succeeded and result.bytes == len(archives[task_id])
+		with open_artifact(result.path) as view:
+			assert view[:16] == archives[task_id][:16]
+			assert len(view) == len(archives[task_id])
@@ -0,0 +1,82 @@
+from doubles import FakeClock, api_response
+from Modules.job_poller import *
+
+def scripted_status_fn(clock, timelines):
+	"""
+		Returns a status function that answers from a per-job timeline of (start_time, status_code, status)
+	"""
+	calls = []
+	def status_fn(token, project_id, job_id):
+		calls.append((clock.now, job_id))
+		current = None
+		for start, status_code, status in timelines[job_id]:
+			if clock.now >= start:
+				current = api_response(status_code, {'status': status})
+		return current
+	status_fn.calls = calls
+	return status_fn
+
+def make_poller(timelines):
+	clock = FakeClock()
+	status_fn = scripted_status_fn(clock, timelines)
+	poller = JobPoller(status_fn=status_fn, clock=clock, sleep=clock.sleep)
+	return poller, status_fn
+
+def test_poller_returns_immediately_on_failed_job():
+	"""
+		Verify that a FAILED job ends the wait at once instead of polling until the timeout
+	"""
+	poller, status_fn = make_poller({'job': [(0, 200, 'RUNNING'), (5, 200, 'FAILED')]})
+	result = poller.poll('token', 'project', 'job', 300)
+	assert result.status == 'FAILED'
+	assert not result.succeeded and not result.timed_out
+	assert result.elapsed < 60, f"Wait lasted {result.elapsed} seconds"
+	assert result.polls == len(status_fn.calls)
+
+def test_poller_times_out_at_deadline():
+	"""
+		Verify that a job that never finishes is reported as timed out, with a last check at the deadline
+	"""
+	poller, status_fn = make_poller({'job': [(0, 200, 'RUNNING')]})
+	result = poller.poll('token', 'project', 'job', 100)
+	assert result.timed_out and result.status == 'RUNNING'
+	assert status_fn.calls[-1][0] == 100
+
+def test_poller_handles_http_errors():
+	"""
+		Verify that 5xx responses are retried while a 404 ends the wait with an error
+	"""
+	poller, status_fn = make_poller({'job': [(0, 503, None), (10, 200, 'SUCCEEDED')]})
+	assert poller.poll('token', 'project', 'job', 300).succeeded
+
+	poller, status_fn = make_poller({'job': [(0, 404, None)]})
+	result = poller.poll('token', 'project', 'job', 300)
+	assert result.polls == 1 and not result.succeeded
+	assert '404' in result.error
+
+def test_poller_watches_many_jobs_in_one_loop():
+	"""
+		Verify that poll_many returns a result per job and learns the expected duration
+	"""
+	timelines = {
+		'fast': [(0, 200, 'RUNNING'), (10, 200, 'SUCCEEDED')],
+		'slow': [(0, 200, 'RUNNING'), (40, 200, 'SUCCEEDED')],
+		'cancelled': [(0, 200, 'CANCELLED')],
+	}
+	poller, status_fn = make_poller(timelines)
+	results = poller.poll_many('token', 'project', list(timelines), 300)
+	assert results['fast'].succeeded and results['slow'].succeeded
+	assert results['cancelled'].status == 'CANCELLED' and results['cancelled'].polls == 1
+	assert results['fast'].elapsed < results['slow'].elapsed
+	assert poller.policy.expected_duration() is not None
+
+def test_backoff_policy_stays_in_bounds():
+	"""
+		Verify that every delay stays between the minimum and maximum delay (including jitter)
+	"""
+	policy = BackoffPolicy(min_delay=1, max_delay=10, jitter=0.2)
+	for polls in range(1, 30):
+		assert 0.8 <= policy.next_delay(polls, polls * 5) <= 12
+	policy.observe(100)
+	assert policy.next_delay(1, 0) >= 8, "Should sleep through most of the expected duration"
+	assert policy.next_delay(10, 99) <= 1.2, "Should check often around the expected completion"
@@ -0,0 +1,139 @@
+import threading
+
+from doubles import FakeClock, api_response
+from Modules.api_helper import get_access_token
+from Modules.constants import *
+from Modules.job_scheduler import *
+
+class FakeJobsApi:
+	"""
+		Records created jobs and answers Create and Run Job from a script of outcomes:
+		'ok', 'throttle', 'created-then-500' (job created, but a 500 returned), '500', '400', 'drop' (connection error)
+		or 'bad-shape' (a 200 without the job in its body)
+	"""
+	def __init__(self, script, retry_after='2'):
+		self.script = list(script)
+		self.retry_after = retry_after
+		self.jobs = []
+		self.create_calls = 0
+		self.list_calls = 0
+		self.lock = threading.Lock()
+
+	def create(self, token, project_id, workflow_id, request_body, name):
+		with self.lock:
+			self.create_calls += 1
+			outcome = self.script.pop(0) if self.script else 'ok'
+			if outcome == 'throttle':
+				return api_response(429, error={'code': 'TOO_MANY_REQUESTS', 'message': 'Slow down'}, headers={'Retry-After': self.retry_after})
+			if outcome == '400':
+				return api_response(400, error={'code': 'BAD_REQUEST', 'message': 'Invalid schema'})
+			if outcome == '500':
+				return api_response(500)
+			if outcome == 'drop':
+				raise ConnectionError('Connection reset by peer')
+			if outcome == 'bad-shape':
+				return api_response(200, data={'unexpected': True})
+			job = {'id': f'job-{len(self.jobs)}', 'name': name, 'workflowId': workflow_id}
+			self.jobs.append(job)
+			if outcome == 'created-then-500':
+				return api_response(500)
+			return api_response(200, data=job)
+
+	def list(self, token, project_id):
+		with self.lock:
+			self.list_calls += 1
+			return api_response(200, data=list(self.jobs))
+
+def make_scheduler(api, max_workers=1):
+	clock = FakeClock()
+	bucket = TokenBucket(rate=5, burst=5, clock=clock, sleep=clock.sleep)
+	scheduler = JobScheduler(max_workers=max_workers, bucket=bucket, create_fn=api.create, list_fn=api.list, sleep=clock.sleep)
+	return scheduler, bucket, clock
+
+def test_throttled_submission_waits_for_retry_after():
+	"""
+		Verify that a 429 slows the bucket down, pauses for Retry-After, and that the retry succeeds
+	"""
+	api = FakeJobsApi(['throttle', 'ok'], retry_after='2')
+	scheduler, bucket, clock = make_scheduler(api)
+	results = list(scheduler.submit('token', 'project', [('workflow', {})]))
+
+	assert [r.job_id for r in results] == ['job-0']
+	assert results[0].attempts == 2
+	assert clock.now >= 2
+	assert bucket.rate < bucket.max_rate
+
+def test_retry_after_unknown_outcome_does_not_duplicate_job():
+	"""
+		Verify that when a job was created but the answer was lost, the retry finds it by name instead of creating another one
+	"""
+	for outcome in ('created-then-500', 'drop'):
+		api = FakeJobsApi([outcome, 'ok'])
+		scheduler, bucket, clock = make_scheduler(api)
+		result = next(scheduler.submit('token', 'project', [JobSubmission('workflow', {}, name='apitest-job-1')]))
+
+		assert result.succeeded
+		if outcome == 'created-then-500':
+			assert result.recovered and result.attempts == 1
+			assert len(api.jobs) == 1
+		else:
+			#Nothing was created by the dropped request, so the job is submitted again
+			assert not result.recovered and result.attempts == 2
+			assert len(api.jobs) == 1
+
+def test_client_error_is_reported_without_retry():
+	"""
+		Verify that a 400 ends the submission with a structured error
+	"""
+	api = FakeJobsApi(['400'])
+	scheduler, bucket, clock = make_scheduler(api)
+	result = next(scheduler.submit('token', 'project', [('workflow', {'bad': True})]))
+
+	assert not result.succeeded
+	assert result.status_code == 400 and result.attempts == 1
+	assert result.error == {'code': 'BAD_REQUEST', 'message': 'Invalid schema'}
+
+def test_results_stream_for_every_submission():
+	"""
+		Verify that a large batch through several workers yields one result per submission, paced by the bucket
+	"""
+	api = FakeJobsApi(['throttle', '500', 'drop'], retry_after='0')
+	bucket = TokenBucket(rate=10000, burst=50)
+	scheduler = JobScheduler(max_workers=8, retry_delay=0, bucket=bucket, create_fn=api.create, list_fn=api.list, sleep=lambda seconds: None)
+	bucket.sleep = lambda seconds: None
+	results = list(scheduler.submit('token', 'project', [(f'workflow-{i}', {}) for i in range(200)]))
+
+	assert sorted(r.index for r in results) == list(range(200))
+	assert all(r.succeeded for r in results)
+	assert len({r.job_id for r in results}) == 200 == len(api.jobs)
+
+def test_unexpected_body_is_reported_on_its_submission():
+	"""
+		Verify that a 200 whose body is not a job ends only that submission, with a structured error
+	"""
+	api = FakeJobsApi(['bad-shape'])
+	scheduler, bucket, clock = make_scheduler(api)
+	results = sorted(scheduler.submit('token', 'project', [('workflow-0', {}), ('workflow-1', {})]), key=lambda r: r.index)
+
+	assert len(results) == 2
+	assert not results[0].succeeded and results[0].status_code == 200 and results[0].attempts == 1
+	assert results[0].error['code'] == 'ResponseShapeError' and "missing field 'id'" in results[0].error['message']
+	assert results[1].succeeded
+
+def test_parameters_are_validated_before_submission(fake_up42_server, payload_catalog):
+	"""
+		Verify that the default scheduler sends the jobs through the api_helper, so invalid parameters never reach the API
+	"""
+	token = get_access_token('project', 'key')
+	bad_body = payload_catalog.body(MODIS_SHARPENING_TEST_JSON_FILE_INVALID)
+	result = next(JobScheduler(max_workers=1).submit(token, 'project', [('workflow', bad_body)]))
+
+	assert not result.succeeded and result.attempts == 1 and result.status_code is None
+	assert result.error['code'] == 'PayloadValidationError'
+	assert 'create_job' not in fake_up42_server.request_counts()
+
+def test_parse_retry_after():
+	assert parse_retry_after('3') == 3
+	assert parse_retry_after(None) is None
+	assert parse_retry_after('soon') is None
+	assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0
@@ -0,0 +1,43 @@
+from Modules.load_driver import HISTOGRAM_BUCKETS_MS, LIFECYCLE_STAGES, LoadDriver
+
+def check_stages(report, lifecycles):
+	#Every stage ran once per lifecycle, and its histogram accounts for every sample
+	assert set(report['stages']) == set(LIFECYCLE_STAGES)
+	for stage, summary in report['stages'].items():
+		assert summary['count'] == lifecycles, stage
+		assert sum(summary['histogram'].values()) == lifecycles, stage
+		assert set(summary['histogram']) <= {f'<={bound}ms' for bound in HISTOGRAM_BUCKETS_MS} | {f'>{HISTOGRAM_BUCKETS_MS[-1]}ms'}
+		assert summary['p50_ms'] <= summary['p95_ms'] <= summary['max_ms']
+
+def test_closed_loop_report(fake_up42_server):
+	"""
+		Verify the report of a closed-loop run, then of a run whose Add Tasks calls all fail
+	"""
+	report = LoadDriver('project', 'key', max_wait_seconds=5).run_closed_loop(concurrency=2, iterations=4)
+	assert report['settings'] == {'mode': 'closed', 'concurrency': 2, 'iterations': 4, 'duration': None}
+	assert report['lifecycles'] == {'total': 4, 'completed': 4, 'failed': 0}
+	assert report['errors'] == {} and report['throughput_per_second'] > 0
+	assert report['projects']['keys']['leases'] == 4
+	check_stages(report, 4)
+	assert not fake_up42_server.workflows
+
+	fake_up42_server.error_rates = {'add_tasks': 1}
+	report = LoadDriver('project', 'key', max_wait_seconds=5).run_closed_loop(concurrency=2, iterations=3)
+	assert report['lifecycles'] == {'total': 3, 'completed': 0, 'failed': 3}
+	assert report['errors'] == {'add_tasks_to_workflow: status 500': 3}
+	assert report['stages']['create_and_run_job']['count'] == 0
+	assert report['stages']['delete_workflow']['count'] == 3
+	assert not fake_up42_server.workflows
+
+def test_open_loop_report(fake_up42_server):
+	"""
+		Verify that an open-loop run starts lifecycles at the requested rate and reports them
+	"""
+	fake_up42_server.latency = {'create_workflow': 0.02}
+	report = LoadDriver('project', 'key', max_wait_seconds=5).run_open_loop(rate=20, duration=0.25, max_in_flight=8)
+	assert report['settings'] == {'mode': 'open', 'rate': 20, 'duration': 0.25, 'max_in_flight': 8}
+	assert report['lifecycles'] == {'total': 5, 'completed': 5, 'failed': 0}
+	assert report['wall_seconds'] >= 0.2
+	check_stages(report, 5)
+	assert report['stages']['create_workflow']['p50_ms'] >= 20
+	assert report['stages']['create_workflow']['histogram'].get('<=10ms', 0) == 0
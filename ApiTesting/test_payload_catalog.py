@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+from Modules.constants import *
+from Modules.payload_catalog import *
+
+@pytest.fixture()
+def catalog():
+	return PayloadCatalog()
+
+def test_payloads_are_read_once_and_frozen(catalog, monkeypatch):
+	"""
+		Verify that the payloads are read once, that get() is read-only and that body() returns independent copies
+	"""
+	payload = catalog.get(MODIS_SHARPENING_TEST_JSON_FILE)
+	assert sorted(catalog.names()) == ['modis_sharpening_job', 'modis_sharpening_job_bad_schema']
+	monkeypatch.setattr('builtins.open', None)
+	assert catalog.get('modis_sharpening_job') is payload
+
+	with pytest.raises(TypeError):
+		payload['sharpening:1']['strength'] = 'strong'
+	body = catalog.body('modis_sharpening_job')
+	body['sharpening:1']['strength'] = 'strong'
+	assert payload['sharpening:1']['strength'] == 'medium'
+	assert catalog.body('modis_sharpening_job')['nasa-modis:1']['bbox'] == [13.365373, 52.49582, 13.385796, 52.510455]
+	json.dumps(body)
+
+	with pytest.raises(KeyError, match='known payloads'):
+		catalog.get('missing')
+
+def test_test_data_is_validated(catalog):
+	assert catalog.errors(MODIS_SHARPENING_TEST_JSON_FILE) == []
+	errors = catalog.errors(MODIS_SHARPENING_TEST_JSON_FILE_INVALID)
+	assert "nasa-modis:1: unknown nasa-modis parameter 'something'" in errors
+	assert any('needs one of' in error for error in errors)
+	with pytest.raises(PayloadValidationError):
+		catalog.body(MODIS_SHARPENING_TEST_JSON_FILE_INVALID, validate=True)
+
+@pytest.mark.parametrize('task, parameter, value, message', [
+	('nasa-modis:1', 'bbox', [13.4, 52.5, 13.3, 52.6], 'min_lon < max_lon'),
+	('nasa-modis:1', 'bbox', [13.3, 52.5], 'expected [min_lon'),
+	('nasa-modis:1', 'time', '2020-12-31T00:00:00+00:00/2018-12-01T00:00:00+00:00', 'starts after it ends'),
+	('nasa-modis:1', 'time', 'yesterday', 'ISO 8601 range'),
+	('nasa-modis:1', 'zoom_level', 12, 'between 0 and 9'),
+	('nasa-modis:1', 'zoom_level', '9', 'expected an integer'),
+	('nasa-modis:1', 'imagery_layers', [], 'at least 1'),
+	('sharpening:1', 'strength', 'extreme', "one of 'light'"),
+])
+def test_block_schemas_reject_bad_parameters(catalog, task, parameter, value, message):
+	body = catalog.body(MODIS_SHARPENING_TEST_JSON_FILE)
+	body[task][parameter] = value
+	errors = validate_job_parameters(body, catalog.schemas)
+	assert len(errors) == 1 and message in errors[0] and errors[0].startswith(f'{task}.{parameter}')
+
+def test_variants_share_unchanged_tasks(catalog):
+	"""
+		Verify that variants cover every combination, copy only the tasks they change, and are validated
+	"""
+	variants = list(catalog.variants(MODIS_SHARPENING_TEST_JSON_FILE,
+		{'sharpening:1.strength': SHARPENING_STRENGTHS, 'nasa-modis:1.zoom_level': (8, 9)}))
+	assert [variant_id for variant_id, _ in variants][:2] == ['light-8', 'light-9']
+	assert len({(p['sharpening:1']['strength'], p['nasa-modis:1']['zoom_level']) for _, p in variants}) == 6
+
+	only_strength = [p for _, p in catalog.variants('modis_sharpening_job', {'sharpening:1.strength': ('light', 'strong')})]
+	assert only_strength[0]['nasa-modis:1'] is only_strength[1]['nasa-modis:1']
+	assert only_strength[0]['sharpening:1'] is not only_strength[1]['sharpening:1']
+
+	with pytest.raises(PayloadValidationError):
+		list(catalog.variants('modis_sharpening_job', {'nasa-modis:1.zoom_level': (9, 20)}))
+	bad = list(catalog.variants('modis_sharpening_job', {'nasa-modis:1.zoom_level': (20,)}, validate=False))
+	assert bad[0][1]['nasa-modis:1']['zoom_level'] == 20
+
+def test_presubmission_validation_and_bypass(catalog):
+	"""
+		Verify that with validation on, invalid parameters are rejected before any request, unless validate=False
+	"""
+	api_helper = pytest.importorskip('Modules.api_helper')
+	sent = []
+
+	class Client:
+		def create_and_run_job_for_workflow(self, *args):
+			sent.append(args)
+			return 'response'
+
+	previous_client = api_helper.set_default_client(Client())
+	previous = set_payload_validation(True)
+	try:
+		bad = catalog.body(MODIS_SHARPENING_TEST_JSON_FILE_INVALID)
+		with pytest.raises(PayloadValidationError):
+			api_helper.create_and_run_job_for_workflow('token', 'project', 'workflow', bad)
+		assert sent == []
+		assert api_helper.create_and_run_job_for_workflow('token', 'project', 'workflow', bad, validate=False) == 'response'
+		assert api_helper.create_and_run_job_for_workflow('token', 'project', 'workflow', catalog.body('modis_sharpening_job')) == 'response'
+		assert len(sent) == 2
+	finally:
+		set_payload_validation(previous)
+		api_helper.set_default_client(previous_client)
@@ -0,0 +1,43 @@
+from Modules.call_timing import *
+from Modules.perf_report import build_report, find_regressions
+
+def make_record(endpoint, total, status=200, connect=0.0):
+	record = CallRecord(endpoint, 'GET')
+	record.status = status
+	record.total = total
+	record.ttfb = total / 2
+	record.connect = connect
+	return record
+
+def test_track_hands_records_to_listeners():
+	"""
+		Verify that track() times the call, restores the outer call, and notifies listeners
+	"""
+	records = []
+	add_call_listener(records.append)
+	try:
+		with track('create_workflow', 'POST') as outer:
+			with track('get_access_token', 'POST'):
+				assert current_call().endpoint == 'get_access_token'
+			assert current_call() is outer
+		assert current_call() is None
+	finally:
+		remove_call_listener(records.append)
+	assert [r.endpoint for r in records] == ['get_access_token', 'create_workflow']
+	assert records[1].total >= records[0].total
+
+def test_report_and_baseline_regression():
+	"""
+		Verify the per-endpoint aggregation, and that only p95 increases past the threshold are reported
+	"""
+	baseline = build_report([make_record('check_job_status', 0.100, connect=0.01) for i in range(20)])
+	stats = baseline['endpoints']['check_job_status']
+	assert stats['calls'] == 20 and stats['new_connections'] == 20
+	assert stats['total']['p95_ms'] == 100
+
+	slightly_slower = build_report([make_record('check_job_status', 0.110) for i in range(20)])
+	assert find_regressions(slightly_slower, baseline, 0.2) == []
+
+	much_slower = build_report([make_record('check_job_status', 0.200) for i in range(20)] + [make_record('delete_workflow', 5)])
+	messages = find_regressions(much_slower, baseline, 0.2)
+	assert len(messages) == 1 and messages[0].startswith('check_job_status')
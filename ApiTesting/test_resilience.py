@@ -0,0 +1,133 @@
+import threading
+
+import pytest
+
+from doubles import FakeClock, FakeResponse, scripted
+from Modules.call_timing import CallRecord
+from Modules.resilience import *
+
+def test_idempotent_calls_are_retried_with_bounded_backoff():
+	"""
+		Verify that transport errors and 5xx answers are retried with growing, bounded delays, and counted
+	"""
+	clock = FakeClock()
+	resilience = Resilience(max_attempts=4, backoff=0.5, max_backoff=1, sleep=clock.sleep)
+	send = scripted([TimeoutError('read timed out'), FakeResponse(503), ConnectionError('reset'), FakeResponse(200)])
+	record = CallRecord('check_job_status', 'GET')
+
+	assert resilience.call('check_job_status', send, record).status_code == 200
+	assert send.calls == [(ENDPOINT_TIMEOUTS['check_job_status'],)] * 4
+	assert record.retries == 3 and resilience.counters()['check_job_status']['retries'] == 3
+	assert [delay <= bound for delay, bound in zip(clock.sleeps, (0.5, 1, 1))] == [True] * 3
+
+def test_exhausted_and_non_idempotent_calls():
+	resilience = Resilience(max_attempts=2, sleep=FakeClock().sleep)
+	assert resilience.call('get_workflows', scripted([FakeResponse(500)])).status_code == 500
+	with pytest.raises(TimeoutError):
+		resilience.call('get_specific_workflow', scripted([TimeoutError()]))
+
+	#A create is never sent twice
+	send = scripted([FakeResponse(502)])
+	assert resilience.call('create_workflow', send).status_code == 502
+	assert len(send.calls) == 1
+	assert resilience.timeout('create_workflow') == (DEFAULT_CONNECT_TIMEOUT_SECONDS, DEFAULT_READ_TIMEOUT_SECONDS)
+
+def test_slow_call_is_hedged_and_first_answer_wins():
+	"""
+		Verify that a call slower than the learned percentile sends a duplicate, and that the faster answer is used
+	"""
+	resilience = Resilience(hedge_min_samples=5, hedge_min_delay=0.01)
+	for i in range(10):
+		resilience.latency.observe('check_job_status', 0.01)
+	assert resilience.hedge_delay('check_job_status') == 0.01
+	assert resilience.hedge_delay('delete_workflow') is None
+
+	release = threading.Event()
+	slow = FakeResponse()
+	hedge = FakeResponse()
+	calls = []
+	def send(timeout):
+		calls.append(timeout)
+		if len(calls) == 1:
+			release.wait(5)
+			return slow
+		return hedge
+
+	record = CallRecord('check_job_status', 'GET')
+	assert resilience.call('check_job_status', send, record) is hedge
+	release.set()
+	resilience.close()
+	resilience.executor.shutdown(wait=True)
+	assert slow.closed
+	assert record.hedges == 1
+	counters = resilience.counters()['check_job_status']
+	assert counters['hedges'] == 1 and counters['hedge_wins'] == 1 and counters['retries'] == 0
+
+def test_fast_calls_are_not_hedged():
+	resilience = Resilience(hedge_min_samples=5, hedge_min_delay=1)
+	for i in range(10):
+		resilience.latency.observe('get_jobs', 0.001)
+	send = scripted([FakeResponse()])
+	for i in range(5):
+		resilience.call('get_jobs', send)
+	assert len(send.calls) == 5 and resilience.counters()['get_jobs']['hedges'] == 0
+
+def test_circuit_breaker_fails_fast_then_recovers():
+	"""
+		Verify that consecutive failures open the circuit, that calls are then rejected without being sent,
+		and that a successful trial call after the reset timeout closes it again
+	"""
+	clock = FakeClock()
+	resilience = Resilience(max_attempts=1, breaker=CircuitBreaker(failure_threshold=3, reset_timeout=10, clock=clock))
+	down = scripted([ConnectionError('refused')])
+	for i in range(3):
+		with pytest.raises(ConnectionError):
+			resilience.call('check_job_status', down)
+	assert resilience.breaker.state == CircuitBreaker.OPEN
+
+	with pytest.raises(CircuitOpenError):
+		resilience.call('check_job_status', down)
+	assert len(down.calls) == 3 and resilience.counters()['check_job_status']['rejected'] == 1
+
+	clock.now = 11
+	#One trial call at a time while half-open
+	assert resilience.breaker.allow() and not resilience.breaker.allow()
+	resilience.breaker.record_failure()
+	assert resilience.breaker.state == CircuitBreaker.OPEN
+
+	clock.now = 22
+	#4xx answers mean the API is up
+	assert resilience.call('check_job_status', scripted([FakeResponse(404)])).status_code == 404
+	assert resilience.breaker.state == CircuitBreaker.CLOSED
+
+def test_delete_retry_answering_404_is_a_success():
+	"""
+		Verify that a retried delete finding nothing left to delete reports the delete of the lost attempt,
+		while a 404 on the first attempt is still returned
+	"""
+	resilience = Resilience(sleep=FakeClock().sleep)
+	send = scripted([TimeoutError('read timed out'), FakeResponse(404)])
+	assert resilience.call('delete_workflow', send).status_code == 204
+	assert len(send.calls) == 2
+
+	assert resilience.call('delete_workflow', scripted([FakeResponse(404)])).status_code == 404
+	#Only deletes get this treatment
+	assert resilience.call('get_specific_workflow', scripted([FakeResponse(503), FakeResponse(404)])).status_code == 404
+
+def test_trial_call_raising_other_errors_does_not_block_the_circuit():
+	"""
+		Verify that a half-open trial call ending with a non-transport exception lets the next call be tried
+	"""
+	clock = FakeClock()
+	resilience = Resilience(max_attempts=1, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock))
+	with pytest.raises(ConnectionError):
+		resilience.call('check_job_status', scripted([ConnectionError('refused')]))
+	clock.now = 11
+
+	for error in (ValueError('bad body'), KeyboardInterrupt()):
+		with pytest.raises(type(error)):
+			resilience.call('check_job_status', scripted([error]))
+		assert resilience.breaker.state == CircuitBreaker.HALF_OPEN and not resilience.breaker.trial_in_flight
+
+	assert resilience.call('check_job_status', scripted([FakeResponse()])).status_code == 200
+	assert resilience.breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,97 @@
+import base64
+import json
+import threading
+import time
+
+import pytest
+
+from Modules.token_cache import *
+
+def make_jwt(expires_at):
+	#Builds an unsigned JWT-shaped token carrying only the exp claim
+	payload = base64.urlsafe_b64encode(json.dumps({'exp': expires_at}).encode()).decode().rstrip('=')
+	return f'header.{payload}.signature'
+
+class CountingFetch:
+	def __init__(self, lifetime=3600):
+		self.calls = 0
+		self.lifetime = lifetime
+		self.lock = threading.Lock()
+
+	def __call__(self, project_id, project_api_key):
+		with self.lock:
+			self.calls += 1
+			token = make_jwt(time.time() + self.lifetime) + str(self.calls)
+		return token, token_expiry(token, self.lifetime)
+
+def test_token_is_fetched_once_per_credentials():
+	"""
+		Verify that repeated and concurrent lookups for the same credentials share one fetch,
+		and that different credentials get their own token
+	"""
+	cache = TokenCache()
+	fetch = CountingFetch()
+
+	threads = [threading.Thread(target=cache.get, args=('project', 'key', fetch)) for i in range(8)]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	token = cache.get('project', 'key', fetch)
+	assert fetch.calls == 1, f"Expected a single fetch, got {fetch.calls}"
+	assert cache.credentials_for(token) == ('project', 'key')
+
+	cache.get('other-project', 'key', fetch)
+	assert fetch.calls == 2, f"Expected a fetch for the new credentials, got {fetch.calls}"
+
+def test_token_is_refreshed_before_expiry():
+	"""
+		Verify that a token inside the refresh margin is replaced, and that a stale token forces a refresh
+	"""
+	cache = TokenCache(refresh_margin=60)
+	fetch = CountingFetch(lifetime=30)
+	first = cache.get('project', 'key', fetch)
+	second = cache.get('project', 'key', fetch)
+	assert first != second, "Token about to expire should have been refreshed"
+
+	cache = TokenCache()
+	fetch = CountingFetch()
+	first = cache.get('project', 'key', fetch)
+	assert cache.get('project', 'key', fetch) == first
+	assert cache.get('project', 'key', fetch, stale_token=first) != first, "Stale token should have been refreshed"
+	assert fetch.calls == 2
+
+def test_token_fetch_failure_is_not_cached():
+	"""
+		Verify that a failing fetch raises TokenError and leaves nothing in the cache
+	"""
+	def failing_fetch(project_id, project_api_key):
+		raise TokenError('Get Access Token: Failure with status 401', 401)
+
+	cache = TokenCache()
+	with pytest.raises(TokenError):
+		cache.get('project', 'key', failing_fetch)
+
+	fetch = CountingFetch()
+	cache.get('project', 'key', fetch)
+	assert fetch.calls == 1
+
+def test_token_is_shared_through_disk_tier(tmp_path):
+	"""
+		Verify that two caches (standing in for two worker processes) pointing at the same file share one token
+	"""
+	path = str(tmp_path / 'tokens.json')
+	fetch = CountingFetch()
+	first = TokenCache(disk_path=path).get('project', 'key', fetch)
+	second = TokenCache(disk_path=path).get('project', 'key', fetch)
+	assert first == second
+	assert fetch.calls == 1
+	assert 'key' not in open(path).read(), "Credentials should not be written to disk"
+
+def test_token_expiry_sources():
+	"""
+		Verify the expiry is read from the JWT exp claim, then expires_in, then the default lifetime
+	"""
+	assert token_expiry(make_jwt(1234567890)) == 1234567890
+	assert abs(token_expiry('opaque', 100) - (time.time() + 100)) < 5
+	assert abs(token_expiry('opaque', default_ttl=50) - (time.time() + 50)) < 5
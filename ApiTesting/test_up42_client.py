@@ -0,0 +1,95 @@
+import socket
+import threading
+
+import pytest
+import urllib3.connection
+from urllib3.exceptions import NewConnectionError
+
+from Modules.api_helper import *
+from Modules.call_timing import CallRecord, add_call_listener, attach, remove_call_listener
+from Modules.token_cache import TokenCache
+from Modules.up42_client import _TimedHTTPConnection
+
+class CallLog:
+	#Keeps the CallRecords of the calls made while it is installed
+	def __init__(self):
+		self.records = []
+		self.lock = threading.Lock()
+
+	def __call__(self, record):
+		with self.lock:
+			self.records.append(record)
+
+	def __enter__(self):
+		add_call_listener(self)
+		return self
+
+	def __exit__(self, *exc_info):
+		remove_call_listener(self)
+
+	def new_connections(self):
+		#dns, connect and tls stay 0 when a call reuses a pooled connection
+		return sum(1 for record in self.records if record.connect > 0)
+
+def make_calls(count):
+	token = get_access_token('project', 'key')
+	workflow_id = Workflow.from_response(create_workflow(token, 'project', 'apitest-pool', 'pool')).id
+	for i in range(count):
+		assert get_specific_workflow(token, 'project', workflow_id).status_code == 200
+	assert delete_workflow(token, 'project', workflow_id).status_code == 204
+
+def test_helpers_reuse_the_pooled_connection(fake_up42_server):
+	"""
+		Verify that the api_helper functions go through the shared client, and that a thread making
+		calls back to back opens a single connection for all of them
+	"""
+	with CallLog() as log:
+		make_calls(20)
+	assert [record.endpoint for record in log.records] == ['get_access_token', 'create_workflow'] + ['get_specific_workflow'] * 20 + ['delete_workflow']
+	assert sum(fake_up42_server.request_counts().values()) == len(log.records) == 23
+	assert log.new_connections() == 1
+
+def test_parallel_threads_open_at_most_one_connection_each(fake_up42_server):
+	get_access_token('project', 'key')
+	with CallLog() as log:
+		threads = [threading.Thread(target=make_calls, args=(10,)) for i in range(4)]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+	assert len(log.records) == 4 * 12
+	assert 1 <= log.new_connections() <= 4
+
+def test_without_keep_alive_every_call_connects(fake_up42_server):
+	client = UP42Client(base_url=fake_up42_server.base_url, keep_alive=False, token_cache=TokenCache())
+	previous = set_default_client(client)
+	try:
+		with CallLog() as log:
+			make_calls(5)
+	finally:
+		set_default_client(previous)
+		client.close()
+	assert log.new_connections() == len(log.records) == 8
+
+def test_refused_connection_is_tried_once(monkeypatch):
+	"""
+		Verify that a connection refused by the pre-resolved address is not tried again, and that its error is kept
+	"""
+	with socket.socket() as s:
+		s.bind(('127.0.0.1', 0))
+		port = s.getsockname()[1]
+	attempts = []
+	create_connection = urllib3.connection.connection.create_connection
+	def counting_create_connection(address, *args, **kwargs):
+		attempts.append(address)
+		return create_connection(address, *args, **kwargs)
+	monkeypatch.setattr(urllib3.connection.connection, 'create_connection', counting_create_connection)
+
+	conn = _TimedHTTPConnection('localhost', port)
+	record = CallRecord('get_workflows', 'GET')
+	with attach(record), pytest.raises(NewConnectionError) as error:
+		conn._new_conn()
+	assert isinstance(error.value.__context__, ConnectionRefusedError)
+	assert len(attempts) == 1 and attempts[0][0] != 'localhost'
+	assert conn._dns_host == 'localhost'
+	assert record.dns > 0 and record.connect > 0
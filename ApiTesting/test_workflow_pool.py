@@ -0,0 +1,59 @@
+from Modules.api_helper import *
+from Modules.api_objects import WorkflowGraph
+from Modules.constants import *
+from Modules.token_cache import TokenError
+from Modules import workflow_pool
+from Modules.workflow_pool import WorkflowPool
+
+def test_pool_leases_resets_and_reuses_workflows(fake_up42_server):
+	"""
+		Verify that the pool creates its workflows up front, hands them out, clears their tasks on release
+		and leases them again, creating new ones only when it runs dry
+	"""
+	pool = WorkflowPool('project', 'key', size=2)
+	assert pool.fill() == 2
+	assert len(fake_up42_server.workflows) == 2
+
+	with pool.lease() as workflow_id:
+		token = get_access_token('project', 'key')
+		graph = WorkflowGraph().add('nasa-modis:1', None, NASA_MODIS_BLOCK_ID)
+		assert add_tasks_to_workflow(token, 'project', workflow_id, graph.to_json()).status_code == 200
+		assert pool.leased == {workflow_id}
+	assert fake_up42_server.workflows[workflow_id]['tasks'] == []
+	assert list(pool.idle)[-1] == workflow_id and not pool.leased
+
+	leased = [pool.acquire() for i in range(3)]
+	assert len(set(leased)) == 3 and len(fake_up42_server.workflows) == 3
+	assert pool.stats == {'created': 3, 'leased': 4, 'reused': 3, 'evicted': 0}
+	for workflow_id in leased:
+		pool.release(workflow_id)
+	pool.close()
+	assert not fake_up42_server.workflows and not pool.idle
+
+def test_pool_evicts_workflows_it_cannot_reset(fake_up42_server, monkeypatch):
+	"""
+		Verify that broken workflows, failed resets and failed token fetches on release delete the workflow
+		instead of leaking it out of the pool
+	"""
+	pool = WorkflowPool('project', 'key', size=3)
+	pool.fill()
+	broken, unresettable, no_token = pool.acquire(), pool.acquire(), pool.acquire()
+
+	pool.release(broken, evict=True)
+	assert broken not in fake_up42_server.workflows
+
+	fake_up42_server.error_rates = {'add_tasks': 1}
+	pool.release(unresettable)
+	assert unresettable not in fake_up42_server.workflows
+	fake_up42_server.error_rates = {}
+
+	def token_endpoint_down(project_id, project_api_key):
+		raise TokenError('Token endpoint down', 503)
+	monkeypatch.setattr(workflow_pool, 'get_access_token', token_endpoint_down)
+	pool.release(no_token)
+	assert no_token not in pool.idle and not pool.leased
+	assert pool.stats['evicted'] == 3
+
+	monkeypatch.undo()
+	pool.close()
+	assert set(fake_up42_server.workflows) == {no_token}
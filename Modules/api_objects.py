@@ -1,5 +1,322 @@
-class WorkflowTaskRequest:
-	def __init__(self, name, parentName, blockId):
-		self.name = name
-		self.parentName = parentName
-		self.blockId = blockId
\ No newline at end of file
+import json
+from collections import deque
+
+from Modules import json_codec
+from Modules.constants import JOB_TERMINAL_STATUSES
+
+class WorkflowTaskRequest:
+	"""
+	One task of the Add Tasks to Workflow request body
+		Parameters:
+			name (string): Name of the task inside the workflow, e.g. nasa-modis:1
+			parentName (string): Name of the task feeding this one, None for the data block at the start of the workflow
+			blockId (string): Id of the block the task runs
+	"""
+	__slots__ = ('name', 'parentName', 'blockId')
+
+	def __init__(self, name, parentName, blockId):
+		self.name = name
+		self.parentName = parentName
+		self.blockId = blockId
+
+	def as_dict(self):
+		return {'name': self.name, 'parentName': self.parentName, 'blockId': self.blockId}
+
+	def __repr__(self):
+		return f'WorkflowTaskRequest({self.name!r}, {self.parentName!r}, {self.blockId!r})'
+
+class WorkflowGraphError(ValueError):
+	"""
+	Raised when the tasks of a WorkflowGraph do not form a valid workflow
+	"""
+
+class WorkflowGraph:
+	"""
+	Builds the Add Tasks to Workflow request body from tasks, checking locally that they form a valid workflow:
+	task names are unique, every parentName refers to a task of the graph, there is exactly one task without a parent
+	and every task is reachable from it (so there are no cycles). Tasks are emitted in topological order.
+	The request body is serialized once and cached until the graph changes.
+		Parameters:
+			tasks (list): WorkflowTaskRequests to start with
+			validate (bool): Check the graph before serializing it. Turn it off to send invalid payloads on purpose,
+				the tasks are then emitted in the order they were added.
+	"""
+	def __init__(self, tasks=(), validate=True):
+		self.validate = validate
+		self.tasks = []
+		self.names = set()
+		self.payload = None
+		for task in tasks:
+			self.add_task(task)
+
+	def add(self, name, parentName, blockId):
+		"""
+		Adds a task to the graph
+			Returns:
+				The graph, so that calls can be chained
+		"""
+		return self.add_task(WorkflowTaskRequest(name, parentName, blockId))
+
+	def add_task(self, task):
+		"""
+		Adds a WorkflowTaskRequest to the graph
+			Returns:
+				The graph, so that calls can be chained
+		"""
+		if self.validate and task.name in self.names:
+			raise WorkflowGraphError(f'Duplicate task name {task.name!r}')
+		self.tasks.append(task)
+		self.names.add(task.name)
+		self.payload = None
+		return self
+
+	def chain(self, name, blockId):
+		"""
+		Adds a task whose parent is the last task added, or the first task of the graph if it is empty
+			Returns:
+				The graph, so that calls can be chained
+		"""
+		parentName = self.tasks[-1].name if self.tasks else None
+		return self.add(name, parentName, blockId)
+
+	def ordered(self):
+		"""
+		Returns the tasks in topological order, parents before their children.
+		Raises WorkflowGraphError if the graph is invalid and validation is turned on.
+		"""
+		if not self.validate:
+			return list(self.tasks)
+
+		roots = []
+		children = {}
+		for task in self.tasks:
+			if task.parentName is None:
+				roots.append(task)
+			elif task.parentName not in self.names:
+				raise WorkflowGraphError(f'Task {task.name!r} has unknown parentName {task.parentName!r}')
+			else:
+				children.setdefault(task.parentName, []).append(task)
+		if not roots:
+			raise WorkflowGraphError('Workflow has no task without a parentName, its tasks form a cycle')
+		if len(roots) > 1:
+			raise WorkflowGraphError(f"Workflow has more than one task without a parentName: {', '.join(repr(task.name) for task in roots)}")
+
+		#Every task has at most one parent, so a breadth first walk from the root visits each task at most once
+		ordered = []
+		pending = deque(roots)
+		while pending:
+			task = pending.popleft()
+			ordered.append(task)
+			pending.extend(children.get(task.name, ()))
+		if len(ordered) != len(self.tasks):
+			visited = {task.name for task in ordered}
+			unreachable = [task.name for task in self.tasks if task.name not in visited]
+			raise WorkflowGraphError(f"Tasks not reachable from {roots[0].name!r}, they form a cycle: {', '.join(repr(name) for name in unreachable)}")
+		return ordered
+
+	def to_json(self):
+		"""
+		Returns the Add Tasks to Workflow request body as a json string, serialized once per change of the graph
+		"""
+		if self.payload is None:
+			self.payload = json.dumps([task.as_dict() for task in self.ordered()])
+		return self.payload
+
+	def __len__(self):
+		return len(self.tasks)
+
+class ResponseShapeError(ValueError):
+	"""
+	Raised when a response body does not have the shape of the expected model
+		Parameters:
+			message (string): What was expected and what was found
+			status_code (int): Http status of the response, if known
+	"""
+	def __init__(self, message, status_code=None):
+		super().__init__(message)
+		self.status_code = status_code
+
+_UNPARSED = object()
+
+def response_body(response):
+	"""
+	Returns the decoded json body of a response. The body is decoded once, with the json codec (see json_codec),
+	and kept on the response for the next callers.
+		Parameters:
+			response: A requests.Response, or any object with content bytes or a json() method
+
+		Returns:
+			The decoded body. Raises ResponseShapeError if the body is not json.
+	"""
+	body = getattr(response, '_up42_body', _UNPARSED)
+	if body is not _UNPARSED:
+		return body
+	content = getattr(response, 'content', None)
+	try:
+		body = json_codec.loads(content) if content is not None else response.json()
+	except ValueError as e:
+		raise ResponseShapeError(f'Response body is not json ({e}): {_excerpt(content)}', getattr(response, 'status_code', None))
+	try:
+		response._up42_body = body
+	except AttributeError:
+		pass
+	return body
+
+def response_data(response, kind):
+	"""
+	Returns the data field of a UP42 response body
+		Parameters:
+			response: The response object
+			kind (string): What the data is expected to be, used in the error message
+
+		Returns:
+			The data field. Raises ResponseShapeError if the body has no data field.
+	"""
+	body = response_body(response)
+	if not isinstance(body, dict) or 'data' not in body:
+		raise ResponseShapeError(f'{kind}: expected a json object with a data field, got {_excerpt(body)}', getattr(response, 'status_code', None))
+	return body['data']
+
+class ResponseModel:
+	"""
+	Typed view over the data of a response. Fields are read from the decoded body when they are accessed.
+		Parameters:
+			data (dict): The data field of the response body, or one item of it for lists
+			status_code (int): Http status of the response, if known
+	"""
+	__slots__ = ('data', 'status_code')
+
+	def __init__(self, data, status_code=None):
+		if not isinstance(data, dict):
+			raise ResponseShapeError(f'{type(self).__name__}: expected a json object, got {_excerpt(data)}', status_code)
+		self.data = data
+		self.status_code = status_code
+
+	@classmethod
+	def from_response(cls, response):
+		"""
+		Builds the model from a response whose data field is a single object
+		"""
+		return cls(response_data(response, cls.__name__), getattr(response, 'status_code', None))
+
+	@classmethod
+	def list_from_response(cls, response):
+		"""
+		Builds one model per item of a response whose data field is a list
+		"""
+		status_code = getattr(response, 'status_code', None)
+		data = response_data(response, f'list of {cls.__name__}')
+		if not isinstance(data, list):
+			raise ResponseShapeError(f'list of {cls.__name__}: expected a json list, got {_excerpt(data)}', status_code)
+		return [cls(item, status_code) for item in data]
+
+	def field(self, key, required=True):
+		"""
+		Returns a field of the data. A missing required field raises ResponseShapeError, a missing optional one returns None.
+		"""
+		try:
+			return self.data[key]
+		except KeyError:
+			if not required:
+				return None
+			raise ResponseShapeError(f'{type(self).__name__}: missing field {key!r} in {_excerpt(self.data)}', self.status_code) from None
+
+	def __repr__(self):
+		return f'{type(self).__name__}({_excerpt(self.data)})'
+
+def _field(key, required=True):
+	#Property reading one field of the data on access
+	return property(lambda self: self.field(key, required))
+
+class Token(ResponseModel):
+	"""
+	Get Access Token response
+	"""
+	__slots__ = ()
+	access_token = _field('accessToken')
+	expires_in = _field('expiresIn', required=False)
+
+class Workflow(ResponseModel):
+	"""
+	Create Workflow, Get Workflows and Get Specific Workflow response
+	"""
+	__slots__ = ()
+	id = _field('id')
+	name = _field('name')
+	description = _field('description', required=False)
+	created_at = _field('createdAt', required=False)
+
+class Job(ResponseModel):
+	"""
+	Create and Run Job, Get Jobs and Check Job Status response
+	"""
+	__slots__ = ()
+	id = _field('id')
+	status = _field('status')
+	name = _field('name', required=False)
+	workflow_id = _field('workflowId', required=False)
+
+	@property
+	def is_terminal(self):
+		return self.status in JOB_TERMINAL_STATUSES
+
+	@property
+	def succeeded(self):
+		return self.status == 'SUCCEEDED'
+
+class Task(ResponseModel):
+	"""
+	One task of a workflow or of a job
+	"""
+	__slots__ = ()
+	id = _field('id')
+	name = _field('name')
+	block_id = _field('blockId', required=False)
+	parent_name = _field('parentName', required=False)
+	status = _field('status', required=False)
+
+class TaskList:
+	"""
+	Add Tasks to Workflow and Get Job Tasks response
+		Parameters:
+			tasks (list): The Tasks
+			status_code (int): Http status of the response, if known
+	"""
+	__slots__ = ('tasks', 'status_code')
+
+	def __init__(self, tasks, status_code=None):
+		self.tasks = tasks
+		self.status_code = status_code
+
+	@classmethod
+	def from_response(cls, response):
+		return cls(Task.list_from_response(response), getattr(response, 'status_code', None))
+
+	def by_name(self, name):
+		"""
+		Returns the task with the given name, or None
+		"""
+		for task in self.tasks:
+			if task.name == name:
+				return task
+		return None
+
+	def __iter__(self):
+		return iter(self.tasks)
+
+	def __len__(self):
+		return len(self.tasks)
+
+	def __getitem__(self, index):
+		return self.tasks[index]
+
+	def __repr__(self):
+		return f'TaskList({self.tasks!r})'
+
+def _excerpt(value, limit=200):
+	#Short printable form of a body for error messages
+	if isinstance(value, (bytes, bytearray)):
+		text = bytes(value[:limit]).decode('utf-8', errors='replace')
+	else:
+		text = repr(value)
+	return text if len(text) <= limit else text[:limit] + '...'
@@ -0,0 +1,339 @@
+import asyncio, base64, json, time
+import weakref
+
+import aiohttp
+
+from Modules.constants import *
+from Modules.token_cache import TokenError, get_default_token_cache, token_expiry
+from Modules.api_objects import Job, ResponseShapeError, Token
+from Modules.job_poller import get_default_poller
+from Modules.payload_catalog import check_job_parameters, payload_validation_enabled
+
+"""
+	asyncio counterparts of the functions in api_helper.
+	Every coroutine returns the same shape as its synchronous twin (a response object with status_code and json(),
+	a token string, or a boolean), so a test can switch between the two by adding await.
+	Requires the aiohttp module, use `pip install aiohttp`
+"""
+
+class AsyncResponse:
+	"""
+	Fully read response, mirroring the parts of requests.Response the tests use
+		Parameters:
+			status_code (int): HTTP status code
+			headers (dict): Response headers
+			content (bytes): Response body
+			url (string): The requested url
+	"""
+	def __init__(self, status_code, headers, content, url):
+		self.status_code = status_code
+		self.headers = headers
+		self.content = content
+		self.url = url
+
+	@property
+	def text(self):
+		return self.content.decode('utf-8', errors='replace')
+
+	def json(self):
+		return json.loads(self.content)
+
+class AsyncUP42Client:
+	"""
+	Owns a pooled, keep-alive aiohttp.ClientSession to the UP42 API. Must be created and used inside a running event loop.
+		Parameters:
+			base_url (string): Scheme and host of the API, e.g. https://api.up42.com
+			pool_maxsize (int): Maximum number of simultaneous connections
+			keep_alive (bool): Whether to keep connections open between calls
+			token_cache (TokenCache): Cache used by get_token and for the 401 retry, defaults to the process-wide cache
+			timeouts (dict): (connect, read) timeouts in seconds by endpoint name, merged over ENDPOINT_TIMEOUTS
+			default_timeout (tuple): (connect, read) timeouts of the other endpoints
+	"""
+	def __init__(self, base_url=BASE_URL, pool_maxsize=DEFAULT_POOL_MAXSIZE, keep_alive=DEFAULT_KEEP_ALIVE, token_cache=None,
+			timeouts=None, default_timeout=(DEFAULT_CONNECT_TIMEOUT_SECONDS, DEFAULT_READ_TIMEOUT_SECONDS)):
+		self.base_url = base_url.rstrip('/')
+		self.token_cache = token_cache if token_cache is not None else get_default_token_cache()
+		#Same (connect, read) timeouts as the synchronous client, see resilience
+		self.timeouts = {endpoint: _client_timeout(timeout) for endpoint, timeout in dict(ENDPOINT_TIMEOUTS, **(timeouts or {})).items()}
+		connector = aiohttp.TCPConnector(limit=pool_maxsize, force_close=not keep_alive)
+		self.session = aiohttp.ClientSession(connector=connector, timeout=_client_timeout(default_timeout))
+		self._token_locks = {}
+
+	def url(self, path_template, *args):
+		return self.base_url + (path_template % args)
+
+	async def close(self):
+		await self.session.close()
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, *exc_info):
+		await self.close()
+
+	async def _request(self, endpoint, method, url, **kwargs):
+		timeout = self.timeouts.get(endpoint)
+		if timeout is not None:
+			kwargs['timeout'] = timeout
+		async with self.session.request(method, url, **kwargs) as response:
+			content = await response.read()
+			return AsyncResponse(response.status, dict(response.headers), content, str(response.url))
+
+	async def _send(self, endpoint, method, url, token, is_json=False, **kwargs):
+		response = await self._request(endpoint, method, url, headers=_auth_headers(token, is_json), **kwargs)
+		if response.status_code == 401:
+			credentials = self.token_cache.credentials_for(token)
+			if credentials is not None:
+				new_token = await self.get_token(credentials[0], credentials[1], stale_token=token)
+				response = await self._request(endpoint, method, url, headers=_auth_headers(new_token, is_json), **kwargs)
+		return response
+
+	async def get_access_token(self, project_id, project_api_key):
+		url = self.url(GET_ACCESSTOKEN_PATH)
+		credentials = base64.b64encode(f'{project_id}:{project_api_key}'.encode()).decode()
+		headers = {'Content-Type' : 'application/x-www-form-urlencoded', 'Authorization': f'Basic {credentials}'}
+		return await self._request('get_access_token', 'POST', url, headers=headers, data='grant_type=client_credentials')
+
+	async def get_token(self, project_id, project_api_key, stale_token=None):
+		token = await self._in_executor(self.token_cache.lookup, project_id, project_api_key, stale_token)
+		if token is not None:
+			return token
+
+		key = (project_id, project_api_key)
+		lock = self._token_locks.setdefault(key, asyncio.Lock())
+		async with lock:
+			#Another task may have fetched the token while we waited for the lock
+			token = await self._in_executor(self.token_cache.lookup, project_id, project_api_key, stale_token)
+			if token is not None:
+				return token
+
+			response = await self.get_access_token(project_id, project_api_key)
+			if response.status_code != 200:
+				raise TokenError(f'Get Access Token: Failure with status {response.status_code}', response.status_code)
+			try:
+				model = Token.from_response(response)
+				token = model.access_token
+			except ResponseShapeError as e:
+				raise TokenError(f'Get Access Token: Unexpected response body - {e}', response.status_code)
+			if not token:
+				raise TokenError('Get Access Token: Empty token returned', response.status_code)
+			expires_at = token_expiry(token, model.expires_in, self.token_cache.default_ttl)
+			await self._in_executor(self.token_cache.put, project_id, project_api_key, token, expires_at)
+			return token
+
+	async def _in_executor(self, fn, *args):
+		#With a disk tier, the token cache waits on an inter-process file lock, which must not block the event loop
+		if not self.token_cache.disk_path:
+			return fn(*args)
+		return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+	async def create_workflow(self, token, project_id, name, description):
+		url = self.url(CREATE_WORKFLOW_PATH, project_id)
+		body = {"name": f"{name}", "description": f"{description}"}
+		return await self._send('create_workflow', 'POST', url, token, True, json=body)
+
+	async def get_specific_workflow(self, token, project_id, workflow_id):
+		url = self.url(GET_SPECIFIC_WORKFLOW_PATH, project_id, workflow_id)
+		return await self._send('get_specific_workflow', 'GET', url, token)
+
+	async def check_job_status(self, token, project_id, job_id):
+		url = self.url(CHECK_JOB_STATUS_PATH, project_id, job_id)
+		return await self._send('check_job_status', 'GET', url, token)
+
+	async def add_tasks_to_workflow(self, token, project_id, workflow_id, request_body):
+		url = self.url(ADD_TASK_TO_WORKFLOW_PATH, project_id, workflow_id)
+		return await self._send('add_tasks_to_workflow', 'POST', url, token, True, data=request_body)
+
+	async def create_and_run_job_for_workflow(self, token, project_id, workflow_id, request_body, name=None):
+		url = self.url(CREATE_RUN_JOB_FOR_WORKFLOW_PATH, project_id, workflow_id)
+		params = {'name': name} if name else None
+		return await self._send('create_and_run_job_for_workflow', 'POST', url, token, True, json=request_body, params=params)
+
+	async def delete_workflow(self, token, project_id, workflow_id):
+		url = self.url(DELETE_WORKFLOW_PATH, project_id, workflow_id)
+		return await self._send('delete_workflow', 'DELETE', url, token)
+
+def _client_timeout(timeout):
+	#A (connect, read) tuple as requests takes it, the read timeout bounds every wait for data like in requests
+	connect, read = timeout
+	return aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+
+def _auth_headers(token, is_json=False):
+	headers = {'Authorization': f'Bearer {token}'}
+	if is_json:
+		headers['Content-Type'] = 'application/json'
+	return headers
+
+#One default client per event loop, since an aiohttp session cannot be shared between loops
+_default_clients = weakref.WeakKeyDictionary()
+
+def get_default_client():
+	"""
+	Returns the default async client of the running event loop, creating it on first use
+
+		Returns:
+			The AsyncUP42Client of the running loop
+	"""
+	loop = asyncio.get_running_loop()
+	client = _default_clients.get(loop)
+	if client is None:
+		client = _default_clients[loop] = AsyncUP42Client()
+	return client
+
+def set_default_client(client):
+	"""
+	Replaces the default async client of the running event loop
+		Parameters:
+			client (AsyncUP42Client): The new client, created in the running loop
+
+		Returns:
+			The previous client, or None
+	"""
+	loop = asyncio.get_running_loop()
+	previous = _default_clients.get(loop)
+	_default_clients[loop] = client
+	return previous
+
+async def close_default_client():
+	"""
+	Closes the default async client of the running event loop, if any
+	"""
+	client = _default_clients.pop(asyncio.get_running_loop(), None)
+	if client is not None:
+		await client.close()
+
+async def get_access_token(project_id, project_api_key):
+	"""
+	Retrieves a (cached) Access Token from UP42 token endpoint, see api_helper.get_access_token
+
+		Returns:
+			The Access Token as a string. Raises TokenError if the token endpoint does not return a token.
+	"""
+	return await get_default_client().get_token(project_id, project_api_key)
+
+async def create_workflow(token, project_id, name, description):
+	"""
+	Calls the Create Workflow endpoint, see api_helper.create_workflow
+
+		Returns:
+			The response object
+	"""
+	return await get_default_client().create_workflow(token, project_id, name, description)
+
+async def get_specific_workflow(token, project_id, workflow_id):
+	"""
+	Calls the Get Specific Workflow endpoint, see api_helper.get_specific_workflow
+
+		Returns:
+			The response object
+	"""
+	return await get_default_client().get_specific_workflow(token, project_id, workflow_id)
+
+async def check_job_status(token, project_id, job_id):
+	"""
+	Calls the Check Job Status endpoint, see api_helper.check_job_status
+
+		Returns:
+			The response object
+	"""
+	return await get_default_client().check_job_status(token, project_id, job_id)
+
+async def add_tasks_to_workflow(token, project_id, workflow_id, request_body):
+	"""
+	Calls the Add Tasks to Workflow endpoint, see api_helper.add_tasks_to_workflow
+
+		Returns:
+			The response object
+	"""
+	return await get_default_client().add_tasks_to_workflow(token, project_id, workflow_id, request_body)
+
+async def create_and_run_job_for_workflow(token, project_id, workflow_id, request_body, name=None, validate=None):
+	"""
+	Calls the Create and Run Job endpoint, see api_helper.create_and_run_job_for_workflow
+		Parameters:
+			name (string): Optional name of the job
+			validate (bool): Check the parameters locally first (see payload_catalog), None follows set_payload_validation
+
+		Returns:
+			The response object. Raises PayloadValidationError when validation is on and the parameters are invalid.
+	"""
+	if validate or (validate is None and payload_validation_enabled()):
+		check_job_parameters(request_body)
+	return await get_default_client().create_and_run_job_for_workflow(token, project_id, workflow_id, request_body, name)
+
+async def delete_workflow(token, project_id, workflow_id):
+	"""
+	Calls the Delete Workflow endpoint, see api_helper.delete_workflow
+
+		Returns:
+			The response object
+	"""
+	return await get_default_client().delete_workflow(token, project_id, workflow_id)
+
+async def wait_until_job_is_complete(token, project_id, job_id, max_wait_seconds, semaphore=None):
+	"""
+	Periodically checks the job status of an existing Job inside a Project without blocking the event loop
+		Parameters:
+			token (string): Access Token associated to the project
+			project_id (string): Id associated to the project
+			job_id (string): Id associated to the job that is being checked
+			max_wait_seconds (int): Maximum amount of time (in seconds) user is willing to wait
+			semaphore (asyncio.Semaphore): Optional semaphore bounding the number of status requests in flight
+
+		Returns:
+			Boolean. True if job is completed in the max time alotted. False if otherwise.
+	"""
+	policy = get_default_poller().policy
+	start_time = time.monotonic()
+	polls = 0
+	try:
+		while True:
+			#Calls the Check Job Status API, holding the semaphore only for the request itself
+			if semaphore is not None:
+				async with semaphore:
+					res = await check_job_status(token, project_id, job_id)
+			else:
+				res = await check_job_status(token, project_id, job_id)
+			polls += 1
+			elapsed = time.monotonic() - start_time
+
+			#Stop as soon as the job reaches any terminal state, only SUCCEEDED counts as complete
+			if(res.status_code == 200):
+				status = Job.from_response(res).status
+				if(status in JOB_TERMINAL_STATUSES):
+					policy.observe(elapsed)
+					return status == 'SUCCEEDED'
+			elif(res.status_code in (400, 401, 403, 404)):
+				print(f"Wait For Job: Unexpected status code of {res.status_code}")
+				return False
+
+			#Check if elapsed time exceeds max waiting time
+			remaining = max_wait_seconds - elapsed
+			if(remaining <= 0):
+				return False
+
+			#Wait according to the shared backoff policy, but never past the deadline
+			await asyncio.sleep(min(policy.next_delay(polls, elapsed), remaining))
+
+	except Exception as e:
+		#If any exception is encountered, return False
+		print(f"Wait For Job: Exception Occurs - {e!r}")
+		return False
+
+async def wait_until_jobs_are_complete(token, project_id, job_ids, max_wait_seconds, max_concurrency=DEFAULT_MAX_CONCURRENT_STATUS_CHECKS):
+	"""
+	Watches many Jobs at once from a single event loop
+		Parameters:
+			token (string): Access Token associated to the project
+			project_id (string): Id associated to the project
+			job_ids (list): Ids of the jobs being checked
+			max_wait_seconds (int): Maximum amount of time (in seconds) user is willing to wait for each job
+			max_concurrency (int): Maximum number of status requests in flight at the same time
+
+		Returns:
+			Dict of job id to Boolean, with the same meaning as wait_until_job_is_complete
+	"""
+	semaphore = asyncio.Semaphore(max_concurrency)
+	job_ids = list(job_ids)
+	results = await asyncio.gather(*(wait_until_job_is_complete(token, project_id, job_id, max_wait_seconds, semaphore) for job_id in job_ids))
+	return dict(zip(job_ids, results))
@@ -0,0 +1,160 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import pytest
+
+"""
+	pytest plugin overlapping long job waits with the rest of the suite.
+	A test marked with @pytest.mark.background_job submits its job, then hands the wait and the final assertions
+	to the `background` fixture. That work runs in a background thread while the other tests execute,
+	and its outcome is reported at the end of the session by a <test name>[background] item.
+
+	Marked tests run first, the slowest first according to the background durations recorded by earlier runs
+	(config.cache), so that the suite takes about as long as the longest job rather than the sum of them.
+	Registered from ApiTesting/conftest.py, see the --background-workers option there.
+"""
+
+DURATIONS_CACHE_KEY = 'up42/background_durations'
+
+class BackgroundJobsPlugin:
+	"""
+		Parameters:
+			max_workers (int): Number of background threads. 0 runs the background work inline, at the end of the test itself
+				(this is also the case under pytest-xdist, which could send the [background] item to another worker).
+	"""
+	def __init__(self, max_workers=8):
+		self.max_workers = max_workers
+		self.executor = None
+		self.futures = {}
+		self.durations = {}
+		self.recorded = {}
+		self.lock = threading.Lock()
+
+	@property
+	def inline(self):
+		return self.max_workers <= 0
+
+	def pytest_configure(self, config):
+		config.addinivalue_line('markers', 'background_job: the test hands its long wait to the background fixture, see Modules/background_jobs.py')
+		cache = getattr(config, 'cache', None)
+		if cache is not None:
+			self.recorded = cache.get(DURATIONS_CACHE_KEY, {})
+
+	@pytest.hookimpl(trylast=True)
+	def pytest_collection_modifyitems(self, session, config, items):
+		if self.inline:
+			return
+		background = [item for item in items if item.get_closest_marker('background_job')]
+		if not background:
+			return
+		#Unknown durations first, they may well be the longest
+		background.sort(key=lambda item: -self.recorded.get(item.nodeid, float('inf')))
+		others = [item for item in items if not item.get_closest_marker('background_job')]
+		results = [BackgroundResultItem.from_parent(item.parent, name=f'{item.name}[background]', origin=item) for item in background]
+		items[:] = background + others + results
+
+	def pytest_sessionfinish(self, session, exitstatus):
+		if self.executor is not None:
+			self.executor.shutdown(wait=True)
+		cache = getattr(session.config, 'cache', None)
+		if cache is not None and self.durations:
+			recorded = dict(self.recorded)
+			recorded.update(self.durations)
+			cache.set(DURATIONS_CACHE_KEY, recorded)
+
+	def submit(self, nodeid, fn, args, kwargs, finalizers):
+		"""
+		Runs fn(*args, **kwargs) for the test nodeid in the background, then its finalizers.
+		Coroutine functions are run in an event loop of their own.
+		"""
+		def run():
+			start = time.perf_counter()
+			try:
+				if asyncio.iscoroutinefunction(fn):
+					return asyncio.run(fn(*args, **kwargs))
+				return fn(*args, **kwargs)
+			finally:
+				with self.lock:
+					self.durations[nodeid] = time.perf_counter() - start
+				pending, finalizers[:] = list(finalizers), []
+				for finalizer in reversed(pending):
+					finalizer()
+
+		if self.inline:
+			run()
+			return None
+		with self.lock:
+			if self.executor is None:
+				self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='background-job')
+			future = self.futures[nodeid] = self.executor.submit(run)
+		return future
+
+	def wait(self):
+		"""
+		Blocks until the background work submitted so far is done. Its outcome is still reported by the [background] items.
+		"""
+		with self.lock:
+			futures = list(self.futures.values())
+		wait(futures)
+
+class BackgroundJobs:
+	"""
+	Handle given to a test by the `background` fixture
+	"""
+	def __init__(self, plugin, nodeid):
+		self.plugin = plugin
+		self.nodeid = nodeid
+		self.finalizers = []
+		self.future = None
+
+	def run(self, fn, *args, **kwargs):
+		"""
+		Runs fn in the background. Its failures (e.g. assertions) are reported by the test's [background] item.
+		Can be called once per test.
+			Returns:
+				A concurrent.futures.Future, or None when the work ran inline
+		"""
+		if self.future is not None:
+			raise RuntimeError('Background Jobs: run can only be called once per test')
+		self.future = self.plugin.submit(self.nodeid, fn, args, kwargs, self.finalizers)
+		return self.future
+
+	def add_finalizer(self, finalizer):
+		"""
+		Registers a cleanup that must wait for the background work, e.g. returning a leased workflow.
+		Without background work, finalizers run at the end of the test.
+		"""
+		self.finalizers.append(finalizer)
+
+	def close(self):
+		#End of the test: run the finalizers now unless the background work owns them
+		if self.future is None:
+			finalizers, self.finalizers[:] = list(self.finalizers), []
+			for finalizer in reversed(finalizers):
+				finalizer()
+
+class BackgroundResultItem(pytest.Item):
+	"""
+	Waits for the background work of a test and reports its outcome under <test name>[background]
+	"""
+	def __init__(self, *, origin, **kwargs):
+		super().__init__(**kwargs)
+		self.origin = origin
+
+	def runtest(self):
+		plugin = self.config.pluginmanager.get_plugin('up42-background-jobs')
+		future = plugin.futures.get(self.origin.nodeid)
+		if future is None:
+			pytest.skip(f'{self.origin.name} did not start background work')
+		future.result()
+
+	def reportinfo(self):
+		path, lineno, name = self.origin.reportinfo()
+		return path, lineno, f'{name}[background]'
+
+	def _traceback_filter(self, excinfo):
+		#Show the frames of the test module, not those of the plugin and the thread pool
+		traceback = excinfo.traceback
+		return traceback.filter(lambda entry: entry.path == self.origin.path) or traceback
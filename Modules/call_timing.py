@@ -0,0 +1,106 @@
+import contextlib
+import threading
+import time
+
+"""
+	Timing hook around every outbound UP42 API call.
+	The client wraps each call in track(), the instrumented connections fill in the DNS/connect/TLS phases,
+	and every registered listener receives the finished CallRecord.
+"""
+
+class CallRecord:
+	"""
+	Timings of one API call. All durations are in seconds.
+	dns, connect and tls stay 0 when the call reused a pooled connection.
+		Parameters:
+			endpoint (string): Endpoint name, e.g. create_workflow
+			method (string): HTTP method
+	"""
+	__slots__ = ('endpoint', 'method', 'status', 'bytes', 'dns', 'connect', 'tls', 'ttfb', 'total', 'retries', 'hedges', 'error')
+
+	def __init__(self, endpoint, method):
+		self.endpoint = endpoint
+		self.method = method
+		self.status = None
+		self.bytes = 0
+		self.dns = 0.0
+		self.connect = 0.0
+		self.tls = 0.0
+		self.ttfb = None
+		self.total = None
+		self.retries = 0
+		self.hedges = 0
+		self.error = None
+
+	def as_dict(self):
+		return {name: getattr(self, name) for name in self.__slots__}
+
+	def observe_response(self, response):
+		"""
+		Fills in status, size and time to first byte from a requests.Response
+		"""
+		self.status = response.status_code
+		self.bytes = len(response.content)
+		#requests measures elapsed from sending the request until the response headers are parsed
+		self.ttfb = response.elapsed.total_seconds()
+
+_listeners = []
+_listeners_lock = threading.Lock()
+_local = threading.local()
+
+def add_call_listener(listener):
+	"""
+	Registers a function called with every finished CallRecord, from the thread that made the call
+	"""
+	with _listeners_lock:
+		_listeners.append(listener)
+
+def remove_call_listener(listener):
+	with _listeners_lock:
+		if listener in _listeners:
+			_listeners.remove(listener)
+
+def current_call():
+	"""
+	Returns the CallRecord of the call in progress on this thread, or None
+	"""
+	return getattr(_local, 'record', None)
+
+@contextlib.contextmanager
+def attach(record):
+	"""
+	Makes record the call in progress on this thread, e.g. in a helper thread sending a request on behalf of the call.
+	Listeners are not notified, the thread that tracks the call does that.
+	"""
+	previous = getattr(_local, 'record', None)
+	_local.record = record
+	try:
+		yield record
+	finally:
+		_local.record = previous
+
+@contextlib.contextmanager
+def track(endpoint, method):
+	"""
+	Times an API call and hands the CallRecord to the listeners once it finishes
+		Parameters:
+			endpoint (string): Endpoint name, e.g. create_workflow
+			method (string): HTTP method
+
+		Returns:
+			Context manager yielding the CallRecord
+	"""
+	record = CallRecord(endpoint, method)
+	previous = getattr(_local, 'record', None)
+	_local.record = record
+	start = time.perf_counter()
+	try:
+		yield record
+	except Exception as e:
+		record.error = type(e).__name__
+		raise
+	finally:
+		record.total = time.perf_counter() - start
+		_local.record = previous
+		for listener in list(_listeners):
+			listener(record)
@@ -0,0 +1,346 @@
+import base64
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+"""
+	Record/replay transport for the UP42 client.
+	In record mode every request/response pair is appended to a JSONL cassette (gzip compressed when the path ends with .gz),
+	with credentials, tokens and the query strings of signed download urls redacted. In replay mode responses are served from the cassette without any network access.
+
+	Workflow and job ids differ on every run, so ids are templated: an id first seen in a response is stored as <<id:N>>,
+	the project id as <<project>>, the access token as <<token>> and the query of a signed url as <<signed>>. On replay every <<id:N>> gets a fresh id,
+	and requests using those ids are mapped back to the recorded templates before lookup.
+
+	Lookups go from the most to the least specific key, so that recordings still match when ids are handed out
+	in a different order or request bodies contain random names:
+		1. method, templated path, body hash
+		2. method, path with every id wildcarded, body hash
+		3. method, path with every id wildcarded
+	Responses recorded under the same key are served in order, the last one repeating (e.g. job status polls).
+"""
+
+_UUID = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+_PLACEHOLDER = re.compile(r'<<id:(\d+)>>')
+_PROJECT_PATH = re.compile(r'/projects/([^/]+)')
+_REDACTED_TOKEN = '<<token>>'
+_PROJECT = '<<project>>'
+_SIGNED = '<<signed>>'
+#Served instead of a redacted signature on replay, so that the download request looks signed and is redacted back to <<signed>>
+_REPLAY_SIGNATURE = 'X-Goog-Signature=replay'
+_URL_QUERY = re.compile(r'(https?://[^\s"?]+)\?([^\s"]*)')
+_SIGNATURE_PARAM = re.compile(r'(?:^|&|\\u0026)(?:[\w-]*signature|sig)=', re.IGNORECASE)
+_KEPT_HEADERS = ('Retry-After', 'Content-Range', 'Content-MD5', 'x-goog-hash')
+
+class CassetteMissError(ConnectionError):
+	"""
+	Raised in replay mode when the cassette holds no response for a request
+	"""
+
+class CassetteAdapter(HTTPAdapter):
+	"""
+	Transport adapter mounted on the client session to record or replay traffic
+		Parameters:
+			path (string): Cassette file, gzip compressed when it ends with .gz
+			mode (string): 'record' or 'replay'
+			inner (HTTPAdapter): Adapter that really sends the requests in record mode, e.g. the client's pooled adapter
+	"""
+	def __init__(self, path, mode, inner=None, **kwargs):
+		super().__init__(**kwargs)
+		if mode not in ('record', 'replay'):
+			raise ValueError(f'Unknown cassette mode {mode!r}')
+		self.path = path
+		self.mode = mode
+		self.inner = inner
+		self.hedged = None
+		self.lock = threading.Lock()
+		self.templater = _IdTemplater()
+		if mode == 'record':
+			directory = os.path.dirname(path)
+			if directory:
+				os.makedirs(directory, exist_ok=True)
+			self.file = gzip.open(path, 'at') if path.endswith('.gz') else open(path, 'a')
+		else:
+			self.cassette = _IndexedCassette(path)
+
+	def send(self, request, **kwargs):
+		if self.mode == 'record':
+			if self.inner is not None:
+				response = self.inner.send(request, **kwargs)
+			else:
+				response = super().send(request, **kwargs)
+			self._record(request, response)
+			return response
+		return self._replay(request)
+
+	def close(self):
+		super().close()
+		if self.inner is not None:
+			self.inner.close()
+		if self.mode == 'record':
+			with self.lock:
+				self.file.close()
+		else:
+			self.cassette.close()
+
+	def _record(self, request, response):
+		with self.lock:
+			project_id = _project_of(request.url)
+			path = self.templater.template_request(_path_of(request.url), project_id)
+			body = self.templater.template_request(_body_text(request.body), project_id)
+			entry = {
+				'method': request.method,
+				'path': path,
+				'body_hash': _hash(body),
+				'status': response.status_code,
+				'content_type': response.headers.get('Content-Type'),
+				'headers': {name: response.headers[name] for name in _KEPT_HEADERS if name in response.headers},
+			}
+			if _is_binary(entry['content_type']):
+				#Downloaded archives are kept byte for byte
+				entry['body_b64'] = base64.b64encode(response.content).decode()
+			else:
+				response_text = response.content.decode('utf-8', errors='replace')
+				response_text = _redact_signed_urls(_redact_tokens(response_text))
+				entry['body'] = self.templater.template_response(response_text, project_id)
+			self.file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+			self.file.flush()
+
+	def _replay(self, request):
+		with self.lock:
+			project_id = _project_of(request.url)
+			path = self.templater.template_request(_path_of(request.url), project_id)
+			body = self.templater.template_request(_body_text(request.body), project_id)
+			entry = self.cassette.lookup(request.method, path, _hash(body))
+			if entry is None:
+				raise CassetteMissError(f'Cassette {self.path} has no response for {request.method} {path}', request=request)
+			if 'body_b64' in entry:
+				content = base64.b64decode(entry['body_b64'])
+			else:
+				content = self.templater.render_response(entry['body'], project_id).encode()
+
+		response = Response()
+		response.status_code = entry['status']
+		response._content = content
+		response._content_consumed = True
+		response.headers = CaseInsensitiveDict(entry.get('headers') or {})
+		if entry.get('content_type'):
+			response.headers['Content-Type'] = entry['content_type']
+		response.headers['Content-Length'] = str(len(content))
+		response.encoding = 'utf-8'
+		response.url = request.url
+		response.request = request
+		response.reason = 'Replayed'
+		response.elapsed = timedelta(0)
+		return response
+
+def install_cassette(client, path, mode):
+	"""
+	Routes all the traffic of a UP42Client through a cassette
+		Parameters:
+			client (UP42Client): The client, its current adapter still sends the requests in record mode
+			path (string): Cassette file, gzip compressed when it ends with .gz
+			mode (string): 'record' or 'replay'
+
+		Returns:
+			The mounted CassetteAdapter, pass it to uninstall_cassette to restore the client
+	"""
+	adapter = CassetteAdapter(path, mode, inner=client.session.get_adapter(client.base_url))
+	#A hedged call sends its request twice, which would record an extra response and shift the replay cursors
+	adapter.hedged = client.resilience.hedged
+	client.resilience.hedged = frozenset()
+	client.session.mount('https://', adapter)
+	client.session.mount('http://', adapter)
+	return adapter
+
+def uninstall_cassette(client, adapter):
+	"""
+	Undoes install_cassette: mounts the client's previous adapter again, restores hedging and closes the cassette
+		Parameters:
+			client (UP42Client): The client the cassette was installed on
+			adapter (CassetteAdapter): The adapter returned by install_cassette
+	"""
+	client.session.mount('https://', adapter.inner)
+	client.session.mount('http://', adapter.inner)
+	client.resilience.hedged = adapter.hedged
+	#The inner adapter belongs to the client again, closing the cassette must not close it
+	adapter.inner = None
+	adapter.close()
+
+class _IdTemplater:
+	"""
+	Maps the dynamic ids of one run to the <<id:N>> templates of the cassette
+	"""
+	def __init__(self):
+		self.real_to_template = {}
+		self.template_to_real = {}
+		self.literals = set()
+
+	def template_request(self, text, project_id):
+		#Ids first seen in a request (e.g. block ids) are fixed values, so they are kept as they are
+		if project_id:
+			text = text.replace(project_id, _PROJECT)
+		def replace(match):
+			real = match.group(0)
+			template = self.real_to_template.get(real)
+			if template is None:
+				self.literals.add(real)
+				return real
+			return template
+		return _UUID.sub(replace, text)
+
+	def template_response(self, text, project_id):
+		#Ids first seen in a response are generated by the API, so they get a template
+		if project_id:
+			text = text.replace(project_id, _PROJECT)
+		def replace(match):
+			real = match.group(0)
+			if real in self.literals:
+				return real
+			template = self.real_to_template.get(real)
+			if template is None:
+				template = self.real_to_template[real] = f'<<id:{len(self.real_to_template)}>>'
+			return template
+		return _UUID.sub(replace, text)
+
+	def render_response(self, text, project_id):
+		if project_id:
+			text = text.replace(_PROJECT, project_id)
+		if _REDACTED_TOKEN in text:
+			text = text.replace(_REDACTED_TOKEN, _fake_token())
+		text = text.replace(_SIGNED, _REPLAY_SIGNATURE)
+		def replace(match):
+			template = match.group(0)
+			real = self.template_to_real.get(template)
+			if real is None:
+				real = self.template_to_real[template] = str(uuid.uuid4())
+				self.real_to_template[real] = template
+			return real
+		return _PLACEHOLDER.sub(replace, text)
+
+class _IndexedCassette:
+	"""
+	Read-only cassette. Plain files are memory-mapped and only the entries actually served are parsed.
+	The index of entry offsets is cached next to the cassette in <path>.idx.
+	"""
+	def __init__(self, path):
+		self.path = path
+		self.file = None
+		if path.endswith('.gz'):
+			with gzip.open(path, 'rb') as f:
+				self.data = f.read()
+		else:
+			self.file = open(path, 'rb')
+			self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b''
+		self.index = self._load_index()
+		self.cursors = {}
+
+	def close(self):
+		if isinstance(self.data, mmap.mmap):
+			self.data.close()
+		if self.file is not None:
+			self.file.close()
+
+	def lookup(self, method, path, body_hash):
+		wildcard = _PLACEHOLDER.sub('<<id>>', path)
+		for key in (f'{method} {path} {body_hash}', f'{method} {wildcard} {body_hash}', f'{method} {wildcard}'):
+			offsets = self.index.get(key)
+			if offsets:
+				position = self.cursors.get(key, 0)
+				self.cursors[key] = position + 1
+				return self._entry(offsets[min(position, len(offsets) - 1)])
+		return None
+
+	def _entry(self, offset):
+		end = self.data.find(b'\n', offset)
+		return json.loads(self.data[offset:end if end != -1 else len(self.data)])
+
+	def _load_index(self):
+		index_path = self.path + '.idx'
+		try:
+			if os.path.getmtime(index_path) >= os.path.getmtime(self.path):
+				with open(index_path) as f:
+					return json.load(f)
+		except (OSError, ValueError):
+			pass
+
+		index = {}
+		offset = 0
+		length = len(self.data)
+		while offset < length:
+			end = self.data.find(b'\n', offset)
+			if end == -1:
+				end = length
+			line = self.data[offset:end]
+			if line.strip():
+				entry = json.loads(line)
+				wildcard = _PLACEHOLDER.sub('<<id>>', entry['path'])
+				for key in (f"{entry['method']} {entry['path']} {entry['body_hash']}", f"{entry['method']} {wildcard} {entry['body_hash']}", f"{entry['method']} {wildcard}"):
+					index.setdefault(key, []).append(offset)
+			offset = end + 1
+		try:
+			with open(index_path, 'w') as f:
+				json.dump(index, f)
+		except OSError:
+			pass
+		return index
+
+def _path_of(url):
+	parts = urlsplit(url)
+	return parts.path + (f'?{_redact_signed_query(parts.query)}' if parts.query else '')
+
+def _project_of(url):
+	match = _PROJECT_PATH.search(urlsplit(url).path)
+	return match.group(1) if match else None
+
+def _body_text(body):
+	if body is None:
+		return ''
+	if isinstance(body, bytes):
+		return body.decode('utf-8', errors='replace')
+	return str(body)
+
+def _is_binary(content_type):
+	if not content_type:
+		return False
+	return not (content_type.startswith('text/') or 'json' in content_type)
+
+def _hash(text):
+	return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+def _redact_tokens(text):
+	#Access tokens are credentials, so they never reach the cassette
+	try:
+		body = json.loads(text)
+	except ValueError:
+		return text
+	data = body.get('data') if isinstance(body, dict) else None
+	if isinstance(data, dict) and 'accessToken' in data:
+		data['accessToken'] = _REDACTED_TOKEN
+		return json.dumps(body)
+	return text
+
+def _redact_signed_query(query):
+	return _SIGNED if _SIGNATURE_PARAM.search(query) else query
+
+def _redact_signed_urls(text):
+	#The query string of a signed url is a credential too (e.g. X-Goog-Signature), it is replaced by <<signed>>
+	return _URL_QUERY.sub(lambda match: f'{match.group(1)}?{_redact_signed_query(match.group(2))}', text)
+
+def _fake_token():
+	#JWT-shaped token whose exp lets the token cache keep it for the rest of the run
+	claims = base64.urlsafe_b64encode(json.dumps({'exp': int(time.time()) + 3600}).encode()).decode().rstrip('=')
+	return f'replay.{claims}.{uuid.uuid4().hex}'
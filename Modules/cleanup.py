@@ -0,0 +1,152 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from Modules.api_helper import *
+from Modules.constants import *
+
+class DeferredCleanupQueue:
+	"""
+	Deletes workflows in background threads, so tests do not wait for their own teardown.
+	The queue is bounded: when it is full, schedule_delete blocks until a worker catches up.
+	Each worker takes up to batch_size queued deletions at a time and sends them back to back over its pooled connection.
+		Parameters:
+			max_workers (int): Number of background worker threads
+			max_queued (int): Maximum number of deletions waiting in the queue
+			batch_size (int): Maximum number of deletions a worker takes at once
+	"""
+	def __init__(self, max_workers=DEFAULT_CLEANUP_WORKERS, max_queued=DEFAULT_CLEANUP_MAX_QUEUED, batch_size=DEFAULT_CLEANUP_BATCH_SIZE):
+		self.batch_size = batch_size
+		self.queue = queue.Queue(maxsize=max_queued)
+		self.lock = threading.Lock()
+		self.stats = {'scheduled': 0, 'skipped': 0, 'deleted': 0, 'not_found': 0, 'failed': 0}
+		self.failures = []
+		self.workers = [threading.Thread(target=self._work, name=f'workflow-cleanup-{i}', daemon=True) for i in range(max_workers)]
+		for worker in self.workers:
+			worker.start()
+
+	def schedule_delete(self, token, project_id, workflow_id):
+		"""
+		Queues a workflow for deletion. Empty workflow ids (e.g. when creation failed) are skipped without a request.
+			Parameters:
+				token (string): Access Token associated to the project
+				project_id (string): Id associated to the project
+				workflow_id (string): Id associated to the workflow inside the project
+
+			Returns:
+				Boolean. True if the deletion was queued.
+		"""
+		if not workflow_id:
+			with self.lock:
+				self.stats['skipped'] += 1
+			return False
+		self.queue.put((token, project_id, workflow_id))
+		with self.lock:
+			self.stats['scheduled'] += 1
+		return True
+
+	def drain(self):
+		"""
+		Blocks until every queued deletion has been sent
+
+			Returns:
+				The counters of the queue (scheduled, skipped, deleted, not_found, failed)
+		"""
+		self.queue.join()
+		with self.lock:
+			return dict(self.stats)
+
+	def close(self):
+		"""
+		Drains the queue and stops the workers
+
+			Returns:
+				The counters of the queue, see drain
+		"""
+		stats = self.drain()
+		for worker in self.workers:
+			self.queue.put(None)
+		for worker in self.workers:
+			worker.join()
+		return stats
+
+	def _work(self):
+		while True:
+			batch = [self.queue.get()]
+			#Take whatever else is already waiting, up to the batch size. A worker never takes more than one stop marker.
+			while batch[-1] is not None and len(batch) < self.batch_size:
+				try:
+					batch.append(self.queue.get_nowait())
+				except queue.Empty:
+					break
+			stop = False
+			for item in batch:
+				if item is None:
+					stop = True
+				else:
+					self._delete(*item)
+				self.queue.task_done()
+			if stop:
+				return
+
+	def _delete(self, token, project_id, workflow_id):
+		try:
+			res = delete_workflow(token, project_id, workflow_id)
+			outcome = {204: 'deleted', 404: 'not_found'}.get(res.status_code, 'failed')
+			error = None if outcome != 'failed' else f'status {res.status_code}'
+		except Exception as e:
+			outcome = 'failed'
+			error = repr(e)
+		with self.lock:
+			self.stats[outcome] += 1
+			if error is not None:
+				self.failures.append((workflow_id, error))
+
+def sweep_orphan_workflows(token, project_id, prefix=TEST_WORKFLOW_NAME_PREFIX, min_age_seconds=DEFAULT_ORPHAN_MIN_AGE_SECONDS, max_workers=DEFAULT_CLEANUP_WORKERS):
+	"""
+	Lists the project's workflows and deletes, in parallel, those left behind by earlier (e.g. interrupted) runs.
+	Only workflows whose name starts with the test prefix and that are older than min_age_seconds are deleted,
+	so that the workflows of runs still in progress are left alone.
+		Parameters:
+			token (string): Access Token associated to the project
+			project_id (string): Id associated to the project
+			prefix (string): Name prefix of the workflows created by the tests
+			min_age_seconds (int): Minimum age of a workflow before it is considered orphaned
+			max_workers (int): Number of parallel delete requests
+
+		Returns:
+			List of the deleted workflow ids
+	"""
+	res = get_workflows(token, project_id)
+	if res.status_code != 200:
+		raise RuntimeError(f'Sweep Orphan Workflows: Get Workflows failed with status {res.status_code}')
+
+	now = datetime.now(timezone.utc)
+	orphans = []
+	for workflow in Workflow.list_from_response(res):
+		if not (workflow.field('name', required=False) or '').startswith(prefix):
+			continue
+		created = _parse_timestamp(workflow.created_at)
+		if created is None or (now - created).total_seconds() < min_age_seconds:
+			continue
+		orphans.append(workflow.id)
+
+	def delete(workflow_id):
+		return delete_workflow(token, project_id, workflow_id).status_code in (204, 404)
+
+	with ThreadPoolExecutor(max_workers=max_workers) as executor:
+		results = list(executor.map(delete, orphans))
+	return [workflow_id for workflow_id, ok in zip(orphans, results) if ok]
+
+def _parse_timestamp(value):
+	#Parses the ISO 8601 timestamps of the API, e.g. 2020-05-12T10:11:12.123456Z
+	if not value:
+		return None
+	try:
+		parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+	except ValueError:
+		return None
+	if parsed.tzinfo is None:
+		parsed = parsed.replace(tzinfo=timezone.utc)
+	return parsed
@@ -1,6 +1,125 @@
-BASE_URI = 'api.up42.com'
-BASE_PROJECT_URI = f'{BASE_URI}/projects'
-NASA_MODIS_BLOCK_ID = 'ef6faaf5-8182-4986-bce4-4f811d2745e5'
-SHARPENING_FILTER_BLOCK_ID = 'e374ea64-dc3b-4500-bb4b-974260fb203e'
-MODIS_SHARPENING_TEST_JSON_FILE = 'TestData/modis_sharpening_job.json'
-MODIS_SHARPENING_TEST_JSON_FILE_INVALID = 'TestData/modis_sharpening_job_bad_schema.json'
\ No newline at end of file
+import os
+
+BASE_URI = 'api.up42.com'
+BASE_PROJECT_URI = f'{BASE_URI}/projects'
+#Set UP42_BASE_URL (e.g. http://127.0.0.1:8042) to point the clients at another server, such as the fake server
+BASE_URL = os.environ.get('UP42_BASE_URL') or f'https://{BASE_URI}'
+NASA_MODIS_BLOCK_ID = 'ef6faaf5-8182-4986-bce4-4f811d2745e5'
+SHARPENING_FILTER_BLOCK_ID = 'e374ea64-dc3b-4500-bb4b-974260fb203e'
+MODIS_SHARPENING_TEST_JSON_FILE = 'TestData/modis_sharpening_job.json'
+MODIS_SHARPENING_TEST_JSON_FILE_INVALID = 'TestData/modis_sharpening_job_bad_schema.json'
+TEST_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'TestData')
+
+#Endpoint path templates, relative to BASE_URL
+GET_ACCESSTOKEN_PATH = '/oauth/token'
+CREATE_WORKFLOW_PATH = '/projects/%s/workflows'
+GET_WORKFLOWS_PATH = '/projects/%s/workflows'
+GET_SPECIFIC_WORKFLOW_PATH = '/projects/%s/workflows/%s'
+DELETE_WORKFLOW_PATH = '/projects/%s/workflows/%s'
+ADD_TASK_TO_WORKFLOW_PATH = '/projects/%s/workflows/%s/tasks'
+CREATE_RUN_JOB_FOR_WORKFLOW_PATH = '/projects/%s/workflows/%s/jobs'
+CHECK_JOB_STATUS_PATH = '/projects/%s/jobs/%s'
+GET_JOBS_PATH = '/projects/%s/jobs'
+GET_JOB_TASKS_PATH = '/projects/%s/jobs/%s/tasks'
+GET_TASK_DOWNLOAD_URL_PATH = '/projects/%s/jobs/%s/tasks/%s/downloads/results'
+
+#Connection pool settings for the shared UP42 client
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 16
+DEFAULT_KEEP_ALIVE = True
+
+#Access Token caching
+TOKEN_REFRESH_MARGIN_SECONDS = 60
+DEFAULT_TOKEN_TTL_SECONDS = 300
+TOKEN_CACHE_FILE_ENV = 'UP42_TOKEN_CACHE_FILE'
+
+#Maximum number of job status requests in flight when watching many jobs at once
+DEFAULT_MAX_CONCURRENT_STATUS_CHECKS = 50
+
+#Job status polling
+JOB_TERMINAL_STATUSES = frozenset(('SUCCEEDED', 'FAILED', 'CANCELLED', 'ERROR'))
+POLL_MIN_DELAY_SECONDS = 1
+POLL_MAX_DELAY_SECONDS = 15
+POLL_BACKOFF_MULTIPLIER = 1.5
+POLL_JITTER = 0.2
+
+#Job status webhooks (see job_events)
+JOB_EVENTS_PATH = '/webhooks/jobs'
+JOB_EVENT_SIGNATURE_HEADER = 'X-UP42-Signature'
+JOB_EVENT_FALLBACK_POLL_SECONDS = 60
+
+#In-process fake UP42 server (see fake_up42_server)
+FAKE_JOB_TIMELINE = (('PENDING', 0), ('RUNNING', 0.05), ('SUCCEEDED', 0.2))
+FAKE_MAX_WORKFLOW_NAME_LENGTH = 200
+FAKE_DATA_BLOCK_IDS = frozenset((NASA_MODIS_BLOCK_ID,))
+FAKE_BLOCK_PARAMETERS = {
+	NASA_MODIS_BLOCK_ID: frozenset(('time', 'limit', 'zoom_level', 'imagery_layers', 'bbox', 'intersects', 'contains')),
+	SHARPENING_FILTER_BLOCK_ID: frozenset(('strength',)),
+}
+FAKE_OUTPUT_SIZE = 256 * 1024
+FAKE_DOWNLOAD_PATH = '/downloads/%s/%s'
+
+#Workflow pool leased to tests
+DEFAULT_WORKFLOW_POOL_SIZE = 4
+DEFAULT_WORKFLOW_POOL_WORKERS = 8
+
+#Background cleanup of the workflows created by the tests
+TEST_WORKFLOW_NAME_PREFIX = 'apitest-'
+DEFAULT_CLEANUP_WORKERS = 4
+DEFAULT_CLEANUP_MAX_QUEUED = 1000
+DEFAULT_CLEANUP_BATCH_SIZE = 10
+DEFAULT_ORPHAN_MIN_AGE_SECONDS = 3600
+
+#Batch job submission (see job_scheduler)
+DEFAULT_SUBMIT_WORKERS = 8
+DEFAULT_SUBMIT_RATE_PER_SECOND = 5
+DEFAULT_SUBMIT_BURST = 5
+DEFAULT_SUBMIT_MAX_ATTEMPTS = 5
+DEFAULT_SUBMIT_RETRY_DELAY_SECONDS = 1
+
+#Download of job outputs (see job_outputs)
+DEFAULT_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DEFAULT_DOWNLOAD_WORKERS = 4
+DEFAULT_DOWNLOAD_MAX_ATTEMPTS = 3
+DEFAULT_DOWNLOAD_BACKOFF_SECONDS = 0.5
+DEFAULT_DOWNLOAD_BACKOFF_MAX_SECONDS = 8
+
+#Timeouts, retries, hedging and circuit breaker of the API calls (see resilience)
+DEFAULT_CONNECT_TIMEOUT_SECONDS = 5
+DEFAULT_READ_TIMEOUT_SECONDS = 30
+ENDPOINT_TIMEOUTS = {
+	'get_access_token': (5, 10),
+	'get_specific_workflow': (5, 10),
+	'check_job_status': (5, 10),
+	'delete_workflow': (5, 30),
+	'download_results': (5, 60),
+}
+#Calls safe to send more than once. Delete Workflow is retried but never hedged: a duplicate delete answers 404 and could win.
+IDEMPOTENT_ENDPOINTS = ('get_access_token', 'get_workflows', 'get_specific_workflow', 'check_job_status', 'get_jobs',
+	'get_job_tasks', 'get_task_download_url', 'delete_workflow')
+HEDGED_ENDPOINTS = ('get_access_token', 'get_workflows', 'get_specific_workflow', 'check_job_status', 'get_jobs',
+	'get_job_tasks', 'get_task_download_url')
+#Deletes whose retry answers 404 when the lost answer of an earlier attempt was a successful delete, that 404 counts as a 204
+DELETE_ENDPOINTS = ('delete_workflow',)
+RETRY_STATUSES = (500, 502, 503, 504)
+DEFAULT_RETRY_ATTEMPTS = 3
+DEFAULT_RETRY_BACKOFF_SECONDS = 0.2
+DEFAULT_RETRY_BACKOFF_MAX_SECONDS = 2
+DEFAULT_HEDGE_PERCENTILE = 95
+DEFAULT_HEDGE_MIN_SAMPLES = 20
+DEFAULT_HEDGE_WINDOW = 200
+DEFAULT_HEDGE_MIN_DELAY_SECONDS = 0.05
+DEFAULT_HEDGE_WORKERS = 64
+DEFAULT_BREAKER_FAILURE_THRESHOLD = 5
+DEFAULT_BREAKER_RESET_SECONDS = 30
+
+#Job parameter catalog of the TestData payloads (see payload_catalog)
+#Block run by a task, from the part of the task name before the colon, e.g. nasa-modis:1
+TASK_NAME_BLOCK_IDS = {
+	'nasa-modis': NASA_MODIS_BLOCK_ID,
+	'sharpening': SHARPENING_FILTER_BLOCK_ID,
+}
+MODIS_MAX_ZOOM_LEVEL = 9
+MODIS_MAX_LIMIT = 100
+SHARPENING_STRENGTHS = ('light', 'medium', 'strong')
+PAYLOAD_VALIDATION_ENV = 'UP42_VALIDATE_PAYLOADS'
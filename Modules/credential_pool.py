@@ -0,0 +1,169 @@
+import contextlib
+import threading
+import time
+import weakref
+
+"""
+	Several UP42 projects used side by side, so that parallel test and load runs are not capped by the rate limits
+	and quotas of a single project. Projects are read from config.ini:
+
+		[keys]
+		project_id = ...
+		project_api_key = ...
+
+		[project:second]
+		project_id = ...
+		project_api_key = ...
+"""
+
+PROJECT_SECTION_PREFIX = 'project:'
+
+class ProjectCredentials:
+	"""
+	Credentials of one project
+		Parameters:
+			label (string): Name of the config.ini section, e.g. keys or project:second
+			project_id (string): Id associated to the project
+			project_api_key (string): Api key associated to the project
+	"""
+	__slots__ = ('label', 'project_id', 'project_api_key')
+
+	def __init__(self, label, project_id, project_api_key):
+		self.label = label
+		self.project_id = project_id
+		self.project_api_key = project_api_key
+
+	def __repr__(self):
+		#Never show the api key
+		return f'ProjectCredentials({self.label!r}, {self.project_id!r})'
+
+def load_project_credentials(config):
+	"""
+	Reads every project of a config.ini: the [keys] section and every [project:NAME] section
+		Parameters:
+			config (ConfigParser): The parsed config.ini
+
+		Returns:
+			List of ProjectCredentials, each project id once. Raises ValueError if there is none.
+	"""
+	credentials = []
+	seen = set()
+	for section in config.sections():
+		if section != 'keys' and not section.startswith(PROJECT_SECTION_PREFIX):
+			continue
+		project_id = config[section].get('project_id')
+		project_api_key = config[section].get('project_api_key')
+		if not project_id or not project_api_key or project_id in seen:
+			continue
+		seen.add(project_id)
+		credentials.append(ProjectCredentials(section, project_id, project_api_key))
+	if not credentials:
+		raise ValueError('No project credentials found, expected a [keys] or [project:NAME] section with project_id and project_api_key')
+	return credentials
+
+class CredentialPool:
+	"""
+	Hands out projects by least recent use: the project with the fewest leases in flight, and among those
+	the one released longest ago. Tokens come from the shared token cache, so each project fetches its token once.
+		Parameters:
+			credentials (list): ProjectCredentials to share
+			offset (int): Rotates the initial order, e.g. by pytest-xdist worker number, so that workers starting
+				at the same time begin on different projects
+			clock (callable): Clock used for the usage report, replaceable in tests
+	"""
+	def __init__(self, credentials, offset=0, clock=time.monotonic):
+		if not credentials:
+			raise ValueError('Credential Pool: No project credentials given')
+		self.credentials = list(credentials)
+		self.clock = clock
+		self.lock = threading.Lock()
+		self.local = threading.local()
+		count = len(self.credentials)
+		#Lower rank is preferred. Every acquire and release moves the project behind all the others.
+		self.rank = {c.project_id: (i - offset) % count for i, c in enumerate(self.credentials)}
+		self.next_rank = count
+		self.in_flight = {c.project_id: 0 for c in self.credentials}
+		self.stats = {c.project_id: {'leases': 0, 'busy_seconds': 0.0, 'max_in_flight': 0} for c in self.credentials}
+
+	def acquire(self):
+		"""
+		Leases the least recently used project. Every acquire must be followed by a release.
+			Returns:
+				The ProjectCredentials
+		"""
+		with self.lock:
+			chosen = min(self.credentials, key=lambda c: (self.in_flight[c.project_id], self.rank[c.project_id]))
+			stats = self.stats[chosen.project_id]
+			self.in_flight[chosen.project_id] += 1
+			stats['leases'] += 1
+			stats['max_in_flight'] = max(stats['max_in_flight'], self.in_flight[chosen.project_id])
+			#Push the project back right away, so that concurrent acquires spread over the projects
+			self.rank[chosen.project_id] = self.next_rank
+			self.next_rank += 1
+		return chosen
+
+	def release(self, credentials, busy_seconds=0.0):
+		"""
+		Returns a leased project
+			Parameters:
+				credentials (ProjectCredentials): The leased project
+				busy_seconds (float): How long it was used, for the usage report
+		"""
+		with self.lock:
+			self.in_flight[credentials.project_id] -= 1
+			self.stats[credentials.project_id]['busy_seconds'] += busy_seconds
+			self.rank[credentials.project_id] = self.next_rank
+			self.next_rank += 1
+
+	@contextlib.contextmanager
+	def lease(self):
+		"""
+		Context manager leasing a project for the duration of the block
+			Returns:
+				Context manager yielding the ProjectCredentials
+		"""
+		credentials = self.acquire()
+		start = self.clock()
+		try:
+			yield credentials
+		finally:
+			self.release(credentials, self.clock() - start)
+
+	def for_thread(self):
+		"""
+		Returns the project assigned to the calling thread, leasing one on the thread's first call.
+		The lease is released when the thread finishes, so use it for long-lived threads such as load driver users.
+		"""
+		lease = getattr(self.local, 'lease', None)
+		if lease is None:
+			lease = self.local.lease = _ThreadLease(self.acquire())
+			#The thread's locals are dropped when it finishes, which ends the lease
+			weakref.finalize(lease, self._end_thread_lease, lease.credentials, self.clock())
+		return lease.credentials
+
+	def _end_thread_lease(self, credentials, start):
+		self.release(credentials, self.clock() - start)
+
+	def usage(self):
+		"""
+		Returns the usage of every project: leases, leases in flight, most leases held at once and total lease time
+			Returns:
+				Dict of config section label to usage dict
+		"""
+		with self.lock:
+			return {c.label: dict(self.stats[c.project_id], project_id=c.project_id, in_flight=self.in_flight[c.project_id])
+				for c in self.credentials}
+
+class _ThreadLease:
+	__slots__ = ('credentials', '__weakref__')
+
+	def __init__(self, credentials):
+		self.credentials = credentials
+
+def xdist_worker_number(worker_id):
+	"""
+	Returns the number of a pytest-xdist worker id (gw3 -> 3), or 0 outside of xdist
+	"""
+	if worker_id and worker_id.startswith('gw') and worker_id[2:].isdigit():
+		return int(worker_id[2:])
+	return 0
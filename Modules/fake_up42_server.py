@@ -0,0 +1,509 @@
+import base64
+import hashlib
+import json
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from Modules.constants import *
+from Modules import json_codec
+
+"""
+	In-process stand-in for the parts of the UP42 API used by api_helper, for fast offline runs and client benchmarks.
+	It follows the semantics the tests rely on: tokens from /oauth/token, 404 on a second delete,
+	400 on an invalid parentName or job parameter schema, and jobs that move through configurable states.
+"""
+
+class FakeUP42Server:
+	"""
+	Local HTTP server imitating the UP42 endpoints. Runs in a background thread.
+		Parameters:
+			host (string): Interface to listen on
+			port (int): Port to listen on, 0 picks a free port
+			job_timeline (list): (status, seconds after creation) pairs describing how every new job progresses
+			latency (dict): Endpoint name to added latency in seconds, either a number or a (min, max) range
+			error_rates (dict): Endpoint name to probability (0-1) of answering 500 instead
+			rate_limits (dict): Endpoint name to maximum number of requests per second, requests above it get a 429 with Retry-After
+			credentials (dict): Optional project_id to api key mapping. When not set, any credentials are accepted
+			token_ttl (int): Lifetime of issued tokens in seconds
+			max_workflow_name_length (int): Longest workflow name accepted
+			seed (int): Seed for the latency and error randomness
+			output_size (int): Size in bytes of the results archive of every job task
+			webhook_url (string): Url of a JobEventListener to send job status events to, as jobs move through their timeline
+			webhook_drop_rate (float): Probability (0-1) of losing each job status event
+
+		Endpoint names are: token, create_workflow, get_workflows, get_workflow, delete_workflow, add_tasks, create_job, get_jobs, job_status,
+		job_tasks, download_url, download
+	"""
+	def __init__(self, host='127.0.0.1', port=0, job_timeline=FAKE_JOB_TIMELINE, latency=None, error_rates=None, rate_limits=None,
+			credentials=None, token_ttl=3600, max_workflow_name_length=FAKE_MAX_WORKFLOW_NAME_LENGTH, seed=None,
+			output_size=FAKE_OUTPUT_SIZE, webhook_url=None, webhook_drop_rate=0):
+		self.job_timeline = list(job_timeline)
+		self.latency = dict(latency or {})
+		self.error_rates = dict(error_rates or {})
+		self.rate_limits = dict(rate_limits or {})
+		self.rate_windows = {}
+		self.credentials = credentials
+		self.token_ttl = token_ttl
+		self.max_workflow_name_length = max_workflow_name_length
+		self.output_size = output_size
+		self.webhook_url = webhook_url
+		self.webhook_drop_rate = webhook_drop_rate
+		self.timers = []
+		self.random = random.Random(seed)
+		self.lock = threading.Lock()
+		self.tokens = {}
+		self.workflows = {}
+		self.jobs = {}
+		self.request_log = []
+
+		self.httpd = ThreadingHTTPServer((host, port), _FakeUP42Handler)
+		self.httpd.daemon_threads = True
+		self.httpd.fake = self
+		self.thread = None
+
+	@property
+	def base_url(self):
+		host, port = self.httpd.server_address[:2]
+		return f'http://{host}:{port}'
+
+	def start(self):
+		self.thread = threading.Thread(target=self.httpd.serve_forever, name='fake-up42-server', daemon=True)
+		self.thread.start()
+		return self
+
+	def stop(self):
+		with self.lock:
+			timers, self.timers = self.timers, []
+		for timer in timers:
+			timer.cancel()
+		self.httpd.shutdown()
+		self.httpd.server_close()
+		if self.thread is not None:
+			self.thread.join()
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, *exc_info):
+		self.stop()
+
+	def reset(self):
+		"""
+		Forgets every token, workflow, job and logged request
+		"""
+		with self.lock:
+			self.tokens.clear()
+			self.workflows.clear()
+			self.jobs.clear()
+			self.request_log.clear()
+			self.rate_windows.clear()
+
+	def issue_token(self, project_id):
+		"""
+		Creates a JWT-shaped (unsigned) token for the project, carrying an exp claim like the real ones
+		"""
+		expires_at = int(time.time()) + self.token_ttl
+		header = _b64_json({'alg': 'none', 'typ': 'JWT'})
+		payload = _b64_json({'sub': project_id, 'exp': expires_at, 'jti': str(uuid.uuid4())})
+		token = f'{header}.{payload}.fake'
+		with self.lock:
+			self.tokens[token] = (project_id, expires_at)
+		return token
+
+	def job_status(self, job):
+		#Works out where a job is on its timeline
+		age = time.time() - job['created']
+		status = job['timeline'][0][0]
+		for name, at in job['timeline']:
+			if age >= at:
+				status = name
+		return status
+
+	def schedule_events(self, job):
+		#Sends a status event at every step of the job's timeline, when a webhook url is set
+		if not self.webhook_url:
+			return
+		for status, at in job['timeline']:
+			timer = threading.Timer(max(0, job['created'] + at - time.time()), self._emit_event, (job, status))
+			timer.daemon = True
+			with self.lock:
+				self.timers = [t for t in self.timers if t.is_alive()]
+				self.timers.append(timer)
+			timer.start()
+
+	def _emit_event(self, job, status):
+		from Modules.job_events import emit_job_event
+		if self.random.random() < self.webhook_drop_rate:
+			return
+		try:
+			emit_job_event(self.webhook_url, job['id'], status, projectId=job['projectId'], workflowId=job['workflowId'])
+		except Exception:
+			#Like real webhooks, an event the listener did not take is lost
+			pass
+
+	def output_content(self, task_id):
+		#Deterministic content of a task's results archive
+		return random.Random(task_id).randbytes(self.output_size)
+
+	def is_rate_limited(self, endpoint):
+		#Counts requests per endpoint in one second windows, returns True once the limit of the current window is used up
+		limit = self.rate_limits.get(endpoint)
+		if limit is None:
+			return False
+		window = int(time.time())
+		with self.lock:
+			start, count = self.rate_windows.get(endpoint, (window, 0))
+			if start != window:
+				count = 0
+			self.rate_windows[endpoint] = (window, count + 1)
+		return count >= limit
+
+	def request_counts(self):
+		"""
+		Returns the number of requests served per endpoint name
+		"""
+		counts = {}
+		with self.lock:
+			for endpoint, method, path, status in self.request_log:
+				counts[endpoint] = counts.get(endpoint, 0) + 1
+		return counts
+
+class _FakeUP42Handler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+
+	def setup(self):
+		super().setup()
+		#Headers and body go out in two writes on a kept-alive connection, without TCP_NODELAY the body waits
+		#for the ACK of the headers (Nagle and delayed ACK), adding about 40ms to every call
+		self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+	def log_message(self, format, *args):
+		#Keep the test output clean
+		pass
+
+	def do_GET(self):
+		self._dispatch('GET')
+
+	def do_POST(self):
+		self._dispatch('POST')
+
+	def do_DELETE(self):
+		self._dispatch('DELETE')
+
+	def _dispatch(self, method):
+		fake = self.server.fake
+		parts = urlsplit(self.path)
+		path = parts.path
+		self.query = parse_qs(parts.query)
+		length = int(self.headers.get('Content-Length') or 0)
+		self.body = self.rfile.read(length) if length else b''
+
+		for route_method, pattern, endpoint, handler in _ROUTES:
+			match = pattern.fullmatch(path)
+			if match and route_method == method:
+				break
+		else:
+			self._reply(fake, None, method, path, 404, {'data': None, 'error': {'code': 'NOT_FOUND', 'message': 'Unknown endpoint'}})
+			return
+
+		if fake.is_rate_limited(endpoint):
+			self._reply(fake, endpoint, method, path, 429, {'data': None, 'error': {'code': 'TOO_MANY_REQUESTS', 'message': 'Rate limit exceeded'}},
+				{'Retry-After': '1'})
+			return
+
+		delay = fake.latency.get(endpoint, 0)
+		if isinstance(delay, (tuple, list)):
+			delay = fake.random.uniform(*delay)
+		if delay:
+			time.sleep(delay)
+		if fake.random.random() < fake.error_rates.get(endpoint, 0):
+			self._reply(fake, endpoint, method, path, 500, {'data': None, 'error': {'code': 'INTERNAL_ERROR', 'message': 'Injected failure'}})
+			return
+
+		self._reply(fake, endpoint, method, path, *handler(self, fake, *match.groups()))
+
+	def _reply(self, fake, endpoint, method, path, status, body, headers=None):
+		with fake.lock:
+			fake.request_log.append((endpoint, method, path, status))
+		if isinstance(body, bytes):
+			payload, content_type = body, 'application/octet-stream'
+		else:
+			payload, content_type = b'' if body is None else json_codec.dumps(body), 'application/json'
+		self.send_response(status)
+		if payload:
+			self.send_header('Content-Type', content_type)
+		self.send_header('Content-Length', str(len(payload)))
+		for name, value in (headers or {}).items():
+			self.send_header(name, value)
+		if self.close_connection:
+			#Answer a Connection: close request like a real server, else the client may pool the socket this handler is about to close
+			self.send_header('Connection', 'close')
+		self.end_headers()
+		self.wfile.write(payload)
+
+	def _json_body(self):
+		try:
+			return json_codec.loads(self.body or b'null')
+		except ValueError:
+			return _INVALID
+
+	def _authorize(self, fake, project_id):
+		#Returns an error (status, body) tuple, or None when the bearer token is valid for the project
+		header = self.headers.get('Authorization', '')
+		if not header.startswith('Bearer '):
+			return _error(401, 'UNAUTHORIZED', 'Missing bearer token')
+		with fake.lock:
+			owner = fake.tokens.get(header[len('Bearer '):])
+		if owner is None or owner[1] < time.time():
+			return _error(401, 'UNAUTHORIZED', 'Invalid or expired token')
+		if owner[0] != project_id:
+			return _error(403, 'FORBIDDEN', 'Token does not belong to this project')
+		return None
+
+	def handle_token(self, fake):
+		header = self.headers.get('Authorization', '')
+		try:
+			if not header.startswith('Basic '):
+				raise ValueError('Not basic auth')
+			project_id, api_key = base64.b64decode(header[len('Basic '):]).decode().split(':', 1)
+		except ValueError:
+			return _error(401, 'UNAUTHORIZED', 'Missing client credentials')
+		if not project_id or not api_key:
+			return _error(401, 'UNAUTHORIZED', 'Missing client credentials')
+		if fake.credentials is not None and fake.credentials.get(project_id) != api_key:
+			return _error(401, 'UNAUTHORIZED', 'Invalid client credentials')
+		return 200, {'data': {'accessToken': fake.issue_token(project_id)}, 'error': None}
+
+	def handle_create_workflow(self, fake, project_id):
+		error = self._authorize(fake, project_id)
+		if error:
+			return error
+		body = self._json_body()
+		if not isinstance(body, dict) or not isinstance(body.get('name'), str) or not body['name']:
+			return _error(400, 'BAD_REQUEST', 'Workflow name is required')
+		if len(body['name']) > fake.max_workflow_name_length:
+			return _error(400, 'BAD_REQUEST', f'Workflow name is longer than {fake.max_workflow_name_length} characters')
+		workflow = {
+			'id': str(uuid.uuid4()),
+			'projectId': project_id,
+			'name': body['name'],
+			'description': body.get('description') or '',
+			'tasks': [],
+			'createdAt': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+		}
+		with fake.lock:
+			fake.workflows[workflow['id']] = workflow
+		return 200, {'data': _public_workflow(workflow), 'error': None}
+
+	def handle_get_workflows(self, fake, project_id):
+		error = self._authorize(fake, project_id)
+		if error:
+			return error
+		with fake.lock:
+			workflows = [_public_workflow(w) for w in fake.workflows.values() if w['projectId'] == project_id]
+		return 200, {'data': workflows, 'error': None}
+
+	def handle_get_workflow(self, fake, project_id, workflow_id):
+		error = self._authorize(fake, project_id)
+		if error:
+			return error
+		workflow = _find(fake.workflows, project_id, workflow_id)
+		if workflow is None:
+			return _error(404, 'NOT_FOUND', 'Workflow not found')
+		return 200, {'data': _public_workflow(workflow), 'error': None}
+
+	def handle_delete_workflow(self, fake, project_id, workflow_id):
+		error = self._authorize(fake, project_id)
+		if error:
+			return error
+		with fake.lock:
+			workflow = _find(fake.workflows, project_id, workflow_id)
+			if workflow is None:
+				return _error(404, 'NOT_FOUND', 'Workflow not found')
+			del fake.workflows[workflow_id]
+		return 204, None
+
+	def handle_add_tasks(self, fake, project_id, workflow_id):
+		error = self._authorize(fake, project_id)
+		if error:
+			return error
+		workflow = _find(fake.workflows, project_id, workflow_id)
+		if workflow is None:
+			return _error(404, 'NOT_FOUND', 'Workflow not found')
+
+		tasks = self._json_body()
+		if not isinstance(tasks, list):
+			return _error(400, 'BAD_REQUEST', 'Expected a list of tasks')
+		seen = set()
+		for task in tasks:
+			if not isinstance(task, dict) or not task.get('name') or not task.get('blockId'):
+				return _error(400, 'BAD_REQUEST', 'Every task needs a name and a blockId')
+			parent = task.get('parentName')
+			if task['blockId'] in FAKE_DATA_BLOCK_IDS:
+				if parent is not None:
+					return _error(400, 'BAD_REQUEST', f"Data block task {task['name']} cannot have a parentName")
+			elif parent not in seen:
+				return _error(400, 'BAD_REQUEST', f"Invalid parentName {parent!r} for task {task['name']}")
+			seen.add(task['name'])
+
+		stored = [{'id': str(uuid.uuid4()), 'name': t['name'], 'parentName': t.get('parentName'), 'blockId': t['blockId']} for t in tasks]
+		with fake.lock:
+			workflow['tasks'] = stored
+		return 200, {'data': stored, 'error': None}
+
+	def handle_create_job(self, fake, project_id, workflow_id):
+		error = self._authorize(fake, project_id)
+		if error:
+			return error
+		workflow = _find(fake.workflows, project_id, workflow_id)
+		if workflow is None:
+			return _error(404, 'NOT_FOUND', 'Workflow not found')
+
+		params = self._json_body()
+		schema_error = _validate_job_parameters(workflow, params)
+		if schema_error:
+			return _error(400, 'BAD_REQUEST', schema_error)
+
+		job = {
+			'id': str(uuid.uuid4()),
+			'projectId': project_id,
+			'workflowId': workflow_id,
+			'name': self.query.get('name', [None])[0],
+			'inputs': params,
+			'tasks': [{'id': str(uuid.uuid4()), 'name': task['name'], 'blockId': task['blockId']} for task in workflow['tasks']],
+			'created': time.time(),
+			'timeline': list(fake.job_timeline),
+		}
+		with fake.lock:
+			fake.jobs[job['id']] = job
+		fake.schedule_events(job)
+		return 200, {'data': _public_job(fake, job), 'error': None}
+
+	def handle_get_jobs(self, fake, project_id):
+		error = self._authorize(fake, project_id)
+		if error:
+			return error
+		with fake.lock:
+			jobs = [job for job in fake.jobs.values() if job['projectId'] == project_id]
+		return 200, {'data': [_public_job(fake, job) for job in jobs], 'error': None}
+
+	def handle_get_job_tasks(self, fake, project_id, job_id):
+		error = self._authorize(fake, project_id)
+		if error:
+			return error
+		job = _find(fake.jobs, project_id, job_id)
+		if job is None:
+			return _error(404, 'NOT_FOUND', 'Job not found')
+		status = fake.job_status(job)
+		return 200, {'data': [dict(task, status=status) for task in job['tasks']], 'error': None}
+
+	def handle_get_download_url(self, fake, project_id, job_id, task_id):
+		error = self._authorize(fake, project_id)
+		if error:
+			return error
+		job = _find(fake.jobs, project_id, job_id)
+		if job is None or not any(task['id'] == task_id for task in job['tasks']):
+			return _error(404, 'NOT_FOUND', 'Job task not found')
+		if fake.job_status(job) != 'SUCCEEDED':
+			return _error(404, 'NOT_FOUND', 'Results are only available once the job succeeded')
+		url = fake.base_url + FAKE_DOWNLOAD_PATH % (job_id, task_id)
+		return 200, {'data': {'url': f'{url}?{_signed_query()}'}, 'error': None}
+
+	def handle_download(self, fake, job_id, task_id):
+		#Stands in for the signed storage url: no token, the signature is not checked, Range support and an md5 in x-goog-hash
+		job = fake.jobs.get(job_id)
+		if job is None or not any(task['id'] == task_id for task in job['tasks']):
+			return _error(404, 'NOT_FOUND', 'No such object')
+		content = fake.output_content(task_id)
+		headers = {'x-goog-hash': 'md5=' + base64.b64encode(hashlib.md5(content).digest()).decode(), 'Accept-Ranges': 'bytes'}
+		match = re.fullmatch(r'bytes=(\d+)-', self.headers.get('Range') or '')
+		if not match:
+			return 200, content, headers
+		start = int(match.group(1))
+		if start >= len(content):
+			return 416, None, dict(headers, **{'Content-Range': f'bytes */{len(content)}'})
+		headers['Content-Range'] = f'bytes {start}-{len(content) - 1}/{len(content)}'
+		return 206, content[start:], headers
+
+	def handle_job_status(self, fake, project_id, job_id):
+		error = self._authorize(fake, project_id)
+		if error:
+			return error
+		job = _find(fake.jobs, project_id, job_id)
+		if job is None:
+			return _error(404, 'NOT_FOUND', 'Job not found')
+		return 200, {'data': _public_job(fake, job), 'error': None}
+
+_INVALID = object()
+
+def _validate_job_parameters(workflow, params):
+	#Returns an error message, or None when the job parameters match the workflow tasks
+	if not workflow['tasks']:
+		return 'Workflow has no tasks'
+	if not isinstance(params, dict):
+		return 'Job parameters must be an object'
+	tasks = {task['name']: task for task in workflow['tasks']}
+	for name, task_params in params.items():
+		task = tasks.get(name)
+		if task is None:
+			return f'Unknown task {name}'
+		if not isinstance(task_params, dict):
+			return f'Parameters of {name} must be an object'
+		allowed = FAKE_BLOCK_PARAMETERS.get(task['blockId'])
+		if allowed is not None:
+			unknown = set(task_params) - allowed
+			if unknown:
+				return f'Unknown parameters for {name}: {", ".join(sorted(unknown))}'
+	return None
+
+def _find(collection, project_id, item_id):
+	item = collection.get(item_id)
+	if item is None or item['projectId'] != project_id:
+		return None
+	return item
+
+def _public_workflow(workflow):
+	return {'id': workflow['id'], 'name': workflow['name'], 'description': workflow['description'], 'createdAt': workflow['createdAt'], 'totalProcessingTime': 0}
+
+def _public_job(fake, job):
+	return {'id': job['id'], 'name': job['name'], 'workflowId': job['workflowId'], 'status': fake.job_status(job), 'inputs': job['inputs']}
+
+def _error(status, code, message):
+	return status, {'data': None, 'error': {'code': code, 'message': message}}
+
+def _signed_query():
+	#Query string of a V4 signed storage url, with a new signature on every call like the real ones
+	return urlencode({
+		'X-Goog-Algorithm': 'GOOG4-RSA-SHA256',
+		'X-Goog-Credential': 'fake-signer@up42.iam.gserviceaccount.com/auto/storage/goog4_request',
+		'X-Goog-Date': datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ'),
+		'X-Goog-Expires': '900',
+		'X-Goog-SignedHeaders': 'host',
+		'X-Goog-Signature': uuid.uuid4().hex + uuid.uuid4().hex,
+	})
+
+def _b64_json(value):
+	return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+_ID = r'([^/]+)'
+_ROUTES = [
+	('POST', re.compile(GET_ACCESSTOKEN_PATH), 'token', _FakeUP42Handler.handle_token),
+	('POST', re.compile(CREATE_WORKFLOW_PATH % _ID), 'create_workflow', _FakeUP42Handler.handle_create_workflow),
+	('GET', re.compile(GET_WORKFLOWS_PATH % _ID), 'get_workflows', _FakeUP42Handler.handle_get_workflows),
+	('GET', re.compile(GET_SPECIFIC_WORKFLOW_PATH % (_ID, _ID)), 'get_workflow', _FakeUP42Handler.handle_get_workflow),
+	('DELETE', re.compile(DELETE_WORKFLOW_PATH % (_ID, _ID)), 'delete_workflow', _FakeUP42Handler.handle_delete_workflow),
+	('POST', re.compile(ADD_TASK_TO_WORKFLOW_PATH % (_ID, _ID)), 'add_tasks', _FakeUP42Handler.handle_add_tasks),
+	('POST', re.compile(CREATE_RUN_JOB_FOR_WORKFLOW_PATH % (_ID, _ID)), 'create_job', _FakeUP42Handler.handle_create_job),
+	('GET', re.compile(GET_JOBS_PATH % _ID), 'get_jobs', _FakeUP42Handler.handle_get_jobs),
+	('GET', re.compile(CHECK_JOB_STATUS_PATH % (_ID, _ID)), 'job_status', _FakeUP42Handler.handle_job_status),
+	('GET', re.compile(GET_JOB_TASKS_PATH % (_ID, _ID)), 'job_tasks', _FakeUP42Handler.handle_get_job_tasks),
+	('GET', re.compile(GET_TASK_DOWNLOAD_URL_PATH % (_ID, _ID, _ID)), 'download_url', _FakeUP42Handler.handle_get_download_url),
+	('GET', re.compile(FAKE_DOWNLOAD_PATH % (_ID, _ID)), 'download', _FakeUP42Handler.handle_download),
+]
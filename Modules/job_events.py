@@ -0,0 +1,253 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import threading
+import time
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from Modules.constants import *
+from Modules.job_poller import JobPoller, JobPollResult, PollState
+
+"""
+	Job completion from status-change webhooks instead of polling.
+	JobEventListener is a local HTTP endpoint receiving job status events and resolving one future per job.
+	EventJobPoller plugs it into the wait API (see job_poller.set_default_poller): waits end as soon as the event arrives,
+	and Check Job Status is only called once up front and then every JOB_EVENT_FALLBACK_POLL_SECONDS, in case an event is lost.
+
+	Events are json objects, or lists of them, like:
+		{"event": "job.status", "body": {"jobId": "...", "status": "SUCCEEDED"}}
+	When a secret is set, the body must be signed with HMAC-SHA256, hex encoded in the X-UP42-Signature header.
+"""
+
+class JobEventListener:
+	"""
+	Local HTTP server receiving job status events. Runs in a background thread.
+		Parameters:
+			host (string): Interface to listen on
+			port (int): Port to listen on, 0 picks a free port
+			secret (string): Shared secret events must be signed with, or None to accept unsigned events
+	"""
+	def __init__(self, host='127.0.0.1', port=0, secret=None):
+		self.secret = secret
+		self.lock = threading.Lock()
+		self.statuses = {}
+		self.futures = {}
+		self.waiters = {}
+		self.events_received = 0
+
+		self.httpd = _JobEventServer((host, port), _JobEventHandler)
+		self.httpd.listener = self
+		self.thread = None
+
+	@property
+	def url(self):
+		host, port = self.httpd.server_address[:2]
+		return f'http://{host}:{port}{JOB_EVENTS_PATH}'
+
+	def start(self):
+		self.thread = threading.Thread(target=self.httpd.serve_forever, name='job-event-listener', daemon=True)
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.httpd.shutdown()
+		self.httpd.server_close()
+		if self.thread is not None:
+			self.thread.join()
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, *exc_info):
+		self.stop()
+
+	def record(self, job_id, status):
+		"""
+		Records a status event. A terminal status resolves the job's future, later events for the job are ignored.
+		"""
+		with self.lock:
+			self.events_received += 1
+			if self.statuses.get(job_id) in JOB_TERMINAL_STATUSES:
+				return
+			self.statuses[job_id] = status
+			future = self.futures.get(job_id)
+		if future is not None and status in JOB_TERMINAL_STATUSES and not future.done():
+			future.set_result(status)
+
+	def status(self, job_id):
+		"""
+		Returns the last status received for a job, or None
+		"""
+		with self.lock:
+			return self.statuses.get(job_id)
+
+	def future(self, job_id):
+		"""
+		Returns a concurrent.futures.Future resolved with the job's terminal status.
+		Events received before the call count, so the future may already be done.
+		Every call counts as one waiter of the job, call forget once done with the future.
+		"""
+		with self.lock:
+			self.waiters[job_id] = self.waiters.get(job_id, 0) + 1
+			future = self.futures.get(job_id)
+			if future is None:
+				future = self.futures[job_id] = Future()
+				status = self.statuses.get(job_id)
+				if status in JOB_TERMINAL_STATUSES:
+					future.set_result(status)
+		return future
+
+	async def wait(self, job_id, timeout=None):
+		"""
+		Awaitable version of future
+			Returns:
+				The terminal status. Raises asyncio.TimeoutError when no terminal event arrives in time.
+		"""
+		try:
+			return await asyncio.wait_for(asyncio.wrap_future(self.future(job_id)), timeout)
+		finally:
+			self.forget(job_id)
+
+	def forget(self, job_id):
+		"""
+		Ends one wait for a job. What is known about the job is dropped when its last waiter is done.
+		"""
+		with self.lock:
+			waiters = self.waiters.pop(job_id, 0) - 1
+			if waiters > 0:
+				self.waiters[job_id] = waiters
+				return
+			self.statuses.pop(job_id, None)
+			self.futures.pop(job_id, None)
+
+class EventJobPoller(JobPoller):
+	"""
+	JobPoller waiting for webhook events, with slow polling as a fallback for lost events
+		Parameters:
+			listener (JobEventListener): Listener receiving the job status events
+			fallback_delay (float): Seconds between two status checks of a job without events
+			status_fn (callable): status_fn(token, project_id, job_id) returning a response object, defaults to the shared UP42Client
+			clock (callable): Monotonic clock
+	"""
+	def __init__(self, listener, fallback_delay=JOB_EVENT_FALLBACK_POLL_SECONDS, status_fn=None, clock=time.monotonic):
+		super().__init__(status_fn=status_fn, clock=clock)
+		self.listener = listener
+		self.fallback_delay = fallback_delay
+
+	def poll_many(self, token, project_id, job_ids, max_wait_seconds):
+		"""
+		Waits for many Jobs, see JobPoller.poll_many. Jobs are checked once right away, in case they finished
+		before the listener heard of them, then only every fallback_delay seconds and at the deadline.
+		"""
+		start_time = self.clock()
+		deadline = start_time + max_wait_seconds
+		states = {job_id: PollState() for job_id in job_ids}
+		futures = {job_id: self.listener.future(job_id) for job_id in states}
+		pending = set(states)
+		results = {}
+		next_check = start_time
+
+		def finish(job_id, now, timed_out=False):
+			state = states[job_id]
+			elapsed = now - start_time
+			if state.status in JOB_TERMINAL_STATUSES:
+				self.policy.observe(elapsed)
+			results[job_id] = JobPollResult(job_id, state.status, elapsed, state.polls, timed_out=timed_out, error=state.error)
+			pending.discard(job_id)
+			self.listener.forget(job_id)
+
+		while pending:
+			now = self.clock()
+			for job_id in [job_id for job_id in pending if futures[job_id].done()]:
+				states[job_id].status = futures[job_id].result()
+				states[job_id].error = None
+				finish(job_id, now)
+
+			if pending and now >= next_check:
+				for job_id in list(pending):
+					state = states[job_id]
+					self._check(token, project_id, job_id, state)
+					if state.status in JOB_TERMINAL_STATUSES or state.fatal:
+						finish(job_id, now)
+				if pending and now >= deadline:
+					for job_id in list(pending):
+						finish(job_id, now, timed_out=True)
+				next_check = min(now + self.fallback_delay, deadline)
+				continue
+
+			if pending:
+				wait([futures[job_id] for job_id in pending], timeout=max(next_check - self.clock(), 0), return_when=FIRST_COMPLETED)
+
+		return {job_id: results[job_id] for job_id in states}
+
+def emit_job_event(url, job_id, status, secret=None, timeout=5, **fields):
+	"""
+	Posts a job status event to a listener, e.g. from the fake UP42 server or a test
+		Parameters:
+			url (string): Url of the listener, see JobEventListener.url
+			job_id (string): Id associated to the job
+			status (string): New status of the job
+			secret (string): Secret to sign the event with, or None
+			timeout (float): Seconds to wait for the listener
+			fields: Extra fields of the event body, e.g. projectId
+
+		Returns:
+			The http status code of the listener's answer
+	"""
+	payload = json.dumps({'event': 'job.status', 'body': dict(fields, jobId=job_id, status=status)}).encode()
+	headers = {'Content-Type': 'application/json'}
+	if secret is not None:
+		headers[JOB_EVENT_SIGNATURE_HEADER] = sign_event(payload, secret)
+	request = urllib.request.Request(url, data=payload, headers=headers, method='POST')
+	with urllib.request.urlopen(request, timeout=timeout) as response:
+		return response.status
+
+def sign_event(payload, secret):
+	"""
+	Returns the hex HMAC-SHA256 signature of an event body
+	"""
+	return hmac.new(secret.encode(), payload, hashlib.sha256).hexdigest()
+
+class _JobEventServer(ThreadingHTTPServer):
+	#Events of many jobs can arrive at once, the default backlog of 5 would refuse some of them
+	request_queue_size = 128
+	daemon_threads = True
+
+class _JobEventHandler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+
+	def log_message(self, format, *args):
+		#Keep the test output clean
+		pass
+
+	def do_POST(self):
+		listener = self.server.listener
+		length = int(self.headers.get('Content-Length') or 0)
+		payload = self.rfile.read(length) if length else b''
+		if urlsplit(self.path).path != JOB_EVENTS_PATH:
+			self._reply(404)
+			return
+		if listener.secret is not None:
+			signature = self.headers.get(JOB_EVENT_SIGNATURE_HEADER) or ''
+			if not hmac.compare_digest(signature, sign_event(payload, listener.secret)):
+				self._reply(401)
+				return
+		try:
+			events = json.loads(payload)
+		except ValueError:
+			self._reply(400)
+			return
+		for event in events if isinstance(events, list) else [events]:
+			body = event.get('body', event) if isinstance(event, dict) else None
+			if isinstance(body, dict) and body.get('jobId') and body.get('status'):
+				listener.record(body['jobId'], body['status'])
+		self._reply(204)
+
+	def _reply(self, status):
+		self.send_response(status)
+		self.send_header('Content-Length', '0')
+		self.end_headers()
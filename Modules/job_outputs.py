@@ -0,0 +1,286 @@
+import base64
+import binascii
+import contextlib
+import hashlib
+import mmap
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Modules.constants import *
+from Modules.api_objects import TaskList, response_data
+from Modules.call_timing import track
+
+"""
+	Download of the results of finished jobs.
+	Every task of a job has one result archive behind a signed url. Archives are streamed to disk in fixed-size chunks,
+	so large rasters are never held in memory. Interrupted downloads keep their <path>.part file and resume with a Range request.
+	The md5 announced by the storage (x-goog-hash or Content-MD5) is computed while the data arrives, and checked before the
+	.part file is renamed to its final path. Attempts are spaced with a bounded exponential backoff.
+"""
+
+class JobOutput:
+	"""
+	One task of a finished job, whose results can be downloaded
+		Parameters:
+			task_id (string): Id associated to the task of the job
+			name (string): Name of the task in the workflow, e.g. nasa-modis:1
+			block_id (string): Id of the block the task ran
+			status (string): Status of the task
+	"""
+	__slots__ = ('task_id', 'name', 'block_id', 'status')
+
+	def __init__(self, task_id, name=None, block_id=None, status=None):
+		self.task_id = task_id
+		self.name = name
+		self.block_id = block_id
+		self.status = status
+
+	def __repr__(self):
+		return f'JobOutput(task_id={self.task_id!r}, name={self.name!r}, status={self.status!r})'
+
+class DownloadResult:
+	"""
+	Outcome of downloading the results of one task
+		Parameters:
+			output (JobOutput): The downloaded task
+			path (string): Final path of the archive
+			bytes (int): Size of the archive on disk
+			resumed_from (int): Offset the last attempt resumed from, 0 for a download from the start
+			attempts (int): Number of download requests made
+			checksum (string): Hex md5 of the archive
+			verified (bool): Whether the md5 matched the one announced by the storage, None if none was announced
+			error (string): None on success, otherwise the last error
+	"""
+	def __init__(self, output, path):
+		self.output = output
+		self.path = path
+		self.bytes = 0
+		self.resumed_from = 0
+		self.attempts = 0
+		self.checksum = None
+		self.verified = None
+		self.error = None
+
+	@property
+	def succeeded(self):
+		return self.error is None
+
+	def __repr__(self):
+		return (f'DownloadResult(task_id={self.output.task_id!r}, path={self.path!r}, bytes={self.bytes}, '
+			f'attempts={self.attempts}, verified={self.verified}, error={self.error!r})')
+
+class JobOutputDownloader:
+	"""
+	Lists and downloads the results of finished jobs
+		Parameters:
+			chunk_size (int): Size of the chunks read from the network and written to disk
+			max_workers (int): Number of archives downloaded in parallel
+			max_attempts (int): Download requests made at most per archive
+			backoff (float): Delay before the second attempt in seconds, doubled for every further attempt
+			max_backoff (float): Upper bound of the delay between two attempts
+			client (UP42Client): Client used for the requests, defaults to the shared UP42Client
+			sleep (callable): Sleep function, replaced in tests
+	"""
+	def __init__(self, chunk_size=DEFAULT_DOWNLOAD_CHUNK_SIZE, max_workers=DEFAULT_DOWNLOAD_WORKERS, max_attempts=DEFAULT_DOWNLOAD_MAX_ATTEMPTS,
+			backoff=DEFAULT_DOWNLOAD_BACKOFF_SECONDS, max_backoff=DEFAULT_DOWNLOAD_BACKOFF_MAX_SECONDS, client=None, sleep=time.sleep):
+		self.chunk_size = chunk_size
+		self.max_workers = max_workers
+		self.max_attempts = max_attempts
+		self.backoff = backoff
+		self.max_backoff = max_backoff
+		self.client = client
+		self.sleep = sleep
+
+	def list_outputs(self, token, project_id, job_id):
+		"""
+		Lists the tasks of a job
+			Returns:
+				List of JobOutputs. Raises RuntimeError if the tasks cannot be listed.
+		"""
+		res = self._client().get_job_tasks(token, project_id, job_id)
+		if res.status_code != 200:
+			raise RuntimeError(f'List Job Outputs: Get Job Tasks failed with status {res.status_code}')
+		return [JobOutput(task.id, task.field('name', required=False), task.block_id, task.status) for task in TaskList.from_response(res)]
+
+	def download(self, token, project_id, job_id, output, path):
+		"""
+		Downloads the results of one task to path, resuming from path.part if an earlier attempt was interrupted
+			Parameters:
+				token (string): Access Token associated to the project
+				project_id (string): Id associated to the project
+				job_id (string): Id associated to the job
+				output (JobOutput): The task whose results are downloaded
+				path (string): Final path of the archive
+
+			Returns:
+				A DownloadResult. Never raises for download failures, see DownloadResult.error.
+		"""
+		client = self._client()
+		result = DownloadResult(output, path)
+		part_path = path + '.part'
+		directory = os.path.dirname(path)
+		if directory:
+			os.makedirs(directory, exist_ok=True)
+
+		while result.attempts < self.max_attempts:
+			if result.attempts:
+				#Exponential, bounded, with full jitter, so parallel downloads do not all come back at once
+				self.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (result.attempts - 1))))
+			result.attempts += 1
+			try:
+				res = client.get_task_download_url(token, project_id, job_id, output.task_id)
+				if res.status_code != 200:
+					result.error = f'Get Task Download Url failed with status {res.status_code}'
+					continue
+				url = response_data(res, 'Task download url')['url']
+			except Exception as e:
+				result.error = repr(e)
+				continue
+
+			start = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+			hasher = _hash_file(part_path, self.chunk_size) if start else hashlib.md5()
+			expected = None
+			with track('download_results', 'GET') as record:
+				try:
+					res = client.stream_download(url, start)
+				except Exception as e:
+					result.error = repr(e)
+					continue
+				try:
+					record.status = res.status_code
+					record.ttfb = res.elapsed.total_seconds()
+					if res.status_code == 200 and start:
+						#The range was ignored, the whole archive is coming again
+						start = 0
+						hasher = hashlib.md5()
+					elif res.status_code == 206 and _range_start(res.headers.get('Content-Range')) != start:
+						result.error = f"Unexpected Content-Range {res.headers.get('Content-Range')!r} for offset {start}"
+						_remove(part_path)
+						continue
+					elif res.status_code not in (200, 206):
+						result.error = f'Download failed with status {res.status_code}'
+						if res.status_code == 416:
+							#The partial file no longer matches the archive, start over
+							_remove(part_path)
+						continue
+					expected = _expected_md5(res.headers, res.status_code == 200)
+					result.resumed_from = start
+					with open(part_path, 'ab' if start else 'wb') as f:
+						for chunk in res.iter_content(chunk_size=self.chunk_size):
+							f.write(chunk)
+							hasher.update(chunk)
+							record.bytes += len(chunk)
+				except Exception as e:
+					#Keep the partial file, the next attempt resumes from it
+					result.error = repr(e)
+					continue
+				finally:
+					res.close()
+
+			result.checksum = hasher.hexdigest()
+			if expected is not None:
+				result.verified = result.checksum == expected
+				if not result.verified:
+					result.error = f'Checksum mismatch: got md5 {result.checksum}, expected {expected}'
+					_remove(part_path)
+					continue
+			os.replace(part_path, path)
+			result.bytes = os.path.getsize(path)
+			result.error = None
+			return result
+		return result
+
+	def download_all(self, token, project_id, job_id, directory, outputs=None):
+		"""
+		Downloads the results of every task of a job in parallel, to <directory>/<task id>.tar.gz
+			Parameters:
+				token (string): Access Token associated to the project
+				project_id (string): Id associated to the project
+				job_id (string): Id associated to the finished job
+				directory (string): Directory the archives are written to
+				outputs (list): JobOutputs to download, defaults to every task of the job
+
+			Returns:
+				Dict of task id to DownloadResult
+		"""
+		if outputs is None:
+			outputs = self.list_outputs(token, project_id, job_id)
+		def download(output):
+			return self.download(token, project_id, job_id, output, os.path.join(directory, f'{output.task_id}.tar.gz'))
+		with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job-output') as executor:
+			results = list(executor.map(download, outputs))
+		return {result.output.task_id: result for result in results}
+
+	def _client(self):
+		if self.client is not None:
+			return self.client
+		from Modules.up42_client import get_default_client
+		return get_default_client()
+
+def download_job_outputs(token, project_id, job_id, directory, max_workers=DEFAULT_DOWNLOAD_WORKERS):
+	"""
+	Downloads the results of every task of a finished job in parallel, see JobOutputDownloader
+		Parameters:
+			token (string): Access Token associated to the project
+			project_id (string): Id associated to the project
+			job_id (string): Id associated to the finished job
+			directory (string): Directory the archives are written to
+			max_workers (int): Number of archives downloaded in parallel
+
+		Returns:
+			Dict of task id to DownloadResult
+	"""
+	return JobOutputDownloader(max_workers=max_workers).download_all(token, project_id, job_id, directory)
+
+@contextlib.contextmanager
+def open_artifact(path):
+	"""
+	Memory-maps a downloaded archive read-only, so its content can be checked without copying it into memory
+		Parameters:
+			path (string): Path of the archive
+
+		Returns:
+			Context manager yielding a bytes-like, read-only view of the file
+	"""
+	with open(path, 'rb') as f:
+		if os.fstat(f.fileno()).st_size == 0:
+			#Empty files cannot be mapped
+			yield b''
+			return
+		with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+			yield view
+
+def _hash_file(path, chunk_size):
+	#md5 of the part already on disk, so that a resumed download can still be verified as a whole
+	hasher = hashlib.md5()
+	with open(path, 'rb') as f:
+		for chunk in iter(lambda: f.read(chunk_size), b''):
+			hasher.update(chunk)
+	return hasher
+
+def _expected_md5(headers, full_body):
+	#x-goog-hash always describes the whole object. Content-MD5 describes the body sent, so it only helps for a full download.
+	values = [part.strip()[len('md5='):] for part in (headers.get('x-goog-hash') or '').split(',') if part.strip().startswith('md5=')]
+	if not values and full_body and headers.get('Content-MD5'):
+		values = [headers.get('Content-MD5')]
+	if not values:
+		return None
+	try:
+		return base64.b64decode(values[0]).hex()
+	except (binascii.Error, ValueError):
+		return None
+
+def _range_start(content_range):
+	#Parses 'bytes 100-199/200' into 100
+	try:
+		return int(content_range.split(' ', 1)[1].split('-', 1)[0])
+	except (AttributeError, IndexError, ValueError):
+		return None
+
+def _remove(path):
+	try:
+		os.remove(path)
+	except FileNotFoundError:
+		pass
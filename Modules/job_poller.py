@@ -0,0 +1,236 @@
+import heapq
+import random
+import statistics
+import threading
+import time
+from collections import deque
+
+from Modules.constants import *
+from Modules.api_objects import Job, ResponseShapeError
+
+class JobPollResult:
+	"""
+	Outcome of waiting for a Job
+		Parameters:
+			job_id (string): Id associated to the job
+			status (string): Last status reported by the API, or None if it never answered
+			elapsed (float): Seconds spent waiting
+			polls (int): Number of Check Job Status calls made
+			timed_out (bool): Whether the wait gave up before the job reached a terminal state
+			error (string): Description of the last error encountered, if any
+	"""
+	def __init__(self, job_id, status, elapsed, polls, timed_out=False, error=None):
+		self.job_id = job_id
+		self.status = status
+		self.elapsed = elapsed
+		self.polls = polls
+		self.timed_out = timed_out
+		self.error = error
+
+	@property
+	def succeeded(self):
+		return self.status == 'SUCCEEDED'
+
+	@property
+	def is_terminal(self):
+		return self.status in JOB_TERMINAL_STATUSES
+
+	def __repr__(self):
+		return (f'JobPollResult(job_id={self.job_id!r}, status={self.status!r}, elapsed={self.elapsed:.1f}, '
+			f'polls={self.polls}, timed_out={self.timed_out}, error={self.error!r})')
+
+class BackoffPolicy:
+	"""
+	Decides how long to wait between two status checks of a Job.
+	Without history the delay grows exponentially. Once job durations have been observed, the poller sleeps
+	through most of the expected run time, checks often around the expected completion, then backs off again.
+	Every delay gets a random jitter so that many jobs started together do not poll in lockstep.
+		Parameters:
+			min_delay (float): Shortest delay between two checks, in seconds
+			max_delay (float): Longest delay between two checks, in seconds
+			multiplier (float): Growth factor of the exponential backoff
+			jitter (float): Relative jitter applied to each delay, e.g. 0.2 for +/-20%
+			history_size (int): Number of recent job durations remembered
+	"""
+	def __init__(self, min_delay=POLL_MIN_DELAY_SECONDS, max_delay=POLL_MAX_DELAY_SECONDS, multiplier=POLL_BACKOFF_MULTIPLIER,
+			jitter=POLL_JITTER, history_size=50):
+		self.min_delay = min_delay
+		self.max_delay = max_delay
+		self.multiplier = multiplier
+		self.jitter = jitter
+		self._durations = deque(maxlen=history_size)
+		self._lock = threading.Lock()
+
+	def observe(self, duration):
+		"""
+		Records how long a job took to reach a terminal state
+		"""
+		with self._lock:
+			self._durations.append(duration)
+
+	def expected_duration(self):
+		"""
+		Returns the median of the observed job durations, or None without history
+		"""
+		with self._lock:
+			if not self._durations:
+				return None
+			return statistics.median(self._durations)
+
+	def next_delay(self, polls, elapsed):
+		"""
+		Returns the delay before the next status check
+			Parameters:
+				polls (int): Number of checks made so far for this job
+				elapsed (float): Seconds since the wait started
+
+			Returns:
+				The delay in seconds
+		"""
+		expected = self.expected_duration()
+		if expected is not None and elapsed < expected:
+			#Sleep through half of the remaining expected time, so checks get denser near the expected completion
+			delay = (expected - elapsed) / 2
+		elif expected is not None:
+			#Past the expected completion, grow the delay with the overrun so it backs off geometrically
+			delay = (elapsed - expected) * (self.multiplier - 1)
+		else:
+			delay = self.min_delay * (self.multiplier ** max(polls - 1, 0))
+		delay = min(max(delay, self.min_delay), self.max_delay)
+		return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+class JobPoller:
+	"""
+	Waits for Jobs to reach a terminal state (see JOB_TERMINAL_STATUSES in constants)
+		Parameters:
+			status_fn (callable): status_fn(token, project_id, job_id) returning a response object, defaults to the shared UP42Client
+			policy (BackoffPolicy): Delay policy, shared between waits so it learns from observed job durations
+			clock (callable): Monotonic clock, replaceable in tests
+			sleep (callable): Sleep function, replaceable in tests
+	"""
+	def __init__(self, status_fn=None, policy=None, clock=time.monotonic, sleep=time.sleep):
+		self.status_fn = status_fn
+		self.policy = policy if policy is not None else BackoffPolicy()
+		self.clock = clock
+		self.sleep = sleep
+
+	def poll(self, token, project_id, job_id, max_wait_seconds):
+		"""
+		Waits for a single Job
+			Parameters:
+				token (string): Access Token associated to the project
+				project_id (string): Id associated to the project
+				job_id (string): Id associated to the job that is being checked
+				max_wait_seconds (int): Maximum amount of time (in seconds) user is willing to wait
+
+			Returns:
+				A JobPollResult
+		"""
+		return self.poll_many(token, project_id, [job_id], max_wait_seconds)[job_id]
+
+	def poll_many(self, token, project_id, job_ids, max_wait_seconds):
+		"""
+		Waits for many Jobs from a single loop, always checking the job whose next check is due first
+			Parameters:
+				token (string): Access Token associated to the project
+				project_id (string): Id associated to the project
+				job_ids (list): Ids of the jobs being checked
+				max_wait_seconds (int): Maximum amount of time (in seconds) user is willing to wait for all of them
+
+			Returns:
+				Dict of job id to JobPollResult
+		"""
+		start_time = self.clock()
+		deadline = start_time + max_wait_seconds
+		states = {job_id: PollState() for job_id in job_ids}
+		due = [(start_time, i, job_id) for i, job_id in enumerate(states)]
+		heapq.heapify(due)
+		results = {}
+
+		while due:
+			next_time, i, job_id = heapq.heappop(due)
+			now = self.clock()
+			if next_time > now:
+				self.sleep(next_time - now)
+				now = self.clock()
+
+			state = states[job_id]
+			self._check(token, project_id, job_id, state)
+			elapsed = now - start_time
+
+			if state.status in JOB_TERMINAL_STATUSES or state.fatal:
+				if state.status in JOB_TERMINAL_STATUSES:
+					self.policy.observe(elapsed)
+				results[job_id] = JobPollResult(job_id, state.status, elapsed, state.polls, error=state.error)
+			elif now >= deadline:
+				results[job_id] = JobPollResult(job_id, state.status, elapsed, state.polls, timed_out=True, error=state.error)
+			else:
+				#Never sleep past the deadline, so the last check happens right at the limit
+				next_time = min(now + self.policy.next_delay(state.polls, elapsed), deadline)
+				heapq.heappush(due, (next_time, i, job_id))
+
+		return {job_id: results[job_id] for job_id in states}
+
+	def _check(self, token, project_id, job_id, state):
+		status_fn = self.status_fn
+		if status_fn is None:
+			from Modules.up42_client import get_default_client
+			status_fn = get_default_client().check_job_status
+
+		state.polls += 1
+		try:
+			res = status_fn(token, project_id, job_id)
+		except Exception as e:
+			#Connection errors and the like are treated as transient
+			state.error = f'Check Job Status: {e!r}'
+			return
+
+		if res.status_code != 200:
+			state.error = f'Check Job Status: Unexpected status code of {res.status_code}'
+			#Retrying cannot fix a bad token, a missing job, or a bad request
+			state.fatal = res.status_code in (400, 401, 403, 404)
+			return
+
+		try:
+			state.status = Job.from_response(res).status
+			state.error = None
+		except ResponseShapeError as e:
+			state.error = f'Check Job Status: Unexpected response body - {e}'
+
+class PollState:
+	"""
+	Progress of one job during a wait, also used by the event-driven poller (see job_events.EventJobPoller):
+	the last status seen, the number of checks made, the last error, and whether the job can no longer be waited on (e.g. 404)
+	"""
+	__slots__ = ('status', 'polls', 'error', 'fatal')
+
+	def __init__(self):
+		self.status = None
+		self.polls = 0
+		self.error = None
+		self.fatal = False
+
+_default_poller = JobPoller()
+
+def get_default_poller():
+	"""
+	Returns the process-wide poller, whose backoff policy learns from every job waited on through api_helper
+
+		Returns:
+			The shared JobPoller
+	"""
+	return _default_poller
+
+def set_default_poller(poller):
+	"""
+	Replaces the process-wide poller used by api_helper, e.g. with faster delays when running against the fake server
+		Parameters:
+			poller (JobPoller): The new poller
+
+		Returns:
+			The previous poller
+	"""
+	global _default_poller
+	previous = _default_poller
+	_default_poller = poller
+	return previous
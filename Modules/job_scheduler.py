@@ -0,0 +1,292 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from Modules.constants import *
+from Modules.api_objects import Job, ResponseShapeError, response_body
+from Modules.payload_catalog import PayloadValidationError
+
+"""
+	Batch submission of Create and Run Job requests.
+	Submissions go through a bounded worker pool, paced by a token bucket that slows down on 429 responses
+	(honouring Retry-After) and speeds back up while requests succeed.
+	Every submission carries a job name. Before retrying a submission whose outcome is unknown (connection error, 5xx),
+	the project's jobs are listed and a job already created under that name is reused, so retries never create duplicates.
+"""
+
+class TokenBucket:
+	"""
+	Token bucket rate limiter, adapting its rate to throttling answers from the API (additive increase, multiplicative decrease)
+		Parameters:
+			rate (float): Requests per second allowed at most
+			burst (int): Number of requests that may go out back to back
+			min_rate (float): The rate never drops below this after throttling
+			clock (callable): Monotonic clock, replaceable in tests
+			sleep (callable): Sleep function, replaceable in tests
+	"""
+	def __init__(self, rate=DEFAULT_SUBMIT_RATE_PER_SECOND, burst=DEFAULT_SUBMIT_BURST, min_rate=0.1, clock=time.monotonic, sleep=time.sleep):
+		self.max_rate = rate
+		self.rate = rate
+		self.burst = burst
+		self.min_rate = min(min_rate, rate)
+		self.clock = clock
+		self.sleep = sleep
+		self.tokens = burst
+		self.updated = clock()
+		self.paused_until = 0.0
+		self.lock = threading.Lock()
+
+	def acquire(self):
+		"""
+		Blocks until a request may be sent
+		"""
+		while True:
+			with self.lock:
+				now = self.clock()
+				self._refill(now)
+				if now >= self.paused_until and self.tokens >= 1:
+					self.tokens -= 1
+					return
+				wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+			self.sleep(wait)
+
+	def throttled(self, retry_after=None):
+		"""
+		Reports a 429 answer: halves the rate and stops every request until Retry-After has passed
+			Parameters:
+				retry_after (float): Seconds the API asked to wait, or None
+		"""
+		with self.lock:
+			now = self.clock()
+			self._refill(now)
+			self.rate = max(self.rate / 2, self.min_rate)
+			self.tokens = 0
+			pause = retry_after if retry_after is not None else 1 / self.rate
+			self.paused_until = max(self.paused_until, now + pause)
+
+	def succeeded(self):
+		"""
+		Reports an accepted request: grows the rate back towards its maximum
+		"""
+		with self.lock:
+			self.rate = min(self.rate + self.max_rate / 10, self.max_rate)
+
+	def _refill(self, now):
+		self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+		self.updated = now
+
+class JobSubmission:
+	"""
+	One Create and Run Job request of a batch
+		Parameters:
+			workflow_id (string): Id associated to the workflow inside the project
+			request_body (dict): Job parameters
+			name (string): Job name, also the idempotency key of the submission. Generated when not given.
+	"""
+	__slots__ = ('workflow_id', 'request_body', 'name')
+
+	def __init__(self, workflow_id, request_body, name=None):
+		self.workflow_id = workflow_id
+		self.request_body = request_body
+		self.name = name or f'{TEST_WORKFLOW_NAME_PREFIX}job-{uuid.uuid4().hex}'
+
+class JobSubmissionResult:
+	"""
+	Outcome of one submission
+		Parameters:
+			index (int): Position of the submission in the batch
+			submission (JobSubmission): The submission
+			job_id (string): Id of the created job, or None
+			status_code (int): Status code of the last Create and Run Job answer, or None if there was none
+			attempts (int): Number of Create and Run Job requests sent
+			error (dict): None on success, otherwise {'code': ..., 'message': ...}
+			recovered (bool): Whether the job was found by name after a submission with an unknown outcome
+	"""
+	def __init__(self, index, submission, job_id=None, status_code=None, attempts=0, error=None, recovered=False):
+		self.index = index
+		self.submission = submission
+		self.job_id = job_id
+		self.status_code = status_code
+		self.attempts = attempts
+		self.error = error
+		self.recovered = recovered
+
+	@property
+	def succeeded(self):
+		return self.job_id is not None
+
+	def __repr__(self):
+		return (f'JobSubmissionResult(index={self.index}, job_id={self.job_id!r}, status_code={self.status_code}, '
+			f'attempts={self.attempts}, error={self.error!r})')
+
+class JobScheduler:
+	"""
+	Submits batches of jobs through a bounded worker pool and a shared TokenBucket
+		Parameters:
+			max_workers (int): Number of submissions in flight at once
+			max_attempts (int): Create and Run Job requests sent at most per submission
+			retry_delay (float): Delay before retrying after a 5xx or connection error, doubled on every attempt
+			bucket (TokenBucket): Rate limiter, defaults to DEFAULT_SUBMIT_RATE_PER_SECOND
+			create_fn (callable): create_fn(token, project_id, workflow_id, request_body, name) returning a response object,
+				defaults to api_helper.create_and_run_job_for_workflow, which validates the parameters first (see payload_catalog)
+			list_fn (callable): list_fn(token, project_id) returning the Get Jobs response object, defaults to api_helper.get_jobs
+			sleep (callable): Sleep function, replaceable in tests
+	"""
+	def __init__(self, max_workers=DEFAULT_SUBMIT_WORKERS, max_attempts=DEFAULT_SUBMIT_MAX_ATTEMPTS, retry_delay=DEFAULT_SUBMIT_RETRY_DELAY_SECONDS,
+			bucket=None, create_fn=None, list_fn=None, sleep=time.sleep):
+		self.max_workers = max_workers
+		self.max_attempts = max_attempts
+		self.retry_delay = retry_delay
+		self.bucket = bucket if bucket is not None else TokenBucket()
+		self.create_fn = create_fn
+		self.list_fn = list_fn
+		self.sleep = sleep
+
+	def submit(self, token, project_id, submissions):
+		"""
+		Submits every job and yields the results as the submissions complete, not in batch order
+			Parameters:
+				token (string): Access Token associated to the project
+				project_id (string): Id associated to the project
+				submissions (iterable): JobSubmissions, or (workflow_id, request_body) pairs
+
+			Returns:
+				Generator of JobSubmissionResults
+		"""
+		with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job-submit') as executor:
+			futures = [executor.submit(self._submit_one, token, project_id, index, _as_submission(submission))
+				for index, submission in enumerate(submissions)]
+			for future in as_completed(futures):
+				yield future.result()
+
+	def _submit_one(self, token, project_id, index, submission):
+		create_fn, list_fn = self._endpoints()
+		result = JobSubmissionResult(index, submission)
+		uncertain = False
+		delay = self.retry_delay
+		while result.attempts < self.max_attempts:
+			if uncertain:
+				#The previous request may have created the job before failing, look for it before sending another one
+				job_id = _find_job(list_fn, token, project_id, submission)
+				if job_id is not None:
+					result.job_id, result.error, result.recovered = job_id, None, True
+					return result
+
+			self.bucket.acquire()
+			result.attempts += 1
+			try:
+				res = create_fn(token, project_id, submission.workflow_id, submission.request_body, submission.name)
+			except PayloadValidationError as e:
+				#Rejected before the request was sent, another attempt would be rejected the same way
+				result.error = {'code': type(e).__name__, 'message': str(e)}
+				return result
+			except Exception as e:
+				uncertain = True
+				result.status_code = None
+				result.error = {'code': type(e).__name__, 'message': str(e)}
+				self.sleep(delay)
+				delay *= 2
+				continue
+
+			result.status_code = res.status_code
+			if res.status_code == 200:
+				self.bucket.succeeded()
+				try:
+					result.job_id = Job.from_response(res).id
+					result.error = None
+				except ResponseShapeError as e:
+					#The job was accepted, so it is not submitted again, but its id is unknown
+					result.error = {'code': type(e).__name__, 'message': str(e)}
+				return result
+			result.error = _api_error(res)
+			if res.status_code == 429:
+				#The request was turned away, so it created nothing
+				self.bucket.throttled(parse_retry_after(res.headers.get('Retry-After')))
+				uncertain = False
+			elif res.status_code >= 500:
+				uncertain = True
+				self.sleep(delay)
+				delay *= 2
+			else:
+				return result
+
+		if uncertain:
+			job_id = _find_job(list_fn, token, project_id, submission)
+			if job_id is not None:
+				result.job_id, result.error, result.recovered = job_id, None, True
+		return result
+
+	def _endpoints(self):
+		create_fn, list_fn = self.create_fn, self.list_fn
+		if create_fn is None or list_fn is None:
+			from Modules import api_helper
+			create_fn = create_fn or api_helper.create_and_run_job_for_workflow
+			list_fn = list_fn or api_helper.get_jobs
+		return create_fn, list_fn
+
+def submit_jobs(token, project_id, submissions, max_workers=DEFAULT_SUBMIT_WORKERS, rate=DEFAULT_SUBMIT_RATE_PER_SECOND):
+	"""
+	Submits many Create and Run Job requests at a rate the API accepts, see JobScheduler
+		Parameters:
+			token (string): Access Token associated to the project
+			project_id (string): Id associated to the project
+			submissions (iterable): JobSubmissions, or (workflow_id, request_body) pairs
+			max_workers (int): Number of submissions in flight at once
+			rate (float): Requests per second sent at most
+
+		Returns:
+			Generator of JobSubmissionResults, in completion order
+	"""
+	scheduler = JobScheduler(max_workers=max_workers, bucket=TokenBucket(rate=rate, burst=max(1, int(rate))))
+	return scheduler.submit(token, project_id, submissions)
+
+def parse_retry_after(value):
+	"""
+	Parses a Retry-After header, given either in seconds or as an HTTP date
+		Returns:
+			The delay in seconds, or None when the header is missing or invalid
+	"""
+	if not value:
+		return None
+	try:
+		return max(float(value), 0.0)
+	except ValueError:
+		pass
+	try:
+		retry_at = parsedate_to_datetime(value)
+	except (TypeError, ValueError):
+		return None
+	if retry_at.tzinfo is None:
+		retry_at = retry_at.replace(tzinfo=timezone.utc)
+	return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+def _as_submission(submission):
+	if isinstance(submission, JobSubmission):
+		return submission
+	return JobSubmission(*submission)
+
+def _find_job(list_fn, token, project_id, submission):
+	#Returns the id of a job created under the submission's name, or None (also when the jobs cannot be listed)
+	try:
+		res = list_fn(token, project_id)
+		if res.status_code != 200:
+			return None
+		jobs = Job.list_from_response(res)
+	except Exception:
+		return None
+	for job in jobs:
+		if job.name == submission.name and job.workflow_id in (None, submission.workflow_id):
+			return job.id
+	return None
+
+def _api_error(res):
+	try:
+		error = response_body(res).get('error')
+	except (ValueError, AttributeError):
+		error = None
+	if isinstance(error, dict):
+		return {'code': error.get('code'), 'message': error.get('message')}
+	return {'code': f'HTTP_{res.status_code}', 'message': f'Create and Run Job failed with status {res.status_code}'}
@@ -0,0 +1,96 @@
+import json
+import os
+import threading
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+"""
+	Pluggable json codec for the response models (see api_objects) and the fake UP42 server.
+	orjson is used when it is installed (`pip install orjson`), the standard json module otherwise.
+	Set the UP42_JSON_CODEC environment variable to 'json' or 'orjson' to choose one, or call set_codec.
+	Request bodies are still encoded by requests, so recorded cassettes do not depend on the codec.
+"""
+
+JSON_CODEC_ENV = 'UP42_JSON_CODEC'
+
+class JsonCodec:
+	"""
+		Parameters:
+			name (string): Name of the codec, e.g. orjson
+			loads (callable): loads(bytes or str) returning the decoded value
+			dumps (callable): dumps(value) returning utf-8 encoded bytes
+	"""
+	__slots__ = ('name', 'loads', 'dumps')
+
+	def __init__(self, name, loads, dumps):
+		self.name = name
+		self.loads = loads
+		self.dumps = dumps
+
+	def __repr__(self):
+		return f'JsonCodec({self.name!r})'
+
+def _stdlib_loads(data):
+	#json.loads detects the encoding of bytes first, decoding the utf-8 body directly is faster
+	if isinstance(data, (bytes, bytearray)):
+		data = data.decode('utf-8')
+	return json.loads(data)
+
+STDLIB_CODEC = JsonCodec('json', _stdlib_loads, lambda value: json.dumps(value).encode())
+ORJSON_CODEC = JsonCodec('orjson', orjson.loads, orjson.dumps) if orjson is not None else None
+
+def available_codecs():
+	"""
+	Returns the installed codecs by name
+	"""
+	codecs = {'json': STDLIB_CODEC}
+	if ORJSON_CODEC is not None:
+		codecs['orjson'] = ORJSON_CODEC
+	return codecs
+
+def _initial_codec():
+	name = os.environ.get(JSON_CODEC_ENV)
+	if name:
+		codec = available_codecs().get(name)
+		if codec is None:
+			raise ValueError(f'{JSON_CODEC_ENV}={name!r} is not an installed json codec, use one of {sorted(available_codecs())}')
+		return codec
+	return ORJSON_CODEC or STDLIB_CODEC
+
+_codec = _initial_codec()
+_codec_lock = threading.Lock()
+
+def get_codec():
+	"""
+	Returns the process-wide json codec
+	"""
+	return _codec
+
+def set_codec(codec):
+	"""
+	Replaces the process-wide json codec
+		Parameters:
+			codec (JsonCodec or string): The codec, or the name of an installed one
+
+		Returns:
+			The previous codec
+	"""
+	global _codec
+	if isinstance(codec, str):
+		name = codec
+		codec = available_codecs().get(name)
+		if codec is None:
+			raise ValueError(f'{name!r} is not an installed json codec, use one of {sorted(available_codecs())}')
+	with _codec_lock:
+		previous = _codec
+		_codec = codec
+	return previous
+
+def loads(data):
+	return _codec.loads(data)
+
+def dumps(value):
+	return _codec.dumps(value)
@@ -0,0 +1,300 @@
+import argparse
+import bisect
+import configparser
+import itertools
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from Modules.api_helper import *
+from Modules.api_objects import *
+from Modules.credential_pool import CredentialPool, ProjectCredentials, load_project_credentials
+from Modules.payload_catalog import get_default_catalog
+from Modules.utility import *
+from Modules.constants import *
+
+"""
+	Load driver for the UP42 API and our client.
+	Runs the same lifecycle as test_create_and_run_modis_sharpening_job_complete
+	(create workflow, add MODIS and Sharpening tasks, create and run job, wait, delete workflow)
+	either with a fixed number of concurrent users (closed loop) or at a target arrival rate (open loop),
+	and reports per-stage latency percentiles, histograms, throughput and errors as json.
+
+	Example: python -m Modules.load_driver --rate 2 --duration 60 --output load_report.json
+"""
+
+#Upper bounds (in milliseconds) of the latency histogram buckets, the last bucket is open ended
+HISTOGRAM_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000, 300000)
+
+LIFECYCLE_STAGES = ('get_access_token', 'create_workflow', 'add_tasks_to_workflow', 'create_and_run_job', 'wait_until_job_is_complete', 'delete_workflow', 'lifecycle')
+
+class StageRecorder:
+	"""
+	Thread-safe collector of per-stage latencies and errors
+	"""
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.latencies = {stage: [] for stage in LIFECYCLE_STAGES}
+		self.errors = Counter()
+		self.completed = 0
+		self.failed = 0
+
+	def record(self, stage, seconds):
+		with self.lock:
+			self.latencies[stage].append(seconds)
+
+	def error(self, stage, reason):
+		with self.lock:
+			self.errors[f'{stage}: {reason}'] += 1
+
+	def finish(self, ok):
+		with self.lock:
+			if ok:
+				self.completed += 1
+			else:
+				self.failed += 1
+
+	def report(self, wall_seconds, settings):
+		"""
+		Builds the json-serializable report
+		"""
+		with self.lock:
+			stages = {}
+			for stage, values in self.latencies.items():
+				summary = summarize_latencies(values)
+				summary['histogram'] = _histogram(values)
+				stages[stage] = summary
+			total = self.completed + self.failed
+			return {
+				'settings': settings,
+				'wall_seconds': round(wall_seconds, 3),
+				'lifecycles': {'total': total, 'completed': self.completed, 'failed': self.failed},
+				'throughput_per_second': round(self.completed / wall_seconds, 3) if wall_seconds > 0 else None,
+				'stages': stages,
+				'errors': dict(self.errors.most_common()),
+			}
+
+def _histogram(values):
+	counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+	for value in values:
+		counts[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, value * 1000)] += 1
+	labels = [f'<={bound}ms' for bound in HISTOGRAM_BUCKETS_MS] + [f'>{HISTOGRAM_BUCKETS_MS[-1]}ms']
+	return {label: count for label, count in zip(labels, counts) if count}
+
+class LoadDriver:
+	"""
+	Drives the workflow -> tasks -> job -> delete lifecycle
+		Parameters:
+			project_id (string): Id associated to the project
+			project_api_key (string): Api key associated to the project
+			max_wait_seconds (int): Maximum time to wait for each job
+			job_request_body (dict): Job parameters, defaults to the MODIS and Sharpening test data.
+				A list of them is used in turn, e.g. the variants of a payload (see PayloadCatalog.variants)
+			credential_pool (CredentialPool): Projects to spread the lifecycles over, instead of project_id and project_api_key
+	"""
+	def __init__(self, project_id=None, project_api_key=None, max_wait_seconds=300, job_request_body=None, credential_pool=None):
+		if credential_pool is None:
+			credential_pool = CredentialPool([ProjectCredentials('keys', project_id, project_api_key)])
+		self.credential_pool = credential_pool
+		self.max_wait_seconds = max_wait_seconds
+		if job_request_body is None:
+			job_request_body = get_default_catalog().body(MODIS_SHARPENING_TEST_JSON_FILE, validate=True)
+		self.job_request_body = job_request_body
+		self.job_request_bodies = itertools.cycle(job_request_body if isinstance(job_request_body, list) else [job_request_body])
+		self.task_request_body = WorkflowGraph().add('nasa-modis:1', None, NASA_MODIS_BLOCK_ID).add('sharpening:1', 'nasa-modis:1', SHARPENING_FILTER_BLOCK_ID).to_json()
+		self.recorder = StageRecorder()
+
+	def run_lifecycle(self, scheduled_at=None):
+		"""
+		Runs one lifecycle, recording every stage. Never raises.
+			Parameters:
+				scheduled_at (float): perf_counter time the lifecycle was meant to start (open loop),
+					so that queueing delay is included in the lifecycle latency
+
+			Returns:
+				Boolean. True if every stage succeeded.
+		"""
+		start_time = scheduled_at if scheduled_at is not None else time.perf_counter()
+		with self.credential_pool.lease() as project:
+			return self._run_lifecycle(project.project_id, project.project_api_key, start_time)
+
+	def _run_lifecycle(self, project_id, project_api_key, start_time):
+		recorder = self.recorder
+		workflow_id = ''
+		ok = False
+		try:
+			token = self._timed('get_access_token', get_access_token, project_id, project_api_key)
+
+			res = self._timed('create_workflow', create_workflow, token, project_id,
+				generate_workflow_name(16), generate_random_alphanumeric(5))
+			if not self._expect('create_workflow', res, 200):
+				return False
+			workflow_id = Workflow.from_response(res).id
+
+			res = self._timed('add_tasks_to_workflow', add_tasks_to_workflow, token, project_id, workflow_id, self.task_request_body)
+			if not self._expect('add_tasks_to_workflow', res, 200):
+				return False
+
+			res = self._timed('create_and_run_job', create_and_run_job_for_workflow, token, project_id, workflow_id, next(self.job_request_bodies))
+			if not self._expect('create_and_run_job', res, 200):
+				return False
+			job_id = Job.from_response(res).id
+
+			result = self._timed('wait_until_job_is_complete', wait_for_job, token, project_id, job_id, self.max_wait_seconds)
+			if not result.succeeded:
+				reason = 'timed out' if result.timed_out else f'job status {result.status}'
+				recorder.error('wait_until_job_is_complete', reason)
+				return False
+			ok = True
+			return True
+
+		except Exception as e:
+			recorder.error('lifecycle', type(e).__name__)
+			return False
+
+		finally:
+			if workflow_id:
+				try:
+					res = self._timed('delete_workflow', delete_workflow, token, project_id, workflow_id)
+					if not self._expect('delete_workflow', res, 204):
+						ok = False
+				except Exception as e:
+					recorder.error('delete_workflow', type(e).__name__)
+					ok = False
+			recorder.record('lifecycle', time.perf_counter() - start_time)
+			recorder.finish(ok)
+
+	def run_closed_loop(self, concurrency, iterations=None, duration=None):
+		"""
+		Keeps `concurrency` lifecycles in flight until `iterations` lifecycles ran or `duration` seconds passed
+		"""
+		deadline = time.perf_counter() + duration if duration else None
+		remaining = [iterations]
+		lock = threading.Lock()
+
+		def claim():
+			if deadline is not None and time.perf_counter() >= deadline:
+				return False
+			with lock:
+				if remaining[0] is None:
+					return True
+				if remaining[0] <= 0:
+					return False
+				remaining[0] -= 1
+				return True
+
+		def user():
+			while claim():
+				self.run_lifecycle()
+
+		settings = {'mode': 'closed', 'concurrency': concurrency, 'iterations': iterations, 'duration': duration}
+		return self._run(settings, lambda: _run_threads(user, concurrency))
+
+	def run_open_loop(self, rate, duration, max_in_flight=256):
+		"""
+		Starts lifecycles at a fixed arrival rate for `duration` seconds, independent of how fast earlier ones finish.
+		Lifecycle latency is measured from the scheduled arrival time, so queueing in the worker pool is not hidden.
+		"""
+		def arrivals():
+			interval = 1.0 / rate
+			start = time.perf_counter()
+			count = int(rate * duration)
+			with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+				for i in range(count):
+					scheduled_at = start + i * interval
+					delay = scheduled_at - time.perf_counter()
+					if delay > 0:
+						time.sleep(delay)
+					executor.submit(self.run_lifecycle, scheduled_at)
+
+		settings = {'mode': 'open', 'rate': rate, 'duration': duration, 'max_in_flight': max_in_flight}
+		return self._run(settings, arrivals)
+
+	def _run(self, settings, body):
+		self.recorder = StageRecorder()
+		start = time.perf_counter()
+		body()
+		report = self.recorder.report(time.perf_counter() - start, settings)
+		report['projects'] = self.credential_pool.usage()
+		return report
+
+	def _timed(self, stage, fn, *args):
+		start = time.perf_counter()
+		try:
+			return fn(*args)
+		finally:
+			self.recorder.record(stage, time.perf_counter() - start)
+
+	def _expect(self, stage, res, status_code):
+		if res.status_code != status_code:
+			self.recorder.error(stage, f'status {res.status_code}')
+			return False
+		return True
+
+def _run_threads(target, count):
+	threads = [threading.Thread(target=target, daemon=True) for i in range(count)]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Drive the UP42 workflow/job lifecycle under load and report latencies as json')
+	parser.add_argument('--concurrency', type=int, default=1, help='Concurrent lifecycles in closed-loop mode')
+	parser.add_argument('--iterations', type=int, help='Total lifecycles to run in closed-loop mode')
+	parser.add_argument('--rate', type=float, help='Open-loop mode: lifecycles started per second')
+	parser.add_argument('--duration', type=float, help='Seconds to run for (required with --rate)')
+	parser.add_argument('--max-in-flight', type=int, default=256, help='Open-loop mode: maximum lifecycles running at once')
+	parser.add_argument('--max-wait', type=int, default=300, help='Maximum seconds to wait for each job')
+	parser.add_argument('--config', default='config.ini', help='Config file holding the [keys] and [project:NAME] sections')
+	parser.add_argument('--fake', action='store_true', help='Run against the in-process fake UP42 server')
+	parser.add_argument('--output', help='Write the json report to this file instead of stdout')
+	parser.add_argument('--vary-payloads', action='store_true', help='Cycle through variants of the test payload (sharpening strength x MODIS zoom level)')
+	args = parser.parse_args(argv)
+
+	if args.rate is not None and not args.duration:
+		parser.error('--rate requires --duration')
+	if args.rate is None and args.iterations is None and args.duration is None:
+		args.iterations = args.concurrency
+
+	config = configparser.ConfigParser()
+	config.read(args.config)
+	credential_pool = CredentialPool(load_project_credentials(config))
+
+	server = None
+	if args.fake:
+		from Modules.fake_up42_server import FakeUP42Server
+		from Modules.job_poller import BackoffPolicy, JobPoller, set_default_poller
+		from Modules.token_cache import TokenCache
+		server = FakeUP42Server().start()
+		pool_maxsize = args.max_in_flight if args.rate is not None else args.concurrency
+		set_default_client(UP42Client(base_url=server.base_url, pool_maxsize=pool_maxsize, token_cache=TokenCache()))
+		set_default_poller(JobPoller(policy=BackoffPolicy(min_delay=0.01, max_delay=0.1)))
+
+	try:
+		job_request_body = None
+		if args.vary_payloads:
+			job_request_body = [payload for _, payload in get_default_catalog().variants(MODIS_SHARPENING_TEST_JSON_FILE,
+				{'sharpening:1.strength': SHARPENING_STRENGTHS, 'nasa-modis:1.zoom_level': range(MODIS_MAX_ZOOM_LEVEL - 2, MODIS_MAX_ZOOM_LEVEL + 1)})]
+		driver = LoadDriver(max_wait_seconds=args.max_wait, job_request_body=job_request_body, credential_pool=credential_pool)
+		if args.rate is not None:
+			report = driver.run_open_loop(args.rate, args.duration, args.max_in_flight)
+		else:
+			report = driver.run_closed_loop(args.concurrency, args.iterations, args.duration)
+	finally:
+		if server is not None:
+			server.stop()
+
+	output = json.dumps(report, indent=2)
+	if args.output:
+		with open(args.output, 'w') as f:
+			f.write(output)
+	else:
+		print(output)
+	return 0 if report['lifecycles']['failed'] == 0 else 1
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,335 @@
+import itertools
+import json
+import os
+import threading
+from datetime import datetime
+from types import MappingProxyType
+
+from Modules.constants import *
+
+"""
+	Catalog of the job parameter payloads of TestData.
+	Every payload file is read once per process and kept frozen (read-only mappings and tuples): get() returns the shared
+	frozen payload, body() a fresh mutable copy to send. Payloads are checked against per-block parameter schemas,
+	compiled once into validator functions, so that a malformed payload is rejected before a Create and Run Job round trip.
+
+	With pre-submission validation on (set_payload_validation, the UP42_VALIDATE_PAYLOADS environment variable, or the
+	pytest session, see --skip-payload-validation), api_helper.create_and_run_job_for_workflow raises PayloadValidationError
+	for invalid parameters. Negative tests that send bad payloads on purpose pass validate=False.
+"""
+
+class PayloadValidationError(ValueError):
+	"""
+	Raised when job parameters do not match the schemas of their blocks
+		Parameters:
+			errors (list): One message per problem found
+	"""
+	def __init__(self, errors):
+		super().__init__('Invalid job parameters: ' + '; '.join(errors))
+		self.errors = errors
+
+#Validators: each takes a value and returns an error message, or None when the value is valid
+
+def _integer(minimum=None, maximum=None):
+	def check(value):
+		if isinstance(value, bool) or not isinstance(value, int):
+			return f'expected an integer, got {value!r}'
+		if minimum is not None and value < minimum or maximum is not None and value > maximum:
+			return f'expected an integer between {minimum} and {maximum}, got {value}'
+		return None
+	return check
+
+def _one_of(values):
+	allowed = frozenset(values)
+	def check(value):
+		if value not in allowed:
+			return f"expected one of {', '.join(map(repr, values))}, got {value!r}"
+		return None
+	return check
+
+def _string_list(min_length=1):
+	def check(value):
+		if not isinstance(value, (list, tuple)) or len(value) < min_length:
+			return f'expected a list of at least {min_length} string(s), got {value!r}'
+		if not all(isinstance(item, str) and item for item in value):
+			return f'expected non empty strings, got {value!r}'
+		return None
+	return check
+
+def _bbox():
+	def check(value):
+		if not isinstance(value, (list, tuple)) or len(value) != 4 or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value):
+			return f'expected [min_lon, min_lat, max_lon, max_lat], got {value!r}'
+		min_lon, min_lat, max_lon, max_lat = value
+		if not (-180 <= min_lon < max_lon <= 180 and -90 <= min_lat < max_lat <= 90):
+			return f'expected -180 <= min_lon < max_lon <= 180 and -90 <= min_lat < max_lat <= 90, got {list(value)}'
+		return None
+	return check
+
+def _time_range():
+	def check(value):
+		if not isinstance(value, str) or value.count('/') != 1:
+			return f'expected an ISO 8601 range "start/end", got {value!r}'
+		try:
+			start, end = (datetime.fromisoformat(part.replace('Z', '+00:00')) for part in value.split('/'))
+		except ValueError:
+			return f'expected ISO 8601 timestamps, got {value!r}'
+		if (start.tzinfo is None) != (end.tzinfo is None):
+			return f'expected both ends with or without a timezone, got {value!r}'
+		if start > end:
+			return f'range starts after it ends: {value!r}'
+		return None
+	return check
+
+def _geometry():
+	def check(value):
+		if not isinstance(value, (dict, MappingProxyType)) or 'type' not in value:
+			return f'expected a GeoJSON geometry, got {value!r}'
+		return None
+	return check
+
+class ParameterSchema:
+	"""
+	Parameters accepted by a block, compiled into one validator per parameter
+		Parameters:
+			name (string): Name of the block, used in the messages
+			fields (dict): Validator by parameter name, see the helpers above
+			required (tuple): Parameters that must be present
+			any_of (tuple): Parameters of which at least one must be present, e.g. the area of interest
+	"""
+	__slots__ = ('name', 'fields', 'required', 'any_of')
+
+	def __init__(self, name, fields, required=(), any_of=()):
+		self.name = name
+		self.fields = dict(fields)
+		self.required = tuple(required)
+		self.any_of = tuple(any_of)
+
+	def errors(self, task_name, params):
+		"""
+		Returns the problems of the parameters of one task, an empty list when they are valid
+		"""
+		if not isinstance(params, (dict, MappingProxyType)):
+			return [f'{task_name}: parameters must be an object, got {params!r}']
+		errors = []
+		for key, value in params.items():
+			check = self.fields.get(key)
+			if check is None:
+				errors.append(f'{task_name}: unknown {self.name} parameter {key!r}')
+				continue
+			message = check(value)
+			if message is not None:
+				errors.append(f'{task_name}.{key}: {message}')
+		for key in self.required:
+			if key not in params:
+				errors.append(f'{task_name}: missing {self.name} parameter {key!r}')
+		if self.any_of and not any(key in params for key in self.any_of):
+			errors.append(f"{task_name}: {self.name} needs one of {', '.join(map(repr, self.any_of))}")
+		return errors
+
+def compile_block_schemas():
+	"""
+	Returns the ParameterSchema of every known block, by block id
+	"""
+	return {
+		NASA_MODIS_BLOCK_ID: ParameterSchema('nasa-modis', {
+			'time': _time_range(),
+			'limit': _integer(1, MODIS_MAX_LIMIT),
+			'zoom_level': _integer(0, MODIS_MAX_ZOOM_LEVEL),
+			'imagery_layers': _string_list(),
+			'bbox': _bbox(),
+			'intersects': _geometry(),
+			'contains': _geometry(),
+		}, required=('time', 'zoom_level', 'imagery_layers'), any_of=('bbox', 'intersects', 'contains')),
+		SHARPENING_FILTER_BLOCK_ID: ParameterSchema('sharpening', {
+			'strength': _one_of(SHARPENING_STRENGTHS),
+		}),
+	}
+
+def block_of_task(task_name):
+	"""
+	Returns the block id of a task from its name, e.g. nasa-modis:1, or None for unknown blocks
+	"""
+	return TASK_NAME_BLOCK_IDS.get(task_name.split(':', 1)[0])
+
+def freeze(value):
+	"""
+	Returns a read-only copy of a json value: objects become MappingProxyTypes and lists tuples
+	"""
+	if isinstance(value, dict):
+		return MappingProxyType({key: freeze(item) for key, item in value.items()})
+	if isinstance(value, list):
+		return tuple(freeze(item) for item in value)
+	return value
+
+def thaw(value):
+	"""
+	Returns a mutable, json serializable copy of a frozen value
+	"""
+	if isinstance(value, (dict, MappingProxyType)):
+		return {key: thaw(item) for key, item in value.items()}
+	if isinstance(value, (list, tuple)):
+		return [thaw(item) for item in value]
+	return value
+
+class PayloadCatalog:
+	"""
+	Job parameter payloads of a directory, read once and kept frozen
+		Parameters:
+			directory (string): Directory of the *.json payload files
+			schemas (dict): ParameterSchema by block id, defaults to compile_block_schemas()
+	"""
+	def __init__(self, directory=TEST_DATA_DIR, schemas=None):
+		self.directory = directory
+		self.schemas = schemas if schemas is not None else compile_block_schemas()
+		self.payloads = None
+		self.validated = {}
+		self.lock = threading.Lock()
+
+	def _load(self):
+		if self.payloads is None:
+			with self.lock:
+				if self.payloads is None:
+					payloads = {}
+					for filename in sorted(os.listdir(self.directory)):
+						if filename.endswith('.json'):
+							with open(os.path.join(self.directory, filename)) as f:
+								payloads[filename[:-5]] = freeze(json.load(f))
+					self.payloads = payloads
+		return self.payloads
+
+	@staticmethod
+	def key(name):
+		"""
+		Returns the catalog name of a payload given by name or by path, e.g. TestData/modis_sharpening_job.json
+		"""
+		name = os.path.basename(name)
+		return name[:-5] if name.endswith('.json') else name
+
+	def names(self):
+		return list(self._load())
+
+	def get(self, name):
+		"""
+		Returns the frozen payload, shared by every caller. Raises KeyError for unknown payloads.
+		"""
+		payloads = self._load()
+		key = self.key(name)
+		if key not in payloads:
+			raise KeyError(f'No payload {key!r} in {self.directory}, known payloads: {sorted(payloads)}')
+		return payloads[key]
+
+	def body(self, name, validate=False):
+		"""
+		Returns a mutable copy of a payload, ready to be sent as the Create and Run Job request body
+			Parameters:
+				name (string): Payload name or path
+				validate (bool): Raise PayloadValidationError if the payload is invalid
+		"""
+		if validate:
+			self.check(name)
+		return thaw(self.get(name))
+
+	def errors(self, name):
+		"""
+		Returns the problems of a catalog payload, checked once and remembered since payloads are frozen
+		"""
+		key = self.key(name)
+		errors = self.validated.get(key)
+		if errors is None:
+			errors = self.validated[key] = validate_job_parameters(self.get(key), self.schemas)
+		return errors
+
+	def check(self, name):
+		"""
+		Raises PayloadValidationError if a catalog payload is invalid
+		"""
+		errors = self.errors(name)
+		if errors:
+			raise PayloadValidationError(errors)
+
+	def variants(self, name, overrides, validate=True):
+		"""
+		Generates payloads from a catalog payload, one per combination of the override values.
+		The payload is copied once, then every variant only copies the tasks it overrides and shares the other ones:
+		send the variants as they are, and copy a task before modifying it.
+			Parameters:
+				name (string): Payload name or path
+				overrides (dict): Values to try by 'task.parameter', e.g. {'sharpening:1.strength': SHARPENING_STRENGTHS}
+				validate (bool): Raise PayloadValidationError for an invalid variant, turn it off to generate bad payloads
+
+			Returns:
+				Generator of (id, payload), the id naming the values, e.g. for pytest.param(..., id=id)
+		"""
+		base = self.body(name)
+		keys = [key.split('.', 1) for key in overrides]
+		for values in itertools.product(*overrides.values()):
+			payload = dict(base)
+			for (task_name, parameter), value in zip(keys, values):
+				task = payload.get(task_name)
+				if task is base.get(task_name):
+					task = payload[task_name] = dict(task or {})
+				task[parameter] = value
+			if validate:
+				errors = validate_job_parameters(payload, self.schemas)
+				if errors:
+					raise PayloadValidationError(errors)
+			yield '-'.join(str(value) for value in values), payload
+
+def validate_job_parameters(params, schemas=None):
+	"""
+	Checks job parameters against the schemas of their tasks' blocks. Tasks of unknown blocks are not checked.
+		Parameters:
+			params (dict): Create and Run Job request body, parameters by task name
+			schemas (dict): ParameterSchema by block id, defaults to the catalog's compiled schemas
+
+		Returns:
+			List of problems, empty when the parameters are valid
+	"""
+	if schemas is None:
+		schemas = get_default_catalog().schemas
+	if not isinstance(params, (dict, MappingProxyType)):
+		return [f'job parameters must be an object, got {type(params).__name__}']
+	errors = []
+	for task_name, task_params in params.items():
+		schema = schemas.get(block_of_task(task_name))
+		if schema is not None:
+			errors.extend(schema.errors(task_name, task_params))
+	return errors
+
+_default_catalog = None
+_default_catalog_lock = threading.Lock()
+_validation_enabled = os.environ.get(PAYLOAD_VALIDATION_ENV, '').lower() in ('1', 'true', 'yes')
+
+def get_default_catalog():
+	"""
+	Returns the process-wide catalog of the TestData payloads, creating it on first use
+	"""
+	global _default_catalog
+	if _default_catalog is None:
+		with _default_catalog_lock:
+			if _default_catalog is None:
+				_default_catalog = PayloadCatalog()
+	return _default_catalog
+
+def payload_validation_enabled():
+	return _validation_enabled
+
+def set_payload_validation(enabled):
+	"""
+	Turns pre-submission validation of the Create and Run Job parameters on or off
+		Returns:
+			The previous setting
+	"""
+	global _validation_enabled
+	previous = _validation_enabled
+	_validation_enabled = bool(enabled)
+	return previous
+
+def check_job_parameters(params):
+	"""
+	Raises PayloadValidationError if job parameters are invalid, see validate_job_parameters
+	"""
+	errors = validate_job_parameters(params)
+	if errors:
+		raise PayloadValidationError(errors)
@@ -0,0 +1,140 @@
+"""
+	pytest plugin collecting the CallRecords of every UP42 API call made during the session.
+	At the end it prints a per-endpoint latency table, optionally writes a json report,
+	and can fail the run when an endpoint's p95 regressed against a stored baseline.
+	Registered from ApiTesting/conftest.py, see the --perf-* options there.
+"""
+
+import json
+import threading
+
+from Modules.call_timing import add_call_listener, remove_call_listener
+from Modules.utility import summarize_latencies
+
+class PerfReportPlugin:
+	"""
+		Parameters:
+			report_path (string): Where to write the json report, or None
+			baseline_path (string): json report of an earlier run to compare against, or None
+			threshold (float): Allowed relative p95 increase per endpoint, e.g. 0.2 for 20%
+			min_regression_ms (float): Ignore p95 increases smaller than this, to avoid failing on noise
+			update_baseline (bool): Write this run's report to baseline_path instead of comparing
+	"""
+	def __init__(self, report_path=None, baseline_path=None, threshold=0.2, min_regression_ms=5.0, update_baseline=False):
+		self.report_path = report_path
+		self.baseline_path = baseline_path
+		self.threshold = threshold
+		self.min_regression_ms = min_regression_ms
+		self.update_baseline = update_baseline
+		self.records = []
+		self.regressions = []
+		self.report = None
+		self.lock = threading.Lock()
+
+	def collect(self, record):
+		with self.lock:
+			self.records.append(record)
+
+	def pytest_sessionstart(self, session):
+		add_call_listener(self.collect)
+
+	def pytest_sessionfinish(self, session, exitstatus):
+		remove_call_listener(self.collect)
+		self.report = build_report(self.records)
+
+		if self.report_path:
+			_write_json(self.report_path, self.report)
+		if self.baseline_path and self.update_baseline:
+			_write_json(self.baseline_path, self.report)
+		elif self.baseline_path:
+			try:
+				with open(self.baseline_path) as f:
+					baseline = json.load(f)
+			except FileNotFoundError:
+				baseline = None
+			if baseline is not None:
+				self.regressions = find_regressions(self.report, baseline, self.threshold, self.min_regression_ms)
+				if self.regressions and session.exitstatus == 0:
+					session.exitstatus = 1
+
+	def pytest_terminal_summary(self, terminalreporter):
+		if not self.report or not self.report['endpoints']:
+			return
+		tr = terminalreporter
+		tr.section('UP42 API latency')
+		tr.write_line(f"{'endpoint':<32}{'calls':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'ttfb p50':>10}{'new conns':>11}{'retries':>9}{'hedges':>8}")
+		for endpoint, stats in sorted(self.report['endpoints'].items()):
+			total = stats['total']
+			tr.write_line(f"{endpoint:<32}{stats['calls']:>7}{stats['errors']:>8}{total['p50_ms']:>10.1f}{total['p95_ms']:>10.1f}"
+				f"{total['p99_ms']:>10.1f}{total['max_ms']:>10.1f}{stats['ttfb'].get('p50_ms', 0):>10.1f}{stats['new_connections']:>11}{stats['retries']:>9}{stats['hedges']:>8}")
+		if self.report_path:
+			tr.write_line(f'Report written to {self.report_path}')
+		if self.update_baseline and self.baseline_path:
+			tr.write_line(f'Baseline written to {self.baseline_path}')
+		for message in self.regressions:
+			tr.write_line(f'REGRESSION: {message}', red=True)
+
+def build_report(records):
+	"""
+	Aggregates CallRecords into a per-endpoint, json-serializable report
+		Parameters:
+			records (list): CallRecords
+
+		Returns:
+			The report as a dict
+	"""
+	grouped = {}
+	for record in records:
+		grouped.setdefault(record.endpoint, []).append(record)
+
+	endpoints = {}
+	for endpoint, group in grouped.items():
+		new_connections = [r for r in group if r.connect > 0]
+		endpoints[endpoint] = {
+			'calls': len(group),
+			'errors': sum(1 for r in group if r.error is not None or r.status is None or r.status >= 500),
+			'statuses': _count(str(r.status) for r in group),
+			'bytes': sum(r.bytes for r in group),
+			'retries': sum(r.retries for r in group),
+			'hedges': sum(r.hedges for r in group),
+			'new_connections': len(new_connections),
+			'total': summarize_latencies([r.total for r in group]),
+			'ttfb': summarize_latencies([r.ttfb for r in group if r.ttfb is not None]),
+			'dns': summarize_latencies([r.dns for r in new_connections]),
+			'connect': summarize_latencies([r.connect for r in new_connections]),
+			'tls': summarize_latencies([r.tls for r in new_connections if r.tls > 0]),
+		}
+	return {'calls': len(records), 'endpoints': endpoints}
+
+def find_regressions(report, baseline, threshold, min_regression_ms=0.0):
+	"""
+	Compares the p95 total latency of every endpoint present in both reports
+		Parameters:
+			report (dict): Report of this run, see build_report
+			baseline (dict): Report of the baseline run
+			threshold (float): Allowed relative increase, e.g. 0.2 for 20%
+			min_regression_ms (float): Ignore absolute increases smaller than this
+
+		Returns:
+			List of messages, one per regressed endpoint
+	"""
+	messages = []
+	for endpoint, stats in report['endpoints'].items():
+		base = baseline.get('endpoints', {}).get(endpoint)
+		if not base or not base['total'].get('count') or not stats['total'].get('count'):
+			continue
+		current_p95 = stats['total']['p95_ms']
+		base_p95 = base['total']['p95_ms']
+		if current_p95 > base_p95 * (1 + threshold) and current_p95 - base_p95 >= min_regression_ms:
+			messages.append(f'{endpoint} p95 {current_p95:.1f} ms vs baseline {base_p95:.1f} ms (+{(current_p95 / base_p95 - 1) * 100 if base_p95 else float("inf"):.0f}%)')
+	return messages
+
+def _count(values):
+	counts = {}
+	for value in values:
+		counts[value] = counts.get(value, 0) + 1
+	return counts
+
+def _write_json(path, value):
+	with open(path, 'w') as f:
+		json.dump(value, f, indent=2)
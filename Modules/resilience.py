@@ -0,0 +1,293 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from Modules.constants import *
+from Modules.call_timing import attach
+from Modules.utility import percentile
+
+"""
+	Resilience layer of the UP42 client.
+	Every call is sent with a connect/read timeout (ENDPOINT_TIMEOUTS). Idempotent calls (IDEMPOTENT_ENDPOINTS) are also
+	retried with bounded exponential backoff on transport errors and 5xx answers, and most of them are hedged: when a call
+	is still running after the latency percentile learned from the recent calls of its endpoint, a duplicate request is sent
+	and the first answer wins. A circuit breaker fails calls fast once the API keeps failing, then lets a trial call through.
+	The counters show how often retries and hedges fired, retries and hedges are also counted on the CallRecords (see perf_report).
+"""
+
+class CircuitOpenError(ConnectionError):
+	"""
+	Raised instead of calling the API while the circuit breaker is open
+	"""
+
+class CircuitBreaker:
+	"""
+	Opens after failure_threshold consecutive failures (transport errors or 5xx answers). While open, calls are rejected
+	until reset_timeout has passed, then one trial call is let through: its success closes the circuit, its failure opens it again.
+		Parameters:
+			failure_threshold (int): Consecutive failures opening the circuit
+			reset_timeout (float): Seconds the circuit stays open before a trial call
+			clock (callable): Monotonic clock
+	"""
+	CLOSED = 'closed'
+	OPEN = 'open'
+	HALF_OPEN = 'half-open'
+
+	def __init__(self, failure_threshold=DEFAULT_BREAKER_FAILURE_THRESHOLD, reset_timeout=DEFAULT_BREAKER_RESET_SECONDS, clock=time.monotonic):
+		self.failure_threshold = failure_threshold
+		self.reset_timeout = reset_timeout
+		self.clock = clock
+		self.state = self.CLOSED
+		self.failures = 0
+		self.opened_at = None
+		self.trial_in_flight = False
+		self.lock = threading.Lock()
+
+	def allow(self):
+		"""
+		Returns whether a call may be sent now
+		"""
+		with self.lock:
+			if self.state == self.OPEN:
+				if self.clock() - self.opened_at < self.reset_timeout:
+					return False
+				self.state = self.HALF_OPEN
+				self.trial_in_flight = False
+			if self.state == self.HALF_OPEN:
+				if self.trial_in_flight:
+					return False
+				self.trial_in_flight = True
+			return True
+
+	def record_success(self):
+		with self.lock:
+			self.state = self.CLOSED
+			self.failures = 0
+			self.trial_in_flight = False
+
+	def record_failure(self):
+		with self.lock:
+			self.failures += 1
+			if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+				self.state = self.OPEN
+				self.opened_at = self.clock()
+				self.trial_in_flight = False
+
+	def release_trial(self):
+		"""
+		Ends a trial call that got neither an answer nor a transport error (e.g. a bug or an interrupt), so the next call is tried
+		"""
+		with self.lock:
+			self.trial_in_flight = False
+
+class LatencyTracker:
+	"""
+	Keeps the latencies of the last `window` successful calls of every endpoint
+		Parameters:
+			window (int): Number of recent calls kept per endpoint
+	"""
+	def __init__(self, window=DEFAULT_HEDGE_WINDOW):
+		self.window = window
+		self.samples = {}
+		self.lock = threading.Lock()
+
+	def observe(self, endpoint, seconds):
+		with self.lock:
+			samples = self.samples.get(endpoint)
+			if samples is None:
+				samples = self.samples[endpoint] = deque(maxlen=self.window)
+			samples.append(seconds)
+
+	def percentile(self, endpoint, pct, min_samples=1):
+		"""
+		Returns the pct percentile of the recent latencies of an endpoint, or None with fewer than min_samples of them
+		"""
+		with self.lock:
+			samples = list(self.samples.get(endpoint, ()))
+		if len(samples) < max(min_samples, 1):
+			return None
+		return percentile(sorted(samples), pct)
+
+class Resilience:
+	"""
+	Timeouts, retries, hedging and circuit breaker for the calls of one client
+		Parameters:
+			timeouts (dict): (connect, read) timeouts in seconds by endpoint name, merged over ENDPOINT_TIMEOUTS
+			default_timeout (tuple): (connect, read) timeouts of the other endpoints
+			idempotent (iterable): Endpoints that are retried
+			deletes (iterable): Retried deletes, a 404 on a retry means an earlier attempt already deleted and is answered as a 204
+			hedged (iterable): Endpoints that are hedged, hedging is off when empty
+			max_attempts (int): Attempts of an idempotent call, including the first one
+			backoff (float): Delay before the first retry in seconds, doubled for every retry
+			max_backoff (float): Upper bound of the delay between two attempts
+			hedge_percentile (float): Percentile of the recent latencies after which a duplicate request is sent
+			hedge_min_samples (int): Number of recent calls needed before an endpoint is hedged
+			hedge_min_delay (float): Lower bound of the hedge delay, so fast endpoints do not double their traffic
+			breaker (CircuitBreaker): Circuit breaker, shared by all endpoints since they go to the same API
+			sleep (callable): Sleep function, replaced in tests
+			clock (callable): Monotonic clock used to measure latencies
+	"""
+	def __init__(self, timeouts=None, default_timeout=(DEFAULT_CONNECT_TIMEOUT_SECONDS, DEFAULT_READ_TIMEOUT_SECONDS),
+			idempotent=IDEMPOTENT_ENDPOINTS, deletes=DELETE_ENDPOINTS, hedged=HEDGED_ENDPOINTS, max_attempts=DEFAULT_RETRY_ATTEMPTS,
+			backoff=DEFAULT_RETRY_BACKOFF_SECONDS, max_backoff=DEFAULT_RETRY_BACKOFF_MAX_SECONDS,
+			hedge_percentile=DEFAULT_HEDGE_PERCENTILE, hedge_min_samples=DEFAULT_HEDGE_MIN_SAMPLES,
+			hedge_min_delay=DEFAULT_HEDGE_MIN_DELAY_SECONDS, breaker=None, sleep=time.sleep, clock=time.perf_counter):
+		self.timeouts = dict(ENDPOINT_TIMEOUTS, **(timeouts or {}))
+		self.default_timeout = default_timeout
+		self.idempotent = frozenset(idempotent)
+		self.deletes = frozenset(deletes) & self.idempotent
+		self.hedged = frozenset(hedged) & self.idempotent
+		self.max_attempts = max(1, max_attempts)
+		self.backoff = backoff
+		self.max_backoff = max_backoff
+		self.hedge_percentile = hedge_percentile
+		self.hedge_min_samples = hedge_min_samples
+		self.hedge_min_delay = hedge_min_delay
+		self.breaker = breaker if breaker is not None else CircuitBreaker()
+		self.sleep = sleep
+		self.clock = clock
+		self.latency = LatencyTracker()
+		self.executor = None
+		self.lock = threading.Lock()
+		self._counters = {}
+
+	def timeout(self, endpoint):
+		"""
+		Returns the (connect, read) timeout of an endpoint, as passed to requests
+		"""
+		return self.timeouts.get(endpoint, self.default_timeout)
+
+	def hedge_delay(self, endpoint):
+		"""
+		Returns how long a call of the endpoint runs before it is hedged, or None when it is not hedged (yet)
+		"""
+		if endpoint not in self.hedged:
+			return None
+		delay = self.latency.percentile(endpoint, self.hedge_percentile, self.hedge_min_samples)
+		return None if delay is None else max(delay, self.hedge_min_delay)
+
+	def backoff_delay(self, attempt):
+		"""
+		Returns the delay after a failed attempt (1 for the first one): exponential, bounded by max_backoff, with full jitter
+		"""
+		return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+	def counters(self):
+		"""
+		Returns a copy of the counters by endpoint: calls, retries, hedges, hedge_wins (the duplicate answered first)
+		and rejected (failed fast by the open circuit)
+		"""
+		with self.lock:
+			return {endpoint: dict(counts) for endpoint, counts in self._counters.items()}
+
+	def _count(self, endpoint, name):
+		with self.lock:
+			counts = self._counters.get(endpoint)
+			if counts is None:
+				counts = self._counters[endpoint] = {'calls': 0, 'retries': 0, 'hedges': 0, 'hedge_wins': 0, 'rejected': 0}
+			counts[name] += 1
+
+	def call(self, endpoint, send, record=None):
+		"""
+		Sends a request under the policy of its endpoint
+			Parameters:
+				endpoint (string): Endpoint name, e.g. check_job_status
+				send (callable): send(timeout) sending the request once and returning the response
+				record (CallRecord): Record of the call in progress, its retries and hedges are counted there too
+
+			Returns:
+				The response object, possibly a 5xx one once the attempts are exhausted.
+				Raises CircuitOpenError while the circuit is open, or the transport error of the last attempt.
+		"""
+		timeout = self.timeout(endpoint)
+		attempts = self.max_attempts if endpoint in self.idempotent else 1
+		self._count(endpoint, 'calls')
+		for attempt in range(1, attempts + 1):
+			if not self.breaker.allow():
+				self._count(endpoint, 'rejected')
+				raise CircuitOpenError(f'{endpoint}: circuit open after {self.breaker.failures} consecutive failures of the UP42 API')
+			start = self.clock()
+			try:
+				response = self._send_hedged(endpoint, send, timeout, record)
+			except OSError:
+				#requests' exceptions, including timeouts, are OSErrors
+				self.breaker.record_failure()
+				if attempt == attempts:
+					raise
+			except BaseException:
+				#Not a failure of the API, but a half-open circuit must not wait forever for this trial's outcome
+				self.breaker.release_trial()
+				raise
+			else:
+				if response.status_code == 404 and attempt > 1 and endpoint in self.deletes:
+					#The server deleted on an earlier attempt whose answer was lost, the delete did succeed
+					response.status_code = 204
+					response.reason = 'No Content'
+				if response.status_code not in RETRY_STATUSES:
+					self.breaker.record_success()
+					self.latency.observe(endpoint, self.clock() - start)
+					return response
+				self.breaker.record_failure()
+				if attempt == attempts:
+					return response
+				response.close()
+			self._count(endpoint, 'retries')
+			if record is not None:
+				record.retries += 1
+			self.sleep(self.backoff_delay(attempt))
+
+	def _send_hedged(self, endpoint, send, timeout, record):
+		delay = self.hedge_delay(endpoint)
+		if delay is None or self.breaker.state != CircuitBreaker.CLOSED:
+			return send(timeout)
+
+		first = self._submit(send, timeout, record)
+		if wait([first], timeout=delay).done:
+			return first.result()
+		self._count(endpoint, 'hedges')
+		if record is not None:
+			record.hedges += 1
+		hedge = self._submit(send, timeout, record)
+
+		#The first answer wins, a failed attempt only loses if the other one answers
+		pending = {first, hedge}
+		winner = None
+		error = None
+		while pending and winner is None:
+			done, pending = wait(pending, return_when=FIRST_COMPLETED)
+			for future in done:
+				if future.exception() is not None:
+					error = future.exception()
+				elif winner is None:
+					winner = future
+				else:
+					future.result().close()
+		for future in pending:
+			future.add_done_callback(_close_response)
+		if winner is None:
+			raise error
+		if winner is hedge:
+			self._count(endpoint, 'hedge_wins')
+		return winner.result()
+
+	def _submit(self, send, timeout, record):
+		with self.lock:
+			if self.executor is None:
+				self.executor = ThreadPoolExecutor(max_workers=DEFAULT_HEDGE_WORKERS, thread_name_prefix='up42-hedge')
+
+		def run():
+			#Connection timings of the helper thread go to the call's record
+			with attach(record):
+				return send(timeout)
+		return self.executor.submit(run)
+
+	def close(self):
+		if self.executor is not None:
+			self.executor.shutdown(wait=False)
+
+def _close_response(future):
+	#The losing attempt of a hedged call, give its connection back to the pool
+	if future.exception() is None:
+		future.result().close()
@@ -0,0 +1,105 @@
+import argparse
+import json
+import sys
+import timeit
+
+from Modules.api_objects import Job
+from Modules import json_codec
+
+"""
+	Micro-benchmark of response parsing: the res.json()['data'][...] path against the response models (see api_objects)
+	with every installed json codec (see json_codec), on a Check Job Status body and a Get Jobs body.
+	Run with `python -m Modules.response_benchmark`.
+"""
+
+_JOB = {
+	'id': '0d4a5c4e-93ba-4d63-9a8d-4b1b5a2cc1d2',
+	'name': 'apitest-job',
+	'workflowId': '7a8c1f2e-3d4b-4c5a-9e6f-1a2b3c4d5e6f',
+	'status': 'RUNNING',
+	'inputs': {
+		'nasa-modis:1': {'time': '2018-12-01T00:00:00+00:00/2020-12-31T23:59:59+00:00', 'limit': 1, 'zoom_level': 9,
+			'imagery_layers': ['MODIS_Terra_CorrectedReflectance_TrueColor'],
+			'bbox': [13.365373, 52.49582, 13.385796, 52.510455]},
+		'sharpening:1': {'strength': 'medium'},
+	},
+}
+
+class _PlainResponse:
+	#Stand-in for requests.Response when requests is not installed, decoding like it does
+	def __init__(self, content):
+		self.status_code = 200
+		self.content = content
+
+	def json(self):
+		return json.loads(self.content.decode('utf-8'))
+
+def _response_factory():
+	try:
+		import requests
+	except ImportError:
+		return _PlainResponse
+
+	def make(content):
+		response = requests.Response()
+		response.status_code = 200
+		response._content = content
+		response.encoding = 'utf-8'
+		response.headers['Content-Type'] = 'application/json'
+		return response
+	return make
+
+def run_benchmark(number=20000, jobs=50):
+	"""
+	Times reading the fields of a response, a fresh response per call so every call pays for the parsing
+		Parameters:
+			number (int): Calls per case
+			jobs (int): Number of jobs in the Get Jobs body
+
+		Returns:
+			Dict of case name to microseconds per call
+	"""
+	make = _response_factory()
+	status_body = json.dumps({'data': _JOB, 'error': None}).encode()
+	list_body = json.dumps({'data': [dict(_JOB, id=str(i)) for i in range(jobs)], 'error': None}).encode()
+
+	def status_json():
+		return make(status_body).json()['data']['status']
+
+	def list_json():
+		return [(job['id'], job['status']) for job in make(list_body).json()['data']]
+
+	cases = {'check_job_status res.json()': status_json, f'get_jobs ({jobs}) res.json()': list_json}
+	for name, codec in json_codec.available_codecs().items():
+		def status_model(codec=codec):
+			return Job.from_response(make(status_body)).status
+
+		def list_model(codec=codec):
+			return [(job.id, job.status) for job in Job.list_from_response(make(list_body))]
+
+		cases[f'check_job_status Job model ({name})'] = (status_model, codec)
+		cases[f'get_jobs ({jobs}) Job model ({name})'] = (list_model, codec)
+
+	results = {}
+	for name, case in cases.items():
+		fn, codec = case if isinstance(case, tuple) else (case, None)
+		previous = json_codec.set_codec(codec) if codec is not None else None
+		try:
+			results[name] = min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6
+		finally:
+			if previous is not None:
+				json_codec.set_codec(previous)
+	return results
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Compare res.json() with the response models and json codecs')
+	parser.add_argument('--number', type=int, default=20000, help='Calls per case')
+	parser.add_argument('--jobs', type=int, default=50, help='Number of jobs in the Get Jobs body')
+	args = parser.parse_args(argv)
+
+	for name, micros in run_benchmark(args.number, args.jobs).items():
+		print(f'{name:<44}{micros:>10.2f} us')
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,249 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+
+from Modules.constants import *
+
+try:
+	import fcntl
+except ImportError:
+	fcntl = None
+	import msvcrt
+
+class TokenError(Exception):
+	"""
+	Raised when an Access Token cannot be retrieved, e.g. the token endpoint returns a non 200 status
+	"""
+	def __init__(self, message, status_code=None):
+		super().__init__(message)
+		self.status_code = status_code
+
+class TokenCache:
+	"""
+	Thread-safe Access Token cache keyed by (project_id, project_api_key).
+	Tokens are refreshed shortly before they expire, and concurrent callers for the same key share a single fetch.
+	When disk_path is set, tokens are also shared with other processes (e.g. pytest-xdist workers) through a file-locked json file.
+		Parameters:
+			disk_path (string): Optional path of the json file used as the cross-process tier
+			refresh_margin (int): Seconds before expiry at which a token is considered stale
+			default_ttl (int): Lifetime (in seconds) assumed for tokens whose expiry cannot be read
+	"""
+	def __init__(self, disk_path=None, refresh_margin=TOKEN_REFRESH_MARGIN_SECONDS, default_ttl=DEFAULT_TOKEN_TTL_SECONDS):
+		self.disk_path = disk_path
+		self.refresh_margin = refresh_margin
+		self.default_ttl = default_ttl
+		self._entries = {}
+		self._owners = {}
+		self._key_locks = {}
+		self._lock = threading.Lock()
+
+	def get(self, project_id, project_api_key, fetch, stale_token=None):
+		"""
+		Returns a valid Access Token for the credentials, fetching a new one only when needed
+			Parameters:
+				project_id (string): Id associated to the project
+				project_api_key (string): Api key associated to the project
+				fetch (callable): fetch(project_id, project_api_key) returning (token, expires_at) or raising TokenError
+				stale_token (string): A token the caller knows is rejected (e.g. after a 401). Forces a refresh if it is still the cached one
+
+			Returns:
+				The Access Token as a string
+		"""
+		key = (project_id, project_api_key)
+		entry = self._entries.get(key)
+		if self._is_usable(entry, stale_token):
+			return entry[0]
+
+		with self._key_lock(key):
+			#Another thread may have refreshed the token while we waited for the lock
+			entry = self._entries.get(key)
+			if self._is_usable(entry, stale_token):
+				return entry[0]
+
+			if self.disk_path:
+				entry = self._get_from_disk(key, fetch, stale_token)
+			else:
+				entry = fetch(project_id, project_api_key)
+			self._store(key, entry)
+			return entry[0]
+
+	def lookup(self, project_id, project_api_key, stale_token=None):
+		"""
+		Returns the cached token for the credentials without fetching, or None if there is no usable one.
+		Used by callers (e.g. the asyncio helpers) that fetch tokens themselves and hand them back with put().
+		"""
+		key = (project_id, project_api_key)
+		entry = self._entries.get(key)
+		if self._is_usable(entry, stale_token):
+			return entry[0]
+		if self.disk_path:
+			with _FileLock(self.disk_path + '.lock'):
+				stored = _read_json(self.disk_path).get(_digest(key))
+			if stored is not None:
+				entry = (stored['token'], stored['expires_at'])
+				if self._is_usable(entry, stale_token):
+					self._store(key, entry)
+					return entry[0]
+		return None
+
+	def put(self, project_id, project_api_key, token, expires_at):
+		"""
+		Stores a token fetched by the caller, in memory and in the disk tier if enabled
+		"""
+		key = (project_id, project_api_key)
+		entry = (token, expires_at)
+		if self.disk_path:
+			with _FileLock(self.disk_path + '.lock'):
+				entries = _read_json(self.disk_path)
+				entries[_digest(key)] = {'token': token, 'expires_at': expires_at}
+				_write_json(self.disk_path, entries)
+		self._store(key, entry)
+
+	def invalidate(self, project_id, project_api_key):
+		"""
+		Drops the in-memory token of the credentials so the next get() refreshes it
+		"""
+		with self._lock:
+			entry = self._entries.pop((project_id, project_api_key), None)
+			if entry is not None:
+				self._owners.pop(entry[0], None)
+
+	def credentials_for(self, token):
+		"""
+		Returns the (project_id, project_api_key) a cached token was issued for, or None if the token is unknown
+		"""
+		return self._owners.get(token)
+
+	def clear(self):
+		"""
+		Drops every in-memory token. The disk tier is left untouched.
+		"""
+		with self._lock:
+			self._entries.clear()
+			self._owners.clear()
+
+	def _is_usable(self, entry, stale_token):
+		if entry is None or entry[0] == stale_token:
+			return False
+		return entry[1] - self.refresh_margin > time.time()
+
+	def _key_lock(self, key):
+		with self._lock:
+			lock = self._key_locks.get(key)
+			if lock is None:
+				lock = self._key_locks[key] = threading.Lock()
+			return lock
+
+	def _store(self, key, entry):
+		with self._lock:
+			previous = self._entries.get(key)
+			if previous is not None:
+				self._owners.pop(previous[0], None)
+			self._entries[key] = entry
+			self._owners[entry[0]] = key
+
+	def _get_from_disk(self, key, fetch, stale_token):
+		digest = _digest(key)
+		with _FileLock(self.disk_path + '.lock'):
+			entries = _read_json(self.disk_path)
+			stored = entries.get(digest)
+			if stored is not None:
+				entry = (stored['token'], stored['expires_at'])
+				if self._is_usable(entry, stale_token):
+					return entry
+
+			entry = fetch(key[0], key[1])
+			entries[digest] = {'token': entry[0], 'expires_at': entry[1]}
+			#Drop expired tokens of other credentials while we hold the lock
+			now = time.time()
+			entries = {k: v for k, v in entries.items() if v['expires_at'] > now}
+			_write_json(self.disk_path, entries)
+			return entry
+
+def token_expiry(token, expires_in=None, default_ttl=DEFAULT_TOKEN_TTL_SECONDS):
+	"""
+	Works out when a token expires, from the JWT exp claim, an expires_in value, or the default lifetime
+		Parameters:
+			token (string): The Access Token
+			expires_in (int): Optional lifetime in seconds reported by the token endpoint
+			default_ttl (int): Lifetime assumed when neither of the above is available
+
+		Returns:
+			The expiry as a unix timestamp (float)
+	"""
+	parts = token.split('.')
+	if len(parts) == 3:
+		try:
+			payload = parts[1] + '=' * (-len(parts[1]) % 4)
+			claims = json.loads(base64.urlsafe_b64decode(payload))
+			return float(claims['exp'])
+		except (ValueError, KeyError, TypeError):
+			pass
+	if expires_in is not None:
+		return time.time() + float(expires_in)
+	return time.time() + default_ttl
+
+class _FileLock:
+	"""
+	Exclusive, blocking inter-process lock on a lock file
+	"""
+	def __init__(self, path):
+		self.path = path
+		self.fd = None
+
+	def __enter__(self):
+		self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+		if fcntl is not None:
+			fcntl.flock(self.fd, fcntl.LOCK_EX)
+		else:
+			msvcrt.locking(self.fd, msvcrt.LK_LOCK, 1)
+		return self
+
+	def __exit__(self, *exc_info):
+		if fcntl is not None:
+			fcntl.flock(self.fd, fcntl.LOCK_UN)
+		else:
+			os.lseek(self.fd, 0, os.SEEK_SET)
+			msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+		os.close(self.fd)
+		self.fd = None
+
+def _digest(key):
+	#Credentials are never written to disk, only a digest of them
+	return hashlib.sha256(f'{key[0]}:{key[1]}'.encode()).hexdigest()
+
+def _read_json(path):
+	try:
+		with open(path) as f:
+			return json.load(f)
+	except (FileNotFoundError, ValueError):
+		return {}
+
+def _write_json(path, entries):
+	#Write to a temporary file first so readers never see a half-written cache
+	tmp_path = f'{path}.{os.getpid()}.tmp'
+	fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+	with os.fdopen(fd, 'w') as f:
+		json.dump(entries, f)
+	os.replace(tmp_path, path)
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_default_token_cache():
+	"""
+	Returns the process-wide token cache, creating it on first use.
+	The disk tier is enabled when the UP42_TOKEN_CACHE_FILE environment variable is set.
+
+		Returns:
+			The shared TokenCache
+	"""
+	global _default_cache
+	if _default_cache is None:
+		with _default_cache_lock:
+			if _default_cache is None:
+				_default_cache = TokenCache(disk_path=os.environ.get(TOKEN_CACHE_FILE_ENV) or None)
+	return _default_cache
@@ -0,0 +1,373 @@
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from Modules.constants import *
+from Modules.call_timing import current_call, track
+from Modules.resilience import Resilience
+from Modules.api_objects import ResponseShapeError, Token
+from Modules.token_cache import TokenError, get_default_token_cache, token_expiry
+
+class UP42Client:
+	"""
+	Owns a pooled, keep-alive requests.Session to the UP42 API and exposes every endpoint used by the tests.
+	Connections are reused between calls, so only the first request to the host pays for the TCP/TLS handshake.
+		Parameters:
+			base_url (string): Scheme and host of the API, e.g. https://api.up42.com
+			pool_connections (int): Number of distinct host pools to cache
+			pool_maxsize (int): Maximum number of connections kept alive per host
+			keep_alive (bool): Whether to keep connections open between calls (also enables TCP keep-alive probes)
+			pool_block (bool): Whether to block when all pooled connections are busy instead of opening extra ones
+			token_cache (TokenCache): Cache used by get_token and for the 401 retry, defaults to the process-wide cache
+			resilience (Resilience): Timeouts, retries, hedging and circuit breaker of the calls, see resilience
+	"""
+	def __init__(self, base_url=BASE_URL, pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE,
+			keep_alive=DEFAULT_KEEP_ALIVE, pool_block=False, token_cache=None, resilience=None):
+		self.base_url = base_url.rstrip('/')
+		self.token_cache = token_cache if token_cache is not None else get_default_token_cache()
+		self.resilience = resilience if resilience is not None else Resilience()
+		self.keep_alive = keep_alive
+		self.session = requests.Session()
+
+		socket_options = list(HTTPConnection.default_socket_options)
+		if keep_alive:
+			socket_options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+		adapter = _PooledAdapter(socket_options, pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+		self.session.mount('https://', adapter)
+		self.session.mount('http://', adapter)
+		self.session.headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+
+	def url(self, path_template, *args):
+		"""
+		Builds an absolute endpoint url from one of the *_PATH templates in constants
+			Parameters:
+				path_template (string): Path template with %s placeholders
+				args (string): Values substituted into the template
+
+			Returns:
+				The absolute url as a string
+		"""
+		return self.base_url + (path_template % args)
+
+	def close(self):
+		"""
+		Closes every pooled connection held by the client
+		"""
+		self.resilience.close()
+		self.session.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def get_access_token(self, project_id, project_api_key):
+		"""
+		Calls the token endpoint with the project credentials, bypassing the token cache
+			Parameters:
+				project_id (string): the project id associated to the project on UP42 console developer
+				project_api_key (string): the api key associated to the project
+
+			Returns:
+				The response object
+		"""
+		url = self.url(GET_ACCESSTOKEN_PATH)
+		with track('get_access_token', 'POST') as record:
+			response = self.resilience.call('get_access_token', lambda timeout: self.session.post(url, headers=_FORM_HEADERS,
+				data='grant_type=client_credentials', auth=(project_id, project_api_key), timeout=timeout), record)
+			record.observe_response(response)
+		return response
+
+	def get_token(self, project_id, project_api_key, stale_token=None):
+		"""
+		Returns a cached Access Token for the credentials, refreshing it shortly before it expires
+			Parameters:
+				project_id (string): the project id associated to the project on UP42 console developer
+				project_api_key (string): the api key associated to the project
+				stale_token (string): A token known to be rejected, forces a refresh if it is still the cached one
+
+			Returns:
+				The Access Token as a string. Raises TokenError if no token could be retrieved.
+		"""
+		return self.token_cache.get(project_id, project_api_key, self._fetch_token, stale_token)
+
+	def _fetch_token(self, project_id, project_api_key):
+		response = self.get_access_token(project_id, project_api_key)
+		if response.status_code != 200:
+			raise TokenError(f'Get Access Token: Failure with status {response.status_code}', response.status_code)
+		try:
+			model = Token.from_response(response)
+			token = model.access_token
+		except ResponseShapeError as e:
+			raise TokenError(f'Get Access Token: Unexpected response body - {e}', response.status_code)
+		if not token:
+			raise TokenError('Get Access Token: Empty token returned', response.status_code)
+		return token, token_expiry(token, model.expires_in, self.token_cache.default_ttl)
+
+	def _send(self, endpoint, method, url, token, is_json=False, **kwargs):
+		"""
+		Sends an authorized request, timed under the given endpoint name (see call_timing), under the endpoint's
+		timeouts, retries and hedging (see resilience).
+		On a 401 for a token issued by the token cache, the token is refreshed once and the request is retried with the new token.
+		"""
+		def send(token):
+			return self.resilience.call(endpoint, lambda timeout: self.session.request(method, url, headers=auth_headers(token, is_json),
+				timeout=timeout, **kwargs), record)
+
+		with track(endpoint, method) as record:
+			response = send(token)
+			if response.status_code == 401:
+				credentials = self.token_cache.credentials_for(token)
+				if credentials is not None:
+					new_token = self.get_token(credentials[0], credentials[1], stale_token=token)
+					record.retries += 1
+					response = send(new_token)
+			record.observe_response(response)
+		return response
+
+	def create_workflow(self, token, project_id, name, description):
+		"""
+		Calls the Create Workflow endpoint, see api_helper.create_workflow
+
+			Returns:
+				The response object
+		"""
+		url = self.url(CREATE_WORKFLOW_PATH, project_id)
+		body = {"name": f"{name}", "description": f"{description}"}
+		return self._send('create_workflow', 'POST', url, token, True, json=body)
+
+	def get_workflows(self, token, project_id):
+		"""
+		Calls the Get Workflows endpoint, see api_helper.get_workflows
+
+			Returns:
+				The response object
+		"""
+		url = self.url(GET_WORKFLOWS_PATH, project_id)
+		return self._send('get_workflows', 'GET', url, token)
+
+	def get_specific_workflow(self, token, project_id, workflow_id):
+		"""
+		Calls the Get Specific Workflow endpoint, see api_helper.get_specific_workflow
+
+			Returns:
+				The response object
+		"""
+		url = self.url(GET_SPECIFIC_WORKFLOW_PATH, project_id, workflow_id)
+		return self._send('get_specific_workflow', 'GET', url, token)
+
+	def check_job_status(self, token, project_id, job_id):
+		"""
+		Calls the Check Job Status endpoint, see api_helper.check_job_status
+
+			Returns:
+				The response object
+		"""
+		url = self.url(CHECK_JOB_STATUS_PATH, project_id, job_id)
+		return self._send('check_job_status', 'GET', url, token)
+
+	def add_tasks_to_workflow(self, token, project_id, workflow_id, request_body):
+		"""
+		Calls the Add Tasks to Workflow endpoint, see api_helper.add_tasks_to_workflow
+
+			Returns:
+				The response object
+		"""
+		url = self.url(ADD_TASK_TO_WORKFLOW_PATH, project_id, workflow_id)
+		return self._send('add_tasks_to_workflow', 'POST', url, token, True, data=request_body)
+
+	def create_and_run_job_for_workflow(self, token, project_id, workflow_id, request_body, name=None):
+		"""
+		Calls the Create and Run Job endpoint, see api_helper.create_and_run_job_for_workflow
+
+			Returns:
+				The response object
+		"""
+		url = self.url(CREATE_RUN_JOB_FOR_WORKFLOW_PATH, project_id, workflow_id)
+		params = {'name': name} if name else None
+		return self._send('create_and_run_job_for_workflow', 'POST', url, token, True, json=request_body, params=params)
+
+	def get_jobs(self, token, project_id):
+		"""
+		Calls the Get Jobs endpoint, see api_helper.get_jobs
+
+			Returns:
+				The response object
+		"""
+		url = self.url(GET_JOBS_PATH, project_id)
+		return self._send('get_jobs', 'GET', url, token)
+
+	def delete_workflow(self, token, project_id, workflow_id):
+		"""
+		Calls the Delete Workflow endpoint, see api_helper.delete_workflow
+
+			Returns:
+				The response object
+		"""
+		url = self.url(DELETE_WORKFLOW_PATH, project_id, workflow_id)
+		return self._send('delete_workflow', 'DELETE', url, token)
+
+	def get_job_tasks(self, token, project_id, job_id):
+		"""
+		Calls the Get Job Tasks endpoint, see api_helper.get_job_tasks
+
+			Returns:
+				The response object
+		"""
+		url = self.url(GET_JOB_TASKS_PATH, project_id, job_id)
+		return self._send('get_job_tasks', 'GET', url, token)
+
+	def get_task_download_url(self, token, project_id, job_id, task_id):
+		"""
+		Calls the Get Task Download Url endpoint, see api_helper.get_task_download_url
+
+			Returns:
+				The response object
+		"""
+		url = self.url(GET_TASK_DOWNLOAD_URL_PATH, project_id, job_id, task_id)
+		return self._send('get_task_download_url', 'GET', url, token)
+
+	def stream_download(self, url, start=0):
+		"""
+		Opens a streamed GET of a signed download url. The url carries its own credentials, so no token is sent.
+		The body is not read: iterate over response.iter_content and close the response when done.
+		The call is not timed here, so that the caller can time the whole transfer (see job_outputs).
+		It is not retried either, job_outputs resumes interrupted transfers itself.
+			Parameters:
+				url (string): Signed url returned by Get Task Download Url
+				start (int): Byte offset to resume from, sent as a Range header when not 0
+
+			Returns:
+				The response object, 206 when the range was honoured
+		"""
+		headers = {'Range': f'bytes={start}-'} if start else None
+		return self.session.get(url, headers=headers, stream=True, timeout=self.resilience.timeout('download_results'))
+
+class _PooledAdapter(HTTPAdapter):
+	"""
+	HTTPAdapter that passes custom socket options (e.g. SO_KEEPALIVE) down to the urllib3 pool manager,
+	and opens connections through the timed connection classes below
+	"""
+	def __init__(self, socket_options, **kwargs):
+		self.socket_options = socket_options
+		super().__init__(**kwargs)
+
+	def init_poolmanager(self, *args, **kwargs):
+		kwargs['socket_options'] = self.socket_options
+		super().init_poolmanager(*args, **kwargs)
+		self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPConnectionPool, 'https': _TimedHTTPSConnectionPool}
+
+class _TimedConnectionMixin:
+	"""
+	Records the DNS, TCP connect and TLS handshake time of new connections on the CallRecord of the current call
+	"""
+	def _new_conn(self):
+		record = current_call()
+		if record is None:
+			return super()._new_conn()
+
+		host = self._dns_host
+		start = time.perf_counter()
+		try:
+			address = socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)[0][4][0]
+		except OSError:
+			address = None
+		resolved = time.perf_counter()
+		record.dns += resolved - start
+
+		try:
+			if address is None:
+				#Fall back to the regular lookup, which raises the resolution error
+				return super()._new_conn()
+			#Connect to the address we just resolved, so the DNS lookup is not done twice
+			self._dns_host = address
+			try:
+				return super()._new_conn()
+			finally:
+				self._dns_host = host
+		finally:
+			record.connect += time.perf_counter() - resolved
+
+	def connect(self):
+		record = current_call()
+		start = time.perf_counter()
+		before = (record.dns + record.connect) if record is not None else 0
+		super().connect()
+		if record is not None and isinstance(self, HTTPSConnection):
+			#Whatever connect() spent beyond DNS and TCP connect is the TLS handshake
+			record.tls += max(0.0, (time.perf_counter() - start) - (record.dns + record.connect - before))
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+	pass
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+	pass
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+	ConnectionCls = _TimedHTTPConnection
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+	ConnectionCls = _TimedHTTPSConnection
+
+_FORM_HEADERS = {'Content-Type' : 'application/x-www-form-urlencoded'}
+_header_cache = {}
+
+def auth_headers(token, is_json=False):
+	"""
+	Returns the (cached) request headers for a token. The returned dict is shared and must not be modified.
+		Parameters:
+			token (string): Access Token associated to the project
+			is_json (bool): Whether to include the json Content-Type header
+
+		Returns:
+			The headers as a dict
+	"""
+	key = (token, is_json)
+	headers = _header_cache.get(key)
+	if headers is None:
+		#Tokens rotate, so keep the cache from growing without bound
+		if len(_header_cache) > 64:
+			_header_cache.clear()
+		headers = {'Authorization': f'Bearer {token}'}
+		if is_json:
+			headers['Content-Type'] = 'application/json'
+		_header_cache[key] = headers
+	return headers
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def get_default_client():
+	"""
+	Returns the process-wide client used by the api_helper functions, creating it on first use
+
+		Returns:
+			The shared UP42Client
+	"""
+	global _default_client
+	if _default_client is None:
+		with _default_client_lock:
+			if _default_client is None:
+				_default_client = UP42Client()
+	return _default_client
+
+def set_default_client(client):
+	"""
+	Replaces the process-wide client used by the api_helper functions
+		Parameters:
+			client (UP42Client): The new client
+
+		Returns:
+			The previous client, or None
+	"""
+	global _default_client
+	with _default_client_lock:
+		previous = _default_client
+		_default_client = client
+	return previous
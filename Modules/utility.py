@@ -1,14 +1,64 @@
-import random
-import string
-
-def generate_random_alphanumeric(length):
-	"""
-	Generates a random alphanumeric sequence of a certain length
-		Parameters:
-			length (int): Intended length of the string
-
-		Returns: 
-			A generated string of the specified length	
-	"""
-	result = ''.join(random.choice(string.ascii_uppercase + string.ascii_lowercase + string.digits) for i in range(length))
-	return result
\ No newline at end of file
+import math
+import random
+import string
+
+from Modules.constants import TEST_WORKFLOW_NAME_PREFIX
+
+def generate_random_alphanumeric(length):
+	"""
+	Generates a random alphanumeric sequence of a certain length
+		Parameters:
+			length (int): Intended length of the string
+
+		Returns: 
+			A generated string of the specified length	
+	"""
+	result = ''.join(random.choice(string.ascii_uppercase + string.ascii_lowercase + string.digits) for i in range(length))
+	return result
+
+def generate_workflow_name(length):
+	"""
+	Generates a random workflow name starting with the test prefix, so that leftover workflows can be recognized and swept
+		Parameters:
+			length (int): Intended length of the whole name, including the prefix
+
+		Returns: 
+			A generated name of the specified length
+	"""
+	return TEST_WORKFLOW_NAME_PREFIX + generate_random_alphanumeric(length - len(TEST_WORKFLOW_NAME_PREFIX))
+
+def percentile(sorted_values, pct):
+	"""
+	Returns the nearest-rank percentile of already sorted values
+		Parameters:
+			sorted_values (list): Values sorted in ascending order
+			pct (float): Percentile between 0 and 100
+
+		Returns:
+			The value at that percentile, or None if there are no values
+	"""
+	if not sorted_values:
+		return None
+	rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+	return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def summarize_latencies(values):
+	"""
+	Summarizes latencies (in seconds) into count, mean, p50, p95, p99 and max, all reported in milliseconds
+		Parameters:
+			values (list): Latencies in seconds, in any order
+
+		Returns:
+			The summary as a dict
+	"""
+	ordered = sorted(values)
+	if not ordered:
+		return {'count': 0}
+	return {
+		'count': len(ordered),
+		'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+		'p50_ms': round(percentile(ordered, 50) * 1000, 3),
+		'p95_ms': round(percentile(ordered, 95) * 1000, 3),
+		'p99_ms': round(percentile(ordered, 99) * 1000, 3),
+		'max_ms': round(ordered[-1] * 1000, 3),
+	}
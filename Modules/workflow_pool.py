@@ -0,0 +1,141 @@
+import contextlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from Modules.api_helper import *
+from Modules.utility import *
+from Modules.constants import *
+
+class WorkflowPool:
+	"""
+	Pre-provisioned set of blank workflows leased to tests, instead of a create/delete round trip per test.
+	Returned workflows are reset (their tasks cleared) and handed out again. Workflows that cannot be reset,
+	or that a test marks as broken, are evicted (deleted) and replaced on demand.
+		Parameters:
+			project_id (string): Id associated to the project
+			project_api_key (string): Api key associated to the project, used to get (cached) Access Tokens
+			size (int): Number of workflows created up front
+			max_workers (int): Number of parallel requests used to create and delete workflows
+	"""
+	def __init__(self, project_id, project_api_key, size=DEFAULT_WORKFLOW_POOL_SIZE, max_workers=DEFAULT_WORKFLOW_POOL_WORKERS):
+		self.project_id = project_id
+		self.project_api_key = project_api_key
+		self.size = size
+		self.max_workers = max_workers
+		self.idle = deque()
+		self.leased = set()
+		self.lock = threading.Lock()
+		self.stats = {'created': 0, 'leased': 0, 'reused': 0, 'evicted': 0}
+
+	def fill(self):
+		"""
+		Creates the workflows of the pool in parallel
+			Returns:
+				Number of workflows created. Raises RuntimeError if none could be created.
+		"""
+		with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+			results = list(executor.map(lambda i: self._create(), range(self.size)))
+		created = [workflow_id for workflow_id in results if workflow_id]
+		if self.size and not created:
+			raise RuntimeError('Workflow Pool: Failed to create any workflow')
+		with self.lock:
+			self.idle.extend(created)
+		return len(created)
+
+	def acquire(self):
+		"""
+		Leases a blank workflow, creating a new one if the pool is empty
+			Returns:
+				The workflow id. Raises RuntimeError if a new workflow was needed and could not be created.
+		"""
+		with self.lock:
+			workflow_id = self.idle.popleft() if self.idle else None
+			if workflow_id is not None:
+				self.stats['reused'] += 1
+		if workflow_id is None:
+			workflow_id = self._create()
+			if not workflow_id:
+				raise RuntimeError('Workflow Pool: Failed to create a workflow')
+		with self.lock:
+			self.leased.add(workflow_id)
+			self.stats['leased'] += 1
+		return workflow_id
+
+	def release(self, workflow_id, evict=False):
+		"""
+		Returns a leased workflow. It is reset and made available again, or deleted if it cannot be reset.
+			Parameters:
+				workflow_id (string): Id of the leased workflow
+				evict (bool): Delete the workflow instead of reusing it, e.g. when the test deleted or broke it
+		"""
+		with self.lock:
+			self.leased.discard(workflow_id)
+		if not evict:
+			try:
+				token = get_access_token(self.project_id, self.project_api_key)
+				res = add_tasks_to_workflow(token, self.project_id, workflow_id, '[]')
+				evict = res.status_code != 200
+			except Exception:
+				evict = True
+		if evict:
+			self.evict(workflow_id)
+		else:
+			with self.lock:
+				self.idle.append(workflow_id)
+
+	def evict(self, workflow_id):
+		"""
+		Drops a workflow from the pool and deletes it
+		"""
+		with self.lock:
+			self.leased.discard(workflow_id)
+			if workflow_id in self.idle:
+				self.idle.remove(workflow_id)
+			self.stats['evicted'] += 1
+		self._delete(workflow_id)
+
+	@contextlib.contextmanager
+	def lease(self):
+		"""
+		Context manager leasing a workflow for the duration of the block
+			Returns:
+				Context manager yielding the workflow id
+		"""
+		workflow_id = self.acquire()
+		try:
+			yield workflow_id
+		finally:
+			self.release(workflow_id)
+
+	def close(self):
+		"""
+		Deletes every workflow still held by the pool, in parallel
+		"""
+		with self.lock:
+			remaining = list(self.idle) + list(self.leased)
+			self.idle.clear()
+			self.leased.clear()
+		with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+			list(executor.map(self._delete, remaining))
+
+	def _create(self):
+		#Returns the new workflow id, or '' if it could not be created
+		try:
+			token = get_access_token(self.project_id, self.project_api_key)
+			res = create_workflow(token, self.project_id, generate_workflow_name(16), generate_random_alphanumeric(5))
+			if res.status_code != 200:
+				return ''
+			workflow_id = Workflow.from_response(res).id
+		except Exception:
+			return ''
+		with self.lock:
+			self.stats['created'] += 1
+		return workflow_id
+
+	def _delete(self, workflow_id):
+		try:
+			token = get_access_token(self.project_id, self.project_api_key)
+			delete_workflow(token, self.project_id, workflow_id)
+		except Exception:
+			pass